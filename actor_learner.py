@@ -0,0 +1,181 @@
+from agents.compiled_inference import CompiledInference
+from agents.deep_uno_agent import DeepUnoAgent
+from agents.opponent_pool import OpponentPool, PoolOpponent
+from rlcard.agents.random_agent import RandomAgent
+from typing import List, Optional
+import queue
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+import env
+
+'''
+Actor/learner training.
+
+The learner (the calling process) owns the training agents: optimizers,
+train_online_nn, statistics and model_history checkpoints. Actor
+processes own copies of the same agent classes and only play: they run
+rlcard games side by side through env.play_concurrent_games and stream
+each finished game's encoded states and payoffs to the learner, which
+feeds them to the real agents with record_episode.
+
+After an agent trains, the learner copies its online_nn weights into a
+shared-memory state dict and bumps that agent's version; actors reload
+the weights of agents whose version moved before scheduling new games.
+Epsilon is published the same way after every game.
+
+Rounds are drawn from one shared counter, so all actors together play
+exactly total_games rounds of env.round_pairs, as env.train does.
+
+An opponent pool lives in shared memory too: the learner snapshots the
+agents into it every pool.INTERVAL rounds, and the actors sample their
+self-play opponents from it and count their results in it.
+'''
+
+class SharedWeights:
+    ''' Shared-memory copy of one agent's online_nn and its epsilon '''
+    def __init__(self, agent: DeepUnoAgent, ctx):
+        self.state = {
+            name: tensor.detach().cpu().clone().share_memory_()
+            for name, tensor in agent.online_nn.state_dict().items()
+        }
+        self.version = ctx.Value('l', 0)
+        self.epsilon = ctx.Value('d', agent.epsilon)
+        self.lock = ctx.Lock()
+
+    def publish(self, agent: DeepUnoAgent):
+        with self.lock:
+            for name, tensor in agent.online_nn.state_dict().items():
+                self.state[name].copy_(tensor.detach())
+            self.version.value += 1
+
+    def load_into(self, agent: DeepUnoAgent):
+        with self.lock:
+            agent.online_nn.load_state_dict(self.state)
+
+
+def _actor_main(agent_classes: List[type], compiled: List[bool],
+                shared: List[SharedWeights], rounds, total_games: int,
+                bot_phase_games: int, num_envs: int, transitions,
+                pool: Optional[OpponentPool]):
+    # actors are many, keep each to one core
+    torch.set_num_threads(1)
+
+    agents = [agent_class() for agent_class in agent_classes]
+    for agent, use_compiled in zip(agents, compiled):
+        if use_compiled:
+            agent.use_compiled_inference()
+    agent_index = {id(agent): index for index, agent in enumerate(agents)}
+    versions = [-1] * len(agents)
+
+    bots = []
+    for _ in range(len(agents)):
+        bots.append(env.get_rule_based_agent())
+        bots.append(RandomAgent(61))
+    all_agents = agents + bots
+
+    def refresh():
+        for index, agent in enumerate(agents):
+            if shared[index].version.value != versions[index]:
+                versions[index] = shared[index].version.value
+                shared[index].load_into(agent)
+            agent.epsilon = shared[index].epsilon.value
+
+    def scheduled_pairs():
+        while True:
+            with rounds.get_lock():
+                game_idx = rounds.value
+                if game_idx >= total_games:
+                    return
+                rounds.value += 1
+            refresh()
+            if game_idx < bot_phase_games:
+                phase_agents = all_agents
+            elif pool is not None:
+                phase_agents = agents + pool.sample(len(agents))
+            else:
+                phase_agents = agents
+            yield from env.round_pairs(phase_agents)
+
+    def ship(pair, episodes, payoff):
+        game = []
+        for index, agent in enumerate(pair):
+            if isinstance(agent, DeepUnoAgent):
+                game.append((agent_index[id(agent)],
+                             np.asarray(episodes[index], dtype=np.int16),
+                             int(payoff[index])))
+            elif isinstance(agent, PoolOpponent):
+                agent.after_game(payoff=int(payoff[index]))
+        transitions.put(game)
+
+    env.play_concurrent_games(scheduled_pairs(), is_training=True,
+                              concurrency=num_envs, on_game=ship)
+    transitions.put(None)
+
+
+def train_actor_learner(total_games: int, training_agents: List[DeepUnoAgent],
+                        num_actors: int, bot_phase_games: int,
+                        num_envs: int = 64, report_rate: int = 10000,
+                        pool: Optional[OpponentPool] = None):
+    ''' Multi-process counterpart of env.train, see the module docstring. '''
+    ctx = mp.get_context('spawn')
+    shared = [SharedWeights(agent, ctx) for agent in training_agents]
+    rounds = ctx.Value('l', 0)
+    transitions = ctx.Queue(maxsize=num_actors * 256)
+    # each actor plays its share of side by side games
+    actor_envs = max(1, num_envs // num_actors)
+
+    actors = [
+        ctx.Process(
+            target=_actor_main,
+            args=([type(agent) for agent in training_agents],
+                  # actors select actions the way the learner's agents do
+                  [isinstance(agent.policy_forward, CompiledInference) for agent in training_agents],
+                  shared, rounds, total_games, bot_phase_games, actor_envs, transitions, pool),
+            daemon=True)
+        for _ in range(num_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    trained_counts = [agent.loss_count for agent in training_agents]
+    next_pool_snapshot = pool.INTERVAL if pool is not None else None
+    meter = env.ThroughputMeter()
+    finished_actors = 0
+    while finished_actors < num_actors:
+        try:
+            game = transitions.get(timeout=60)
+        except queue.Empty:
+            if not any(actor.is_alive() for actor in actors):
+                raise RuntimeError("all actors exited before finishing")
+            continue
+        if game is None:
+            finished_actors += 1
+            continue
+
+        for index, states, payoff in game:
+            agent = training_agents[index]
+            agent.record_episode(states.tolist(), payoff=payoff)
+            shared[index].epsilon.value = agent.epsilon
+        # with a StackedTrainer an agent may train on another agent's
+        # game, so look at every agent for a new loss
+        for index, agent in enumerate(training_agents):
+            trained = agent.loss_count
+            if trained != trained_counts[index]:
+                trained_counts[index] = trained
+                shared[index].publish(agent)
+
+        if pool is not None and rounds.value >= next_pool_snapshot:
+            pool.add_agents(training_agents, rounds.value)
+            next_pool_snapshot += pool.INTERVAL
+
+        meter.add(1)
+        if meter.games % report_rate == 0:
+            print(meter.report(prefix=f"[learner {rounds.value}/{total_games} rounds] "))
+            if pool is not None:
+                print(pool.summary())
+
+    for actor in actors:
+        actor.join()
+    print(meter.report(prefix="[done] "))
@@ -0,0 +1,244 @@
+from typing import Dict, List, Tuple
+import json
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+
+'''
+Packed checkpoint archive: all checkpoints of one agent in one file.
+
+Layout:
+    header  ARCHIVE_MAGIC, u32 length, json {names, shapes, encoding,
+            keyframe_interval}: the parameter layout, the same for every
+            checkpoint of the archive
+    records one per checkpoint, in append order: RECORD_HEADER (magic,
+            episode, kind, payload length) then the payload
+    table   json [[episode, payload offset, kind, payload length], ...]
+    footer  FOOTER (table offset, table length, magic)
+
+Appending writes the new record over the old table, then the new table
+and footer. Records are never moved, so a reader holding offsets stays
+valid; if a write is cut short, the footer is missing and opening the
+archive finds the records again by walking them from the header.
+
+Encodings (how append stores records):
+    fp32    the parameters as float32, read back as views of the mmap
+    fp16    half the size, lossy (about 1e-3 relative)
+    delta   lossless: float32 bits XOR the previous record's, byte
+            planes split and zlib compressed. Consecutive checkpoints
+            share most sign, exponent and high mantissa bits, so the XOR
+            compresses where the raw weights barely do. Every
+            keyframe_interval-th record is stored whole (same byte
+            planes and zlib) so a read decodes at most that many records.
+
+This module only needs numpy; state dicts go in and come out as dicts of
+arrays.
+'''
+
+ARCHIVE_MAGIC = b'UNOCKPT1'
+RECORD_MAGIC = b'UNORECD1'
+FOOTER_MAGIC = b'UNOTABL1'
+# magic, episode, kind, payload length
+RECORD_HEADER = struct.Struct('<8sQBQ')
+# table offset, table length, magic
+FOOTER = struct.Struct('<QQ8s')
+
+# record kinds
+KIND_FP32 = 0
+KIND_FP16 = 1
+KIND_KEYFRAME = 2
+KIND_DELTA = 3
+
+ENCODINGS = ('fp32', 'fp16', 'delta')
+
+def _split_bytes(words: np.ndarray)->bytes:
+    ''' uint32 words as 4 byte planes (all lowest bytes, then ...) '''
+    return words.view(np.uint8).reshape(-1, 4).T.tobytes()
+
+def _join_bytes(data: bytes, count: int)->np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8).reshape(4, count).T.copy().view(np.uint32).ravel()
+
+
+class CheckpointArchive:
+    ''' One agent's checkpoints, see the module docstring.
+
+    Opening an existing archive keeps its encoding and layout; a new one
+    takes them from the arguments and the first appended state dict.
+    '''
+    path: str
+    encoding: str
+    keyframe_interval: int
+    names: List[str]
+    shapes: List[Tuple[int, ...]]
+    # [episode, payload offset, kind, payload length] per record
+    table: List[List[int]]
+
+    def __init__(self, path: str, encoding: str = 'fp32', keyframe_interval: int = 8):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"unknown encoding: {encoding}")
+        self.path = path
+        self.encoding = encoding
+        self.keyframe_interval = keyframe_interval
+        self.names = []
+        self.shapes = []
+        self.table = []
+        self._records_end = 0
+        self._map = None
+        # float32 words of the last record, the base of the next delta
+        self._last_words = None
+        if os.path.exists(path):
+            self._open()
+
+    # ------------------------------------------------------
+    # reading
+    # ------------------------------------------------------
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            raise ValueError(f"{self.path} is not a checkpoint archive")
+        (header_length,) = struct.unpack_from('<I', data, len(ARCHIVE_MAGIC))
+        header_end = len(ARCHIVE_MAGIC) + 4 + header_length
+        header = json.loads(data[len(ARCHIVE_MAGIC) + 4:header_end])
+        self.encoding = header['encoding']
+        self.keyframe_interval = header['keyframe_interval']
+        self.names = header['names']
+        self.shapes = [tuple(shape) for shape in header['shapes']]
+
+        self.table = None
+        if len(data) >= header_end + FOOTER.size:
+            table_offset, table_length, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+            if magic == FOOTER_MAGIC and header_end <= table_offset <= len(data) - FOOTER.size:
+                try:
+                    self.table = json.loads(data[table_offset:table_offset + table_length])
+                    self._records_end = table_offset
+                except ValueError:
+                    # a footer left behind by an append cut short
+                    pass
+        if self.table is None:
+            self.table, self._records_end = self._scan(data, header_end)
+        self._map = data
+
+    @staticmethod
+    def _scan(data, offset: int)->Tuple[List[List[int]], int]:
+        ''' Records from offset on, up to the first incomplete one '''
+        table = []
+        while offset + RECORD_HEADER.size <= len(data):
+            magic, episode, kind, length = RECORD_HEADER.unpack_from(data, offset)
+            payload = offset + RECORD_HEADER.size
+            if magic != RECORD_MAGIC or payload + length > len(data):
+                break
+            table.append([episode, payload, kind, length])
+            offset = payload + length
+        return table, offset
+
+    def episodes(self)->List[int]:
+        return [episode for episode, _, _, _ in self.table]
+
+    def latest_episode(self)->int:
+        return self.table[-1][0]
+
+    def _index(self, episode: int)->int:
+        for index in range(len(self.table) - 1, -1, -1):
+            if self.table[index][0] == episode:
+                return index
+        raise KeyError(f"episode {episode} not in {self.path}")
+
+    def _words(self, index: int)->np.ndarray:
+        ''' float32 bits of record index, decoding deltas back to their keyframe '''
+        _, offset, kind, length = self.table[index]
+        count = sum(int(np.prod(shape)) for shape in self.shapes)
+        if kind == KIND_FP32:
+            return np.frombuffer(self._map, dtype=np.uint32, count=count, offset=offset)
+        if kind == KIND_FP16:
+            halves = np.frombuffer(self._map, dtype=np.float16, count=count, offset=offset)
+            return halves.astype(np.float32).view(np.uint32)
+        words = _join_bytes(zlib.decompress(memoryview(self._map)[offset:offset + length]), count)
+        if kind == KIND_DELTA:
+            words ^= self._words(index - 1)
+        return words
+
+    def read(self, episode: int)->Dict[str, np.ndarray]:
+        ''' State dict of a checkpoint as float32 arrays. fp32 records are
+        read-only views of the file, copy them to modify. '''
+        values = self._words(self._index(episode)).view(np.float32)
+        state_dict = {}
+        start = 0
+        for name, shape in zip(self.names, self.shapes):
+            size = int(np.prod(shape))
+            state_dict[name] = values[start:start + size].reshape(shape)
+            start += size
+        return state_dict
+
+    def payload(self, episode: int)->bytes:
+        ''' The stored record of a checkpoint, as append returned it '''
+        _, offset, _, length = self.table[self._index(episode)]
+        return self._map[offset:offset + length]
+
+    def close(self):
+        ''' Unmap the file, once no array read from it is in use '''
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    # ------------------------------------------------------
+    # writing
+    # ------------------------------------------------------
+
+    def append(self, episode: int, state_dict: Dict[str, np.ndarray])->bytes:
+        ''' Add a checkpoint after the existing ones; returns its stored
+        payload (for hashing) '''
+        arrays = {name: np.asarray(value, dtype=np.float32) for name, value in state_dict.items()}
+        if len(self.names) == 0:
+            self.names = list(arrays)
+            self.shapes = [tuple(array.shape) for array in arrays.values()]
+        elif list(arrays) != self.names or [array.shape for array in arrays.values()] != self.shapes:
+            raise ValueError(f"parameters do not match the layout of {self.path}")
+        words = np.concatenate([array.ravel() for array in arrays.values()]).view(np.uint32)
+
+        if self.encoding == 'fp32':
+            kind, payload = KIND_FP32, words.tobytes()
+        elif self.encoding == 'fp16':
+            kind, payload = KIND_FP16, words.view(np.float32).astype(np.float16).tobytes()
+        else:
+            if len(self.table) > 0 and self._last_words is None:
+                self._last_words = self._words(len(self.table) - 1).copy()
+            if len(self.table) % self.keyframe_interval == 0:
+                kind, payload = KIND_KEYFRAME, zlib.compress(_split_bytes(words))
+            else:
+                kind, payload = KIND_DELTA, zlib.compress(_split_bytes(words ^ self._last_words))
+            self._last_words = words.copy()
+
+        # arrays read before may still view the old map, let them keep it
+        self._map = None
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        if mode == 'w+b':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, mode) as f:
+            if mode == 'w+b':
+                header = json.dumps({
+                    'names': self.names,
+                    'shapes': [list(shape) for shape in self.shapes],
+                    'encoding': self.encoding,
+                    'keyframe_interval': self.keyframe_interval,
+                }).encode()
+                f.write(ARCHIVE_MAGIC + struct.pack('<I', len(header)) + header)
+                self._records_end = f.tell()
+            # over the old table and footer
+            f.seek(self._records_end)
+            f.write(RECORD_HEADER.pack(RECORD_MAGIC, episode, kind, len(payload)))
+            self.table.append([episode, f.tell(), kind, len(payload)])
+            f.write(payload)
+            self._records_end = f.tell()
+
+            table = json.dumps(self.table).encode()
+            f.write(table)
+            f.write(FOOTER.pack(self._records_end, len(table), FOOTER_MAGIC))
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        self._open()
+        return payload
@@ -0,0 +1,197 @@
+from agents.checkpoint_archive import CheckpointArchive
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+'''
+Index of the checkpoints of a model_history directory.
+
+DeepUnoAgent.after_game saves <FILE_NAME>_<episode> files; each save is
+also recorded in the directory's manifest.json with the agent type,
+episode, state dimension, file size and sha256. Looking up the latest or
+a given episode of an agent is then a dict lookup instead of listing and
+parsing the whole directory. A directory without a manifest (checkpoints
+from before it, or copied in by hand) is indexed from its file names the
+first time it is opened.
+
+Checkpoints may also live in a packed CheckpointArchive, one
+<FILE_NAME>.ckpt per agent (see DeepUnoAgent.CHECKPOINT_ENCODING and
+migrate_checkpoints.py). Their entries name the archive as file, with
+the size and sha256 of the stored record; load() reads them the same.
+
+The manifest is rewritten whole into a temporary file and renamed over
+the old one, so readers see either the previous or the new index, never
+a partial one. Writers are expected to be one process per directory (the
+trainer, or the learner with --actors).
+
+torch is imported only to load a checkpoint, so the torch-free runtime
+can query manifests too.
+'''
+
+MANIFEST_FILE = "manifest.json"
+ARCHIVE_SUFFIX = ".ckpt"
+
+# <FILE_NAME>_<episode>, as after_game names checkpoints
+CHECKPOINT_NAME = re.compile(r"^(?P<prefix>.+)_(?P<episode>\d+)$")
+
+def file_sha256(path: str)->str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def archive_name(prefix: str)->str:
+    return prefix + ARCHIVE_SUFFIX
+
+def checkpoint_name(entry: Dict)->str:
+    ''' <FILE_NAME>_<episode> of an entry, as after_game names checkpoint
+    files, also for one in an archive '''
+    return f"{entry['prefix']}_{entry['episode']}"
+
+def load_state_dict(path: str)->Dict:
+    ''' Checkpoint state dict on the CPU, memory-mapped rather than read '''
+    import torch
+    return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+
+
+class CheckpointManifest:
+    ''' manifest.json of one directory.
+
+    entries[prefix][episode] is a dict with file, prefix, agent_type,
+    episode, state_dim, size and sha256; latest_episode[prefix] the
+    highest recorded episode. Use open() to share one instance per
+    directory within a process.
+    '''
+    directory: str
+    entries: Dict[str, Dict[int, Dict]]
+    latest_episode: Dict[str, int]
+
+    _opened: Dict[str, 'CheckpointManifest'] = {}
+    # opened archives of the directory, by file name
+    archives: Dict[str, CheckpointArchive]
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.entries = {}
+        self.latest_episode = {}
+        self.archives = {}
+        path = os.path.join(directory, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            for prefix, episodes in saved['entries'].items():
+                self.entries[prefix] = {int(episode): entry for episode, entry in episodes.items()}
+            self.latest_episode = {prefix: max(episodes) for prefix, episodes in self.entries.items()}
+        elif os.path.isdir(directory):
+            self.rebuild()
+
+    @classmethod
+    def open(cls, directory: str)->'CheckpointManifest':
+        key = os.path.abspath(directory)
+        if key not in cls._opened:
+            cls._opened[key] = cls(directory)
+        return cls._opened[key]
+
+    def rebuild(self):
+        ''' Index every checkpoint file of the directory, and save '''
+        self.entries = {}
+        self.latest_episode = {}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            # saved before the manifest: the agent type is not known
+            if name.endswith(ARCHIVE_SUFFIX):
+                archive = self.archive(name)
+                state_dim = archive.shapes[archive.names.index('fc1.weight')][1]
+                for episode in archive.episodes():
+                    payload = archive.payload(episode)
+                    self._add(name, name[:-len(ARCHIVE_SUFFIX)], episode, None, state_dim,
+                              size=len(payload), sha256=hashlib.sha256(payload).hexdigest())
+                continue
+            match = CHECKPOINT_NAME.match(name)
+            if match is None:
+                continue
+            state_dict = load_state_dict(path)
+            self._add(name, match['prefix'], int(match['episode']),
+                      agent_type=None, state_dim=int(state_dict['fc1.weight'].shape[1]),
+                      size=os.path.getsize(path), sha256=file_sha256(path))
+        self.save()
+
+    def record(self, file_name: str, prefix: str, episode: int,
+               agent_type: Optional[str], state_dim: int):
+        ''' Add a checkpoint just written to the directory, and save '''
+        path = os.path.join(self.directory, file_name)
+        self._add(file_name, prefix, episode, agent_type, state_dim,
+                  size=os.path.getsize(path), sha256=file_sha256(path))
+        self.save()
+
+    def record_archived(self, prefix: str, episode: int, agent_type: Optional[str],
+                        state_dim: int, payload: bytes):
+        ''' Add a checkpoint just appended to the prefix's archive, whose
+        stored record is payload, and save '''
+        self._add(archive_name(prefix), prefix, episode, agent_type, state_dim,
+                  size=len(payload), sha256=hashlib.sha256(payload).hexdigest())
+        self.save()
+
+    def _add(self, file_name: str, prefix: str, episode: int,
+             agent_type: Optional[str], state_dim: int, size: int, sha256: str):
+        self.entries.setdefault(prefix, {})[episode] = {
+            'file': file_name,
+            'prefix': prefix,
+            'agent_type': agent_type,
+            'episode': episode,
+            'state_dim': state_dim,
+            'size': size,
+            'sha256': sha256,
+        }
+        self.latest_episode[prefix] = max(self.latest_episode.get(prefix, episode), episode)
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        saved = {
+            'entries': {prefix: {str(episode): entry for episode, entry in sorted(episodes.items())}
+                        for prefix, episodes in self.entries.items()},
+        }
+        fd, temporary = tempfile.mkstemp(dir=self.directory, prefix=MANIFEST_FILE, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                # compact: opening the manifest is mostly parsing it
+                json.dump(saved, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp creates files readable by the owner only
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, os.path.join(self.directory, MANIFEST_FILE))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def latest(self, prefix: str)->Optional[Dict]:
+        episode = self.latest_episode.get(prefix)
+        return None if episode is None else self.entries[prefix][episode]
+
+    def get(self, prefix: str, episode: int)->Optional[Dict]:
+        return self.entries.get(prefix, {}).get(episode)
+
+    def path(self, entry: Dict)->str:
+        return os.path.join(self.directory, entry['file'])
+
+    def archive(self, file_name: str, encoding: str = 'fp32')->CheckpointArchive:
+        ''' An archive of the directory, opened once; encoding is for a
+        new one '''
+        if file_name not in self.archives:
+            self.archives[file_name] = CheckpointArchive(
+                    os.path.join(self.directory, file_name), encoding=encoding)
+        return self.archives[file_name]
+
+    def load(self, entry: Dict)->Dict:
+        ''' State dict of a checkpoint, see load_state_dict '''
+        if not entry['file'].endswith(ARCHIVE_SUFFIX):
+            return load_state_dict(self.path(entry))
+        import torch
+        arrays = self.archive(entry['file']).read(entry['episode'])
+        # copied: load_state_dict copies anyway, and mmap views are read-only
+        return {name: torch.tensor(array) for name, array in arrays.items()}
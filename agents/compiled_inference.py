@@ -0,0 +1,49 @@
+from agents.deeprl_nn import DeepRL_NN
+import warnings
+import torch
+
+class CompiledInference:
+    ''' TorchScript trace of a DeepRL_NN, for action selection.
+
+    Call it like the network's forward, under torch.inference_mode. It
+    skips the eager module dispatch, about 11 us of a 34 us single-state
+    forward on CPU.
+
+    The trace runs on the network's own parameter tensors, so optimizer
+    steps and load_state_dict (train_online_nn, a target sync, an actor
+    loading published weights), which all write in place, are seen by the
+    next call with nothing rebuilt. Only when the parameters' storage is
+    replaced (the network moved with .to(), which moves every parameter
+    at once) is the network traced again, on the next
+    call. Call refresh() after swapping parameters any other way.
+
+    Freezing the trace (torch.jit.freeze) would fold the weights in as
+    constants: a few us faster per call, but a 25 ms rebuild after every
+    training, which happens every few games.
+    '''
+    model: DeepRL_NN
+    traced: torch.jit.ScriptModule
+    # storage of the first parameter when traced
+    data_ptr: int
+
+    def __init__(self, model: DeepRL_NN):
+        self.model = model
+        self.refresh()
+
+    def refresh(self):
+        self.data_ptr = self.model.fc1.weight.data_ptr()
+        example = torch.zeros((1, self.model.fc1.in_features), device=self.model.device)
+        with torch.no_grad(), warnings.catch_warnings():
+            # torch 2.x marks torch.jit deprecated; torch.compile takes
+            # tens of seconds here and is slower per call for this model
+            warnings.simplefilter('ignore', FutureWarning)
+            self.traced = torch.jit.trace(self.model, example)
+
+    def is_current(self)->bool:
+        # one pointer, checking every parameter costs 10x more
+        return self.model.fc1.weight.data_ptr() == self.data_ptr
+
+    def __call__(self, x: torch.Tensor)->torch.Tensor:
+        if not self.is_current():
+            self.refresh()
+        return self.traced(x)
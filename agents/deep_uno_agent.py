@@ -1,33 +1,60 @@
 from abc import ABC, abstractmethod
-from typing import Collection, List, Tuple
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Tuple
 from agents.deeprl_nn import DeepRL_NN
+from agents.checkpoint_manifest import CheckpointManifest, archive_name
+from agents.compiled_inference import CompiledInference
+from agents.metrics_writer import MetricsWriter
 from random import randint
-from agents.state_translator import int_to_action
+from agents.state_translator import StateEncoder, int_to_action
+from agents.transition_buffer import TERMINAL, TransitionBuffer
+import copy
 import random
 import math
+import numpy as np
 import torch
 import os
 
+def cloned(value):
+    ''' value (a state dict) with every tensor copied into its own storage.
+    Parameters and optimizer states may be views into the stacked tensors
+    of a StackedTrainer, which torch.save and deepcopy would copy whole. '''
+    if isinstance(value, torch.Tensor):
+        return value.detach().clone()
+    if isinstance(value, dict):
+        return {key: cloned(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [cloned(item) for item in value]
+    return copy.deepcopy(value)
+
 class DeepUnoAgent(ABC):
     state_dim: int
     gamma: float
 
     online_nn: DeepRL_NN
+    # online_nn's forward for action selection, or its CompiledInference
+    policy_forward: Callable[[torch.Tensor], torch.Tensor]
+    # device policy_forward takes its input on
+    inference_device: torch.device
     episode_count: int
     
     # each win_list[i] counts the number of won games in the range
     # [ACCUMULATE_WIN_COUNT * i, ACCUMULATE_WIN_COUNT * (i + 1))
     ACCUMULATE_WIN_COUNT: int
     win_list: List[int]
+    # completed buckets are streamed here, if set, and win_list and
+    # loss_history only keep its window
+    metrics: Optional[MetricsWriter]
+    # trainings so far (loss_history may be trimmed)
+    loss_count: int
 
     # train after every TRAIN_RATE games
     TRAIN_RATE: int
 
-    state_list:         List[List[int]]
-    next_state_list:    List[List[int]]
-    action_list:        List[int]
-    rewards_list:       List[float]
-    dones:              List[bool]
+    # transitions since the last training, BUFFER_CAPACITY rows at most
+    buffer:             TransitionBuffer
+    BUFFER_CAPACITY:    int
+    # most recently buffered state, previous state for calculate_reward
+    last_state:         List[int]
 
     epsilon: float
     EPSILON_MIN: float
@@ -36,23 +63,42 @@ class DeepUnoAgent(ABC):
 
     SAVE_RATE: int
     FILE_NAME: str
+    # None: one torch.save file per checkpoint; 'fp32', 'fp16' or 'delta':
+    # appended to the agent's CheckpointArchive instead
+    CHECKPOINT_ENCODING: Optional[str]
 
     GAIN_CARD_PENALTY: float
     LOSE_CARD_REWARD: float
 
+    # incremental state translation of the current game, set by subclasses
+    encoder: StateEncoder
+
+    # set by StackedTrainer to train together with same-sized agents
+    trainer: Optional['StackedTrainer']
+
     def __init__(self, state_dim: int, gamma: float = 0.99):
         self.state_dim = state_dim
         self.gamma     = gamma
 
         # networks (only DQN-style subclasses will add target_nn)
         self.online_nn = DeepRL_NN(state_dim=state_dim, action_dim=61)
-
-        # episode buffers
-        self.state_list      = []
-        self.next_state_list = []
-        self.action_list     = []
-        self.rewards_list    = []
-        self.dones           = []
+        self.policy_forward = self.online_nn.forward
+        self.inference_device = self.online_nn.device
+
+        # reused by every single decision, see _greedy_action. The tensor
+        # shares memory with the array; the mask is -inf except while a
+        # decision has its legal actions set to 0
+        self._state_buffer = np.zeros(state_dim, dtype=np.float32)
+        # a batch of one, as quantized networks only take batches
+        self._state_tensor = torch.from_numpy(self._state_buffer).unsqueeze(0)
+        self._legal_mask = np.full(61, -np.inf, dtype=np.float32)
+
+        # episode buffers, comfortably more than TRAIN_RATE games
+        self.BUFFER_CAPACITY = 1 << 14
+        self.buffer          = TransitionBuffer(self.BUFFER_CAPACITY, state_dim)
+        self.last_state      = None
+        # state before a game's first observation, never modified
+        self._blank_state    = [0] * state_dim
 
         # Smaller == faster training, higher fluctuation
         self.TRAIN_RATE = 8
@@ -65,6 +111,8 @@ class DeepUnoAgent(ABC):
         self.episode_count = 0
         self.win_list = []
         self.ACCUMULATE_WIN_COUNT = 1000
+        self.metrics = None
+        self.loss_count = 0
 
         # epsilon decay for epsilon-greedy path search
         self.EPSILON_MIN = 0.05
@@ -78,6 +126,10 @@ class DeepUnoAgent(ABC):
 
         # model history save dir
         self.MODEL_HISTORY_DIR = 'model_history'
+        self.CHECKPOINT_ENCODING = None
+
+        # train on our own, see StackedTrainer
+        self.trainer = None
 
     # ------------------------------------------------------
     # RLCard-required API
@@ -86,66 +138,97 @@ class DeepUnoAgent(ABC):
     def step(self, state)->str:
         """Action selection during training (epsilon-greedy)."""
         curr_state = self.state_translation(state)
-        
-        # Calculate reward based on previous state
-        reward = 0
-        if len(self.state_list) > 0:
-            reward = self.calculate_reward(self.state_list[-1], curr_state)
-        
-        # Record transition
-        self.record_transition(
-            state=curr_state,
-            action=0,  # Will be updated below
-            reward=reward,
-            next_state=curr_state,
-            done=False
-        )
+        self.record_observation(curr_state)
         
         # Action selection (epsilon-greedy)
         if random.random() < self.epsilon:
             # Random action
             action_int = random.choice(state['legal_actions'])
         else:
-            action_int = self._greedy_step(state)
+            action_int = self._greedy_action(curr_state, state['legal_actions'])
 
         return int_to_action(action_int)
 
     def eval_step(self, state)->Tuple[str, Collection]:
         """Action selection during evaluation (greedy)."""
         curr_state = self.state_translation(state)
-
-        # Calculate reward based on previous state
-        reward = 0
-        if len(self.state_list) > 0:
-            reward = self.calculate_reward(self.state_list[-1], curr_state)
-        
-        # Record transition
-        self.record_transition(
-            state=curr_state,
-            action=0,  # Will be updated below
-            reward=reward,
-            next_state=curr_state,
-            done=False
-        )
-        return int_to_action(self._greedy_step(state)), []
+        self.record_observation(curr_state)
+        return int_to_action(self._greedy_action(curr_state, state['legal_actions'])), []
 
     def use_raw(self) -> bool:
         """'False' means expect processed env states."""
         return False
 
+    def use_compiled_inference(self):
+        """Select actions through a TorchScript trace of online_nn, which
+        follows the weights as they train (see CompiledInference)."""
+        self.policy_forward = CompiledInference(self.online_nn)
+
     def _greedy_step(self, state)->int:
-        curr_state = self.state_translation(state)
-        # Greedy action
-        q_values = self.online_nn.forward(
-            torch.tensor(curr_state, dtype=torch.float32, device=self.online_nn.device)
-        )
-        legal: List[int] = state['legal_actions']
-        
-        mask = torch.full_like(q_values, float('-inf'))
+        return self._greedy_action(self.state_translation(state), state['legal_actions'])
+
+    def _greedy_action(self, curr_state: List[int], legal: List[int])->int:
+        """Greedy action for an already encoded state."""
+        self._state_buffer[:] = curr_state
+        with torch.inference_mode():
+            q_values = self.policy_forward(
+                self._state_tensor.to(self.inference_device)
+            )[0].cpu().numpy()
+
+        mask = self._legal_mask
         mask[legal] = 0.0
-        masked_q = q_values + mask
-        
-        return int(torch.argmax(masked_q).item())
+        action_int = int(np.argmax(q_values + mask))
+        mask[legal] = -np.inf
+        return action_int
+
+    # ------------------------------------------------------
+    # Batched API (vectorized engine, many games at once)
+    # ------------------------------------------------------
+
+    @abstractmethod
+    def batch_state_translation(self, engine, games: np.ndarray)->np.ndarray:
+        """Encoded states of the player to move in the given engine games."""
+        raise NotImplementedError("Subclasses must implement batch_state_translation")
+
+    def batch_step(self, states: np.ndarray, legal_mask: np.ndarray,
+                   is_training: bool)->np.ndarray:
+        """Action ids for a batch of encoded states, one forward pass.
+
+        Args:
+            states: (B, state_dim) encoded states
+            legal_mask: (B, 61) bool, True for legal actions
+            is_training: epsilon-greedy if True, greedy otherwise
+        Returns:
+            (B,) action ids
+        """
+        actions = np.zeros(len(states), dtype=np.int64)
+        explore = np.zeros(len(states), dtype=bool)
+        if is_training:
+            explore = np.random.random(len(states)) < self.epsilon
+            if explore.any():
+                # random legal action: argmax of uniform noise over legal entries
+                noise = np.random.random((int(explore.sum()), legal_mask.shape[1]))
+                actions[explore] = np.argmax(noise * legal_mask[explore], axis=1)
+
+        greedy = ~explore
+        if greedy.any():
+            device = self.inference_device
+            with torch.inference_mode():
+                q_values = self.policy_forward(
+                    torch.as_tensor(states[greedy], dtype=torch.float32, device=device)
+                )
+                legal = torch.as_tensor(legal_mask[greedy], dtype=torch.bool, device=device)
+                masked_q = q_values.masked_fill(~legal, float('-inf'))
+                actions[greedy] = torch.argmax(masked_q, dim=1).cpu().numpy()
+        return actions
+
+    def record_episode(self, states: List[List[int]], payoff: int):
+        """Feed a whole finished game, in order, as if it had been played
+        through step: same buffers, rewards, training and checkpoints."""
+        self.before_game()
+        for state in states:
+            self.record_observation(state)
+        self.after_game(payoff=payoff)
 
     # ------------------------------------------------------
     # Required for training
@@ -166,33 +249,53 @@ class DeepUnoAgent(ABC):
         """Compute learning targets (MC returns, TD targets, etc.)."""
         pass
 
-    def train_online_nn(self):
-        """Generic training hook: compute targets then train network."""
+    def training_batches(self)->Iterator[Tuple[torch.Tensor, torch.Tensor, torch.Tensor,
+                                               Optional[torch.Tensor]]]:
+        """Batches (states, actions, targets, loss weights or None) of one
+        training, one per gradient step. The next batch is only built
+        once the previous one was trained on."""
+        yield (self.buffer.state_rows(), self.buffer.action_rows(),
+               self.compute_targets(), None)
+
+    def can_train(self)->bool:
         if not self.verify_buffers():
             print("Skipping training due to buffer issues")
-            return
-        if len(self.state_list) == 0:
+            return False
+        if self.buffer.state_count == 0:
             print("WARNING: Trying to train with empty buffers!")
+            return False
+        return True
+
+    def train_online_nn(self):
+        """Generic training hook: compute targets then train network."""
+        if not self.can_train():
             return
             
-        targets = self.compute_targets()
-        loss = self.online_nn.train_batch(
-            state_list      = self.state_list,
-            actions_taken   = self.action_list,
-            real_values     = targets,
-        )
-
+        for states, actions, targets, weights in self.training_batches():
+            loss = self.online_nn.train_batch(
+                state_list      = states,
+                actions_taken   = actions,
+                real_values     = targets,
+                weights         = weights,
+            )
+            self.record_loss(loss)
+
+    def record_loss(self, loss: float):
         # Track loss
         if not hasattr(self, 'loss_history'):
             self.loss_history = []
         self.loss_history.append(loss)
+        self.loss_count += 1
+        if self.metrics is not None:
+            self.metrics.add_loss(loss)
         
     def before_game(self):
         """ Before-game setup: alter buffer, etc. """
+        self.encoder.reset()
+
         # adjust buffer
-        buffer_state = [0 for _ in range(self.state_dim)]
-        self.state_list.append(buffer_state)
-        self.action_list.append(randint(0, 60)) # doesnt matter
+        self.buffer.add_state(self._blank_state, randint(0, 60)) # action doesnt matter
+        self.last_state = self._blank_state
 
     def after_game(self, payoff: int):
         """ After-game setup: adjust buffer, training, etc. """
@@ -202,9 +305,7 @@ class DeepUnoAgent(ABC):
         )
 
         # adjust buffer
-        self.next_state_list.append([0 for _ in range(self.state_dim)])
-        self.rewards_list.append(payoff)
-        self.dones.append(True)
+        self.buffer.add_outcome(reward=payoff, next_row=TERMINAL, done=True)
 
         # win rate counting: every ACCUMULATE_WIN_COUNT games
         if self.episode_count % self.ACCUMULATE_WIN_COUNT == 0:
@@ -213,47 +314,122 @@ class DeepUnoAgent(ABC):
 
         # training
         self.episode_count += 1
+        if self.metrics is not None and self.episode_count % self.ACCUMULATE_WIN_COUNT == 0:
+            self.metrics.add_bucket(bucket=self.episode_count // self.ACCUMULATE_WIN_COUNT - 1,
+                                    wins=self.win_list[-1], games=self.ACCUMULATE_WIN_COUNT,
+                                    epsilon=self.epsilon)
+            del self.win_list[:-self.metrics.WINDOW]
+            if hasattr(self, 'loss_history'):
+                del self.loss_history[:-self.metrics.WINDOW]
         if self.episode_count % self.TRAIN_RATE == self.TRAIN_RATE - 1:
-            self.train_online_nn()
-            self.reset_buffer()
+            if self.trainer is not None:
+                # trains (and resets the buffer) once its group is ready
+                self.trainer.request(self)
+            else:
+                self.train_online_nn()
+                self.reset_buffer()
 
         
         # Override the save path for strategic models specifically
         if self.episode_count % self.SAVE_RATE == self.SAVE_RATE - 1:
             # Parent already saved as 'deepq_ep{n}.pth', save another copy with specific name
-            torch.save(self.online_nn.state_dict(), os.path.join(self.MODEL_HISTORY_DIR, f'{self.FILE_NAME}_{self.episode_count + 1}'))
+            self.save_checkpoint(self.episode_count + 1)
 
 
     # ------------------------------------------------------
     # Helpers that SHOULD be included
     # ------------------------------------------------------
 
+    def save_checkpoint(self, episode: int):
+        """Save online_nn as the given episode's checkpoint, and record it
+        in MODEL_HISTORY_DIR's manifest."""
+        manifest = CheckpointManifest.open(self.MODEL_HISTORY_DIR)
+        if self.CHECKPOINT_ENCODING is None:
+            file_name = f'{self.FILE_NAME}_{episode}'
+            torch.save(cloned(self.online_nn.state_dict()), os.path.join(self.MODEL_HISTORY_DIR, file_name))
+            manifest.record(file_name, prefix=self.FILE_NAME, episode=episode,
+                            agent_type=type(self).__name__, state_dim=self.state_dim)
+            return
+
+        archive = manifest.archive(archive_name(self.FILE_NAME), encoding=self.CHECKPOINT_ENCODING)
+        payload = archive.append(episode, {
+            name: tensor.detach().cpu().numpy() for name, tensor in self.online_nn.state_dict().items()
+        })
+        manifest.record_archived(prefix=self.FILE_NAME, episode=episode,
+                                 agent_type=type(self).__name__, state_dim=self.state_dim,
+                                 payload=payload)
+
+    def training_state(self)->Dict:
+        """Copy of everything training changes, to resume from (see
+        agents.training_snapshot). Taken between games."""
+        return {
+            'agent_type': type(self).__name__,
+            'online_nn': cloned(self.online_nn.state_dict()),
+            'optimizer': cloned(self.online_nn.optimizer.state_dict()),
+            'buffer': copy.deepcopy(self.buffer),
+            'episode_count': self.episode_count,
+            'epsilon': self.epsilon,
+            'win_list': list(self.win_list),
+            'loss_history': list(getattr(self, 'loss_history', [])),
+            'loss_count': self.loss_count,
+            'metrics': self.metrics.state_dict() if self.metrics is not None else None,
+        }
+
+    def load_training_state(self, state: Dict):
+        """Continue from a training_state of the same agent type."""
+        if state['agent_type'] != type(self).__name__:
+            raise ValueError(f"training state of a {state['agent_type']}, not a {type(self).__name__}")
+        self.online_nn.load_state_dict(state['online_nn'])
+        self.online_nn.optimizer.load_state_dict(state['optimizer'])
+        self.buffer = copy.deepcopy(state['buffer'])
+        self.last_state = None
+        self.episode_count = state['episode_count']
+        self.epsilon = state['epsilon']
+        self.win_list = list(state['win_list'])
+        self.loss_history = list(state['loss_history'])
+        self.loss_count = state['loss_count']
+        if self.metrics is not None and state['metrics'] is not None:
+            self.metrics.load_state_dict(state['metrics'])
+
+    def record_observation(self, curr_state: List[int]):
+        """Record a newly observed state, rewarded against the previous one."""
+        # Calculate reward based on previous state
+        reward = 0
+        if self.buffer.state_count > 0:
+            reward = self.calculate_reward(self.last_state, curr_state)
+        
+        # Record transition
+        self.record_transition(
+            state=curr_state,
+            action=0,  # Will be updated below
+            reward=reward,
+            done=False
+        )
+
     def record_transition(self, 
                           state: List[int], 
                           action: int, 
                           reward: float, 
-                          next_state: List[int], 
                           done: bool):
-        """Add a transition to buffers."""
-        self.state_list.append(state)
-        self.next_state_list.append(next_state)
-        self.action_list.append(action)
-        self.rewards_list.append(reward)
-        self.dones.append(done)
+        """Add a transition to buffers.
+
+        state is also the next state of the pending transition, which gets
+        reward and done; the new row waits for the next observation (or
+        after_game) to complete it.
+        """
+        row = self.buffer.add_state(state, action)
+        self.buffer.add_outcome(reward=reward, next_row=row, done=done)
+        self.last_state = state
 
     def reset_buffer(self):
         """Clear stored transitions at end of episode."""
-        self.state_list.clear()
-        self.next_state_list.clear()
-        self.action_list.clear()
-        self.rewards_list.clear()
-        self.dones.clear()
+        self.buffer.clear()
+        self.last_state = None
 
     def verify_buffers(self):
         """Call this before training to check buffer alignment"""
         # They should all be the same length
-        if not all(len(lst) == len(self.state_list) for lst in 
-                   [self.next_state_list, self.action_list, self.rewards_list, self.dones]):
+        if self.buffer.state_count != self.buffer.outcome_count:
             print("ERROR: Buffer size mismatch!")
             return False
 
@@ -1,19 +1,37 @@
 from typing import override
 from agents.deep_uno_agent import DeepUnoAgent
-from typing import List
+import torch
+
+def discounted_returns(rewards: torch.Tensor, dones: torch.Tensor, gamma: float)->torch.Tensor:
+    ''' Discounted return of every transition of a multi-episode buffer.
+
+    G[i] = rewards[i] + gamma * G[i + 1], restarting after each done
+    (transitions after the last done are returned up to the end). Solved
+    as a linear recurrence G[i] = b[i] + a[i] * G[i + step] by doubling
+    step, so it takes log2(longest episode) vectorized passes whatever
+    the buffer size, and never divides by powers of gamma.
+    '''
+    # float64 so long episodes sum like the python loop did
+    returns = rewards.to(torch.float64, copy=True)
+    factors = torch.full_like(returns, gamma)
+    factors[dones.to(torch.bool)] = 0.0
+    # values step places ahead; past the end of the buffer a and b are 0
+    shifted = torch.zeros_like(returns)
+    step = 1
+    while step < len(returns) and bool(factors.any()):
+        shifted[:-step] = returns[step:]
+        shifted[-step:] = 0.0
+        returns.addcmul_(factors, shifted)
+        shifted[:-step] = factors[step:]
+        factors.mul_(shifted)
+        step *= 2
+    return returns.to(rewards.dtype)
 
 class DeepMCAgent(DeepUnoAgent):
     def __init__(self, state_dim: int):
         super().__init__(state_dim)
 
     @override
-    def compute_targets(self) -> List[float]:
-        state_count = len(self.state_list)
-        target_lst = [0.0] * state_count
-        G = 0.0
-        for i in reversed(range(state_count)):
-            if self.dones[i]:
-                G = 0
-            G = self.rewards_list[i] + self.gamma * G
-            target_lst[i] = G
-        return target_lst
+    def compute_targets(self) -> torch.Tensor:
+        return discounted_returns(
+                self.buffer.reward_rows(), self.buffer.done_rows(), self.gamma)
@@ -1,15 +1,21 @@
 from agents.deepmc import DeepMCAgent
-from agents.state_translator import CARD_STATE_DIM_COUNT, card_state_translate, card_state_reward
+from agents.state_translator import CARD_STATE_DIM_COUNT, card_state_encoder, card_state_reward
 from typing import override, List
+import numpy as np
 
 class DeepMCCardAgent(DeepMCAgent):
     def __init__(self):
         super().__init__(CARD_STATE_DIM_COUNT)
         self.FILE_NAME = "mccard"
+        self.encoder = card_state_encoder()
 
     @override
     def state_translation(self, state) -> List[int]:
-        return card_state_translate(state)
+        return self.encoder.translate(state)
+
+    @override
+    def batch_state_translation(self, engine, games: np.ndarray) -> np.ndarray:
+        return engine.card_states(games)
     
     @override
     def calculate_reward(self, prev_state: List[int], curr_state: List[int]) -> float:
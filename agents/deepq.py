@@ -1,52 +1,130 @@
 from agents.deep_uno_agent import DeepUnoAgent
 from agents.deeprl_nn import DeepRL_NN
-from typing import override, List
+from agents.compiled_inference import CompiledInference
+from agents.prioritized_replay import PrioritizedReplay
+from typing import override, Callable, Dict, Optional
+import copy
+import numpy as np
 import torch
 
 class DeepQAgent(DeepUnoAgent):
     target_nn: DeepRL_NN
+    # target_nn's forward for the TD targets, or its CompiledInference
+    target_forward: Callable[[torch.Tensor], torch.Tensor]
 
     # sync target_nn param using online_nn after
     # every SYNC_RATE episodes
     SYNC_RATE: int
 
+    # transitions of past games, sampled by TD error at each training
+    replay: PrioritizedReplay
+    REPLAY_CAPACITY: int
+    REPLAY_BATCH_SIZE: int
+    # gradient steps per training
+    REPLAY_STEPS: int
 
-    def __init__(self, state_dim: int):
+    def __init__(self, state_dim: int, replay_capacity: int = 1 << 18,
+                 replay_batch_size: int = 256, replay_steps: int = 4,
+                 alpha: float = 0.6, beta: float = 0.4):
+        """The replay memory keeps replay_capacity transitions, and each
+        training takes replay_steps batches of replay_batch_size from it.
+        alpha is the priority exponent (0 samples uniformly) and beta the
+        importance-sampling exponent, see PrioritizedReplay."""
         super().__init__(state_dim=state_dim)
 
         # setup target network
         self.target_nn = DeepRL_NN(state_dim=state_dim, action_dim=61)
         self.target_nn.load_state_dict(self.online_nn.state_dict())
+        self.target_forward = self.target_nn.forward
 
         # lower == more unstable model, but train more frequent
         self.SYNC_RATE = 500
 
+        # prioritized experience replay
+        self.REPLAY_CAPACITY = replay_capacity
+        self.REPLAY_BATCH_SIZE = replay_batch_size
+        self.REPLAY_STEPS = replay_steps
+        self.replay = PrioritizedReplay(
+                capacity=self.REPLAY_CAPACITY, state_dim=state_dim,
+                alpha=alpha, beta=beta)
+
+
+    @override
+    def use_compiled_inference(self):
+        """Compiled target_nn too, it follows the periodic syncs."""
+        super().use_compiled_inference()
+        self.target_forward = CompiledInference(self.target_nn)
+
+    @override
+    def training_state(self)->Dict:
+        """target_nn and the replay memory too."""
+        state = super().training_state()
+        state['target_nn'] = copy.deepcopy(self.target_nn.state_dict())
+        state['replay'] = copy.deepcopy(self.replay)
+        return state
+
+    @override
+    def load_training_state(self, state: Dict):
+        super().load_training_state(state)
+        self.target_nn.load_state_dict(state['target_nn'])
+        self.replay = copy.deepcopy(state['replay'])
+
+    @override
+    def training_batches(self):
+        """Add the buffered games to the replay memory, then REPLAY_STEPS
+        prioritized batches of it."""
+        self.replay.extend(self.buffer)
+        device = self.online_nn.device
+        for _ in range(self.REPLAY_STEPS):
+            rows, weights = self.replay.sample(self.REPLAY_BATCH_SIZE)
+            states, actions, _, _, _ = self.replay.memory.gather(rows)
+            states = states.to(dtype=torch.float32, device=device)
+            actions = actions.to(dtype=torch.long, device=device)
+            targets = self.compute_targets(rows)
+
+            # TD errors before this step, the new priorities of the batch
+            with torch.no_grad():
+                taken_q = self.online_nn(states).gather(1, actions.unsqueeze(1)).squeeze(1)
+                td_errors = (targets.to(device) - taken_q).cpu().numpy()
+            self.replay.update_priorities(rows, td_errors)
+
+            yield states, actions, targets, weights
 
     @override
-    def compute_targets(self) -> List[float]:
+    def compute_targets(self, rows: Optional[np.ndarray] = None) -> torch.Tensor:
+        """TD targets of the given replay memory rows, or of the whole
+        episode buffer if rows is None."""
         device = self.target_nn.device
 
+        if rows is not None:
+            with torch.no_grad():
+                _, _, rewards, next_states, dones = self.replay.memory.gather(rows)
+                next_q_values = self.target_forward(next_states.to(dtype=torch.float32, device=device))
+                max_next_q = next_q_values.max(dim=1).values
+                return (rewards.to(device) + self.gamma * max_next_q
+                        * (1.0 - dones.to(dtype=torch.float32, device=device)))
+
         with torch.no_grad():
-            next_states = torch.tensor(
-                self.next_state_list,
+            # next states are rows of the state column, evaluate each once
+            states = self.buffer.state_rows().to(
                 dtype=torch.float32,
                 device=device,
             )
-            rewards = torch.tensor(
-                self.rewards_list,
+            next_positions = self.buffer.next_positions().to(device=device)
+            rewards = self.buffer.reward_rows().to(
                 dtype=torch.float32,
                 device=device,
             )
-            dones = torch.tensor(
-                self.dones,
+            dones = self.buffer.done_rows().to(
                 dtype=torch.float32,
                 device=device,
             )
-            next_q_values = self.target_nn(next_states)
-            max_next_q = next_q_values.max(dim=1).values
+            max_q = self.target_forward(states).max(dim=1).values
+            # terminal transitions point at position 0, dones zero them out
+            max_next_q = max_q[next_positions]
             targets = rewards + self.gamma * max_next_q * (1.0 - dones)
 
-        return targets.cpu().tolist()
+        return targets
 
     def after_game(self, payoff: int):
         super().after_game(payoff)
@@ -1,15 +1,22 @@
 from agents.deepq import DeepQAgent
-from agents.state_translator import STRAT_STATE_DIM_COUNT, strategic_state_translate, strat_state_reward
+from agents.state_translator import STRAT_STATE_DIM_COUNT, strategic_state_encoder, strat_state_reward
 from typing import override, List
+import numpy as np
 
 class DeepQStratAgent(DeepQAgent):
-    def __init__(self):
-        super().__init__(state_dim=STRAT_STATE_DIM_COUNT)
+    def __init__(self, **replay):
+        # replay: the replay keywords of DeepQAgent
+        super().__init__(state_dim=STRAT_STATE_DIM_COUNT, **replay)
         self.FILE_NAME = "qstrat"
+        self.encoder = strategic_state_encoder()
     
     @override
     def state_translation(self, state) -> List[int]:
-        return strategic_state_translate(state)
+        return self.encoder.translate(state)
+
+    @override
+    def batch_state_translation(self, engine, games: np.ndarray) -> np.ndarray:
+        return engine.strategic_states(games)
     
     @override
     def calculate_reward(self, prev_state: List[int], curr_state: List[int]) -> float:
@@ -1,9 +1,19 @@
 from types import FunctionType
-from typing import List
+from typing import Dict, List
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+_default_device = None
+
+def default_device()->torch.device:
+    ''' cuda if available, probed once per process '''
+    global _default_device
+    if _default_device is None:
+        _default_device = torch.device(
+                'cuda' if torch.cuda.is_available() else 'cpu')
+    return _default_device
+
 class DeepRL_NN(nn.Module):
     state_dim: int
     action_dim: int
@@ -28,38 +38,45 @@ class DeepRL_NN(nn.Module):
         self.activation = F.leaky_relu
         self.optimizer = torch.optim.Adam(self.parameters(), lr=lr)
 
-        self.device = torch.device(
-                'cuda' if torch.cuda.is_available() else 'cpu')
+        self.device = default_device()
         self.to(self.device)
 
         self.EPOCH_PER_TRAIN = 1
 
     def train_batch(
-            self, state_list: List[List[int]],
-            actions_taken: List[int],
-            real_values: List[float])->float:
+            self, state_list: List[List[int]] | torch.Tensor,
+            actions_taken: List[int] | torch.Tensor,
+            real_values: List[float] | torch.Tensor,
+            weights: torch.Tensor | None = None)->float:
         ''' Apply batch nn training based on any RL learning item queues.
 
         Args:
-            state_list: List of each state s_i
-            actions_taken: List of each action taken a_i
-            real_labels: list of target values
+            state_list: List (or tensor) of each state s_i
+            actions_taken: List (or tensor) of each action taken a_i
+            real_labels: list (or tensor) of target values
+            weights: per-sample loss weights (importance sampling), or
+                None for a plain mean
         Returns:
             average loss per epoch in training
         '''
-        states = torch.tensor(
+        states = torch.as_tensor(
                 state_list, dtype=torch.float32, device=self.device)
-        actions = torch.tensor(
+        actions = torch.as_tensor(
                 actions_taken, dtype=torch.long, device=self.device)
-        targets = torch.tensor(
+        targets = torch.as_tensor(
                 real_values, dtype=torch.float32, device=self.device)
+        if weights is not None:
+            weights = weights.to(device=self.device, dtype=torch.float32)
         total_loss = 0.0
 
         for _ in range(self.EPOCH_PER_TRAIN):
             predicted_q_values = self.forward(states)
             current_q_values = predicted_q_values.gather(
                     1, actions.unsqueeze(1)).squeeze(1)
-            loss = F.mse_loss(current_q_values, targets)
+            if weights is None:
+                loss = F.mse_loss(current_q_values, targets)
+            else:
+                loss = (weights * (current_q_values - targets) ** 2).mean()
             self.optimizer.zero_grad()
             loss.backward()
             torch.nn.utils.clip_grad_norm_(self.parameters(), max_norm=10)
@@ -74,3 +91,20 @@ class DeepRL_NN(nn.Module):
         x = self.activation(self.fc1(x))
         x = self.activation(self.fc2(x))
         return self.fc3(x)
+
+    def stacked_forward(self, params: Dict[str, torch.Tensor], x: torch.Tensor)->torch.Tensor:
+        ''' forward of several models of this shape at once.
+
+        Args:
+            params: each parameter of the models stacked on a first
+                dimension, as torch.func.stack_module_state returns them
+            x: (models, rows, state_dim), the rows of each model
+        Returns:
+            (models, rows, action_dim) q values
+        '''
+        def linear(name: str, x: torch.Tensor)->torch.Tensor:
+            return torch.baddbmm(params[f"{name}.bias"].unsqueeze(1), x,
+                                 params[f"{name}.weight"].transpose(1, 2))
+        x = self.activation(linear('fc1', x))
+        x = self.activation(linear('fc2', x))
+        return linear('fc3', x)
@@ -0,0 +1,40 @@
+from agents.deep_uno_agent import DeepUnoAgent
+from typing import Dict, Hashable, List, Tuple
+import numpy as np
+
+class InferenceBroker:
+    ''' Collects pending decisions of many running games and answers them
+    with one batched, legal-masked forward per agent network.
+
+    Games submit (agent, encoded state, legal action ids, ticket) while
+    they wait, then flush() evaluates every agent's queue through
+    DeepUnoAgent.batch_step and returns the chosen action id per ticket.
+    '''
+    requests: Dict[int, Tuple[DeepUnoAgent, List[List[int]], List[List[int]], List[Hashable]]]
+
+    def __init__(self):
+        self.requests = {}
+
+    def submit(self, agent: DeepUnoAgent, state: List[int],
+               legal_actions: List[int], ticket: Hashable):
+        if id(agent) not in self.requests:
+            self.requests[id(agent)] = (agent, [], [], [])
+        _, states, legals, tickets = self.requests[id(agent)]
+        states.append(state)
+        legals.append(legal_actions)
+        tickets.append(ticket)
+
+    def flush(self, is_training: bool)->Dict[Hashable, int]:
+        actions: Dict[Hashable, int] = {}
+        for agent, states, legals, tickets in self.requests.values():
+            mask = np.zeros((len(states), 61), dtype=bool)
+            rows = np.repeat(np.arange(len(legals)), [len(legal) for legal in legals])
+            mask[rows, np.concatenate(legals)] = True
+            chosen = agent.batch_step(
+                    np.asarray(states, dtype=np.float32), mask, is_training=is_training)
+            actions.update(zip(tickets, chosen.tolist()))
+        self.requests.clear()
+        return actions
+
+    def __len__(self)->int:
+        return sum(len(tickets) for _, _, _, tickets in self.requests.values())
@@ -0,0 +1,128 @@
+from collections import deque
+from typing import Deque, Dict, List
+import os
+import time
+
+'''
+Streaming training statistics.
+
+A MetricsWriter appends one CSV row per completed ACCUMULATE_WIN_COUNT
+bucket of an agent (see DeepUnoAgent.metrics) to its statistics file, the
+statistics/win_<FILE_NAME> files analysis.py reads: the bucket, wins and
+win_rate columns they always had, then the mean loss of the trainings in
+the bucket, epsilon at its end, the agent's games/sec over it and the
+wall-clock time. Rows are buffered and flushed every FLUSH_SECONDS and on
+close, so a killed run keeps all but its last few seconds of buckets; a
+row cut short by a crash has no newline, and readers drop it
+(read_metrics_rows).
+
+The first bucket written decides where the file continues: rows from
+that bucket on are dropped, so a fresh run starts a new file and a run
+resumed from a snapshot (agents.training_snapshot) overwrites the buckets
+played after the snapshot was taken. The snapshot keeps the losses and
+time of the bucket in progress too (state_dict), so the first bucket
+after a resume is the one the run would have written.
+
+Only the last WINDOW rows are kept in memory (rows), and the agent trims
+its win_list and loss_history to as many entries.
+'''
+
+COLUMNS = ['bucket', 'wins', 'win_rate', 'mean_loss', 'epsilon', 'games_per_sec', 'time']
+
+def read_metrics_rows(path: str)->List[str]:
+    ''' Complete lines of a statistics file, header included '''
+    with open(path) as f:
+        text = f.read()
+    return text[:text.rfind('\n') + 1].splitlines()
+
+
+class MetricsWriter:
+    path: str
+    # completed buckets kept in memory
+    WINDOW: int
+    FLUSH_SECONDS: float
+    rows: Deque[Dict]
+
+    def __init__(self, path: str, window: int = 100, flush_seconds: float = 5.0):
+        self.path = path
+        self.WINDOW = window
+        self.FLUSH_SECONDS = flush_seconds
+        self.rows = deque(maxlen=window)
+        self._file = None
+        self._last_flush = time.perf_counter()
+        self._bucket_start = time.perf_counter()
+        # losses of the trainings in the current bucket
+        self._loss_sum = 0.0
+        self._loss_count = 0
+
+    def add_loss(self, loss: float):
+        self._loss_sum += loss
+        self._loss_count += 1
+
+    def state_dict(self)->Dict:
+        ''' The bucket in progress, for training snapshots '''
+        return {
+            'loss_sum': self._loss_sum,
+            'loss_count': self._loss_count,
+            'bucket_seconds': time.perf_counter() - self._bucket_start,
+        }
+
+    def load_state_dict(self, state: Dict):
+        ''' Continue the bucket of a state_dict, its time so far included '''
+        self._loss_sum = state['loss_sum']
+        self._loss_count = state['loss_count']
+        self._bucket_start = time.perf_counter() - state['bucket_seconds']
+
+    def add_bucket(self, bucket: int, wins: int, games: int, epsilon: float):
+        ''' Write a completed bucket of games games '''
+        now = time.perf_counter()
+        row = {
+            'bucket': bucket,
+            'wins': wins,
+            'win_rate': f"{wins / games * 100:.2f}",
+            'mean_loss': f"{self._loss_sum / self._loss_count:.6g}" if self._loss_count > 0 else "",
+            'epsilon': f"{epsilon:.6f}",
+            'games_per_sec': f"{games / max(now - self._bucket_start, 1e-9):.1f}",
+            'time': f"{time.time():.3f}",
+        }
+        self._bucket_start = now
+        self._loss_sum = 0.0
+        self._loss_count = 0
+        self.rows.append(row)
+
+        if self._file is None:
+            self._open(bucket)
+        # one write per row, a crash tears at most the last line
+        self._file.write(",".join(str(row[column]) for column in COLUMNS) + "\n")
+        if now - self._last_flush >= self.FLUSH_SECONDS:
+            self.flush()
+
+    def _open(self, bucket: int):
+        ''' Continue the file before bucket, or start it '''
+        kept = []
+        if os.path.exists(self.path):
+            lines = read_metrics_rows(self.path)
+            if len(lines) > 0 and lines[0].split(",")[:len(COLUMNS)] == COLUMNS:
+                kept = [line for line in lines[1:] if int(line.split(",", 1)[0]) < bucket]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # renamed over the old file, which stays whole until then
+        temporary = self.path + ".tmp"
+        with open(temporary, 'w') as f:
+            f.write("\n".join([",".join(COLUMNS)] + kept) + "\n")
+        os.replace(temporary, self.path)
+        self._file = open(self.path, 'a')
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+        self._last_flush = time.perf_counter()
+
+    def close(self):
+        ''' Flush to disk; the bucket in progress is not written '''
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
@@ -0,0 +1,119 @@
+from agents.state_translator import StateEncoder, card_state_encoder, strategic_state_encoder, int_to_action
+from agents.state_translator import CARD_STATE_DIM_COUNT, STRAT_STATE_DIM_COUNT
+from typing import Collection, Dict, List, Tuple, Union
+import numpy as np
+
+'''
+Torch-free inference for trained checkpoints.
+
+export.py writes a model_history checkpoint as an .npz of its DeepRL_NN
+parameters (same names, float32). NumpyPolicy runs the same three layer
+MLP with numpy matmuls, and NumpyAgent plays rlcard games with it the way
+the frozen agents of test_agents.py do, so evaluation processes can
+import this module, rlcard and the state encoders without ever loading
+torch. Nothing here may import torch, directly or through agents.*.
+'''
+
+# torch.nn.functional.leaky_relu default
+NEGATIVE_SLOPE = 0.01
+
+class NumpyPolicy:
+    ''' DeepRL_NN.forward and the masked argmax of
+    DeepUnoAgent._greedy_action, over exported weights '''
+    state_dim: int
+    action_dim: int
+    # (in, out) weights, transposed once so each layer is x @ weight + bias
+    weights: List[np.ndarray]
+    biases: List[np.ndarray]
+
+    def __init__(self, params: Dict[str, np.ndarray]):
+        self.weights = [np.ascontiguousarray(params[f"{layer}.weight"].T, dtype=np.float32)
+                        for layer in ('fc1', 'fc2', 'fc3')]
+        self.biases = [np.asarray(params[f"{layer}.bias"], dtype=np.float32)
+                       for layer in ('fc1', 'fc2', 'fc3')]
+        self.state_dim = self.weights[0].shape[0]
+        self.action_dim = self.weights[-1].shape[1]
+
+        # reused by every single decision, as in DeepUnoAgent
+        self._state_buffer = np.zeros((1, self.state_dim), dtype=np.float32)
+        self._legal_mask = np.full(self.action_dim, -np.inf, dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str)->'NumpyPolicy':
+        with np.load(path) as params:
+            return cls(dict(params))
+
+    def q_values(self, states: np.ndarray)->np.ndarray:
+        ''' (rows, state_dim) states to (rows, action_dim) q values '''
+        x = states
+        for index, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            x = x @ weight
+            x += bias
+            if index < len(self.weights) - 1:
+                np.maximum(x, NEGATIVE_SLOPE * x, out=x)
+        return x
+
+    def greedy_action(self, curr_state: List[int], legal: List[int])->int:
+        self._state_buffer[0] = curr_state
+        q_values = self.q_values(self._state_buffer)[0]
+
+        mask = self._legal_mask
+        mask[legal] = 0.0
+        action_int = int(np.argmax(q_values + mask))
+        mask[legal] = -np.inf
+        return action_int
+
+
+class NumpyAgent:
+    ''' Frozen rlcard agent over a NumpyPolicy, counting its wins like the
+    frozen agents of test_agents.py. The state encoder follows from the
+    policy's state dimension. Built from an exported .npz path or a
+    NumpyPolicy. '''
+    policy: NumpyPolicy
+    encoder: StateEncoder
+
+    def __init__(self, source: Union[str, NumpyPolicy]):
+        self.policy = NumpyPolicy.load(source) if isinstance(source, str) else source
+        if self.policy.state_dim == CARD_STATE_DIM_COUNT:
+            self.encoder = card_state_encoder()
+        elif self.policy.state_dim == STRAT_STATE_DIM_COUNT:
+            self.encoder = strategic_state_encoder()
+        else:
+            raise ValueError(f"no state encoder of dimension {self.policy.state_dim}")
+        self.test_win_count = 0
+        self.test_game_count = 0
+
+    def step(self, state)->str:
+        return self.eval_step(state)[0]
+
+    def eval_step(self, state)->Tuple[str, Collection]:
+        action_int = self.policy.greedy_action(self.encoder.translate(state), state['legal_actions'])
+        return int_to_action(action_int), []
+
+    def use_raw(self)->bool:
+        return False
+
+    def before_game(self):
+        self.encoder.reset()
+
+    def after_game(self, payoff: int):
+        self.test_win_count += 1 if payoff == 1 else 0
+        self.test_game_count += 1
+
+    def reset_win_count(self):
+        self.test_win_count = 0
+        self.test_game_count = 0
+
+
+def play_games(env, game_count: int):
+    ''' env.run game_count times, calling the before_game/after_game of
+    the env's agents that have them, as env.play_game does for
+    DeepUnoAgents (env.py imports torch) '''
+    for _ in range(game_count):
+        for agent in env.agents:
+            if hasattr(agent, 'before_game'):
+                agent.before_game()
+        _, payoff = env.run(is_training=False)
+        for index, agent in enumerate(env.agents):
+            if hasattr(agent, 'after_game'):
+                agent.after_game(payoff=payoff[index])
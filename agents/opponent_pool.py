@@ -0,0 +1,213 @@
+from agents.deep_uno_agent import DeepUnoAgent
+from agents.numpy_runtime import NumpyAgent, NumpyPolicy
+from typing import Dict, List
+import random
+import torch
+import torch.multiprocessing as mp
+
+'''
+Pool of frozen opponents for the self-play phase.
+
+Past the bot phase, env.train pits the training agents only against each
+other. With an OpponentPool each round also seats opponents sampled from
+frozen snapshots of the agents' online_nn, taken every INTERVAL rounds.
+
+Every training agent has CAPACITY slots. Their weights are allocated once,
+in shared memory (share_memory_), when the pool is built: a snapshot is
+copied into a slot, and the PoolOpponents playing a slot run NumpyPolicy
+on numpy views of the shared tensors, so neither sampling an opponent nor
+an actor process (actor_learner passes the pool to its actors) copies any
+weights. Weight matrices are stored transposed, in the (in, out) layout
+NumpyPolicy multiplies with. A slot overwritten while a game against it
+is in progress plays the rest of that game with the new weights.
+
+A full agent's new snapshot evicts one of its slots by EVICTION:
+    fifo        the oldest snapshot
+    random      any snapshot
+    weakest     the snapshot with the lowest win rate against the learners
+Opponents are sampled from all filled slots with weights by SAMPLING:
+    uniform     all alike
+    recent      proportional to the rank in age, the newest the most
+    hard        proportional to the win rate against the learners (the
+                prioritized fictitious self-play of AlphaStar), so the
+                learners keep facing what they haven't beaten yet
+Win rates count the games of each slot since its snapshot, with one win
+and one loss as prior. Sampling draws from the global python generator,
+so a run resumed from a training snapshot samples the same opponents.
+'''
+
+EVICTIONS = ('fifo', 'random', 'weakest')
+SAMPLINGS = ('uniform', 'recent', 'hard')
+# DeepRL_NN layers, as NumpyPolicy reads them
+LAYERS = ('fc1', 'fc2', 'fc3')
+
+
+class PoolOpponent(NumpyAgent):
+    ''' Greedy rlcard agent of one pool slot, reporting its results to
+    the pool '''
+    pool: 'OpponentPool'
+    slot: int
+
+    def __init__(self, pool: 'OpponentPool', slot: int, policy: NumpyPolicy):
+        super().__init__(policy)
+        self.pool = pool
+        self.slot = slot
+
+    def after_game(self, payoff: int):
+        super().after_game(payoff)
+        self.pool.record_result(self.slot, payoff)
+
+
+class OpponentPool:
+    CAPACITY: int
+    # rounds between snapshots
+    INTERVAL: int
+    EVICTION: str
+    SAMPLING: str
+    # FILE_NAME of the agent of each block of CAPACITY slots
+    agent_names: List[str]
+    # per agent, shared (CAPACITY, ...) tensors by parameter name
+    params: List[Dict[str, torch.Tensor]]
+
+    def __init__(self, agents: List[DeepUnoAgent], capacity: int = 8, interval: int = 10000,
+                 eviction: str = 'fifo', sampling: str = 'uniform', ctx=None):
+        if eviction not in EVICTIONS:
+            raise ValueError(f"unknown eviction: {eviction}")
+        if sampling not in SAMPLINGS:
+            raise ValueError(f"unknown sampling: {sampling}")
+        if capacity < 1:
+            raise ValueError("an opponent pool needs at least one slot per agent")
+        self.CAPACITY = capacity
+        self.INTERVAL = interval
+        self.EVICTION = eviction
+        self.SAMPLING = sampling
+        self.agent_names = [agent.FILE_NAME for agent in agents]
+        self.params = []
+        for agent in agents:
+            state = self._layout(agent)
+            self.params.append({
+                name: torch.zeros((capacity,) + tensor.shape, dtype=torch.float32).share_memory_()
+                for name, tensor in state.items()
+            })
+
+        slots = capacity * len(agents)
+        # snapshot order, 0 for an empty slot
+        self.sequence = torch.zeros(slots, dtype=torch.int64).share_memory_()
+        # training round each slot was taken at
+        self.rounds = torch.zeros(slots, dtype=torch.int64).share_memory_()
+        self.games = torch.zeros(slots, dtype=torch.int64).share_memory_()
+        self.wins = torch.zeros(slots, dtype=torch.int64).share_memory_()
+        ctx = ctx if ctx is not None else mp.get_context('spawn')
+        self.lock = ctx.Lock()
+        # PoolOpponent per slot, built on first use in each process
+        self._opponents: Dict[int, PoolOpponent] = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_opponents'] = {}
+        return state
+
+    @staticmethod
+    def _layout(agent: DeepUnoAgent)->Dict[str, torch.Tensor]:
+        ''' online_nn parameters as the pool stores them '''
+        state = {}
+        for name, tensor in agent.online_nn.state_dict().items():
+            tensor = tensor.detach().to(device='cpu', dtype=torch.float32)
+            state[name] = tensor.t() if name.endswith(".weight") else tensor
+        return state
+
+    def __len__(self)->int:
+        return int((self.sequence > 0).sum())
+
+    def add(self, agent: DeepUnoAgent, rounds: int)->int:
+        ''' Snapshot agent's online_nn into one of its slots, returns the slot '''
+        index = self.agent_names.index(agent.FILE_NAME)
+        first = index * self.CAPACITY
+        state = self._layout(agent)
+        with self.lock:
+            block = range(first, first + self.CAPACITY)
+            empty = [slot for slot in block if self.sequence[slot] == 0]
+            if empty:
+                slot = empty[0]
+            elif self.EVICTION == 'fifo':
+                slot = min(block, key=lambda slot: self.sequence[slot])
+            elif self.EVICTION == 'random':
+                slot = random.choice(block)
+            else:
+                slot = min(block, key=lambda slot: (self._win_rate(slot), self.sequence[slot]))
+            for name, tensor in state.items():
+                self.params[index][name][slot - first].copy_(tensor)
+            self.sequence[slot] = int(self.sequence.max()) + 1
+            self.rounds[slot] = rounds
+            self.games[slot] = 0
+            self.wins[slot] = 0
+        return slot
+
+    def add_agents(self, agents: List[DeepUnoAgent], rounds: int):
+        for agent in agents:
+            self.add(agent, rounds)
+
+    def _win_rate(self, slot: int)->float:
+        return (int(self.wins[slot]) + 1) / (int(self.games[slot]) + 2)
+
+    def record_result(self, slot: int, payoff: int):
+        with self.lock:
+            self.games[slot] += 1
+            self.wins[slot] += 1 if payoff == 1 else 0
+
+    def opponent(self, slot: int)->PoolOpponent:
+        if slot not in self._opponents:
+            index, offset = divmod(slot, self.CAPACITY)
+            # the slot's shared memory, transposed back: no copy
+            params = {name: tensor[offset].numpy().T if name.endswith(".weight") else tensor[offset].numpy()
+                      for name, tensor in self.params[index].items()}
+            self._opponents[slot] = PoolOpponent(self, slot, NumpyPolicy(params))
+        return self._opponents[slot]
+
+    def sample(self, count: int)->List[PoolOpponent]:
+        ''' count opponents drawn by SAMPLING, none while the pool is empty '''
+        filled = [slot for slot in range(len(self.sequence)) if self.sequence[slot] > 0]
+        if not filled:
+            return []
+        if self.SAMPLING == 'uniform':
+            weights = None
+        elif self.SAMPLING == 'recent':
+            by_age = sorted(filled, key=lambda slot: self.sequence[slot])
+            rank = {slot: position + 1 for position, slot in enumerate(by_age)}
+            weights = [rank[slot] for slot in filled]
+        else:
+            weights = [self._win_rate(slot) for slot in filled]
+        return [self.opponent(slot) for slot in random.choices(filled, weights=weights, k=count)]
+
+    def summary(self)->str:
+        filled = [slot for slot in range(len(self.sequence)) if self.sequence[slot] > 0]
+        rates = [self._win_rate(slot) for slot in filled]
+        mean = sum(rates) / len(rates) if rates else 0.0
+        return (f"pool {len(filled)}/{len(self.sequence)} snapshots, "
+                f"{int(self.games.sum())} games, mean opponent win rate {mean * 100:.1f}%")
+
+    def state_dict(self)->Dict:
+        ''' Copy of the pool's contents, for training snapshots '''
+        with self.lock:
+            return {
+                'agents': list(self.agent_names),
+                'params': [{name: tensor.clone() for name, tensor in params.items()}
+                           for params in self.params],
+                'sequence': self.sequence.clone(),
+                'rounds': self.rounds.clone(),
+                'games': self.games.clone(),
+                'wins': self.wins.clone(),
+            }
+
+    def load_state_dict(self, state: Dict):
+        ''' Put a state_dict into this pool's shared memory, the same
+        agents and capacity '''
+        if state['agents'] != self.agent_names or len(state['sequence']) != len(self.sequence):
+            raise ValueError(f"pool of {state['agents']} with {len(state['sequence'])} slots, "
+                             f"expected {self.agent_names} with {len(self.sequence)}")
+        with self.lock:
+            for params, saved in zip(self.params, state['params']):
+                for name, tensor in params.items():
+                    tensor.copy_(saved[name])
+            for name in ('sequence', 'rounds', 'games', 'wins'):
+                getattr(self, name).copy_(state[name])
@@ -0,0 +1,105 @@
+from agents.transition_buffer import TransitionBuffer
+from typing import Tuple
+import numpy as np
+import torch
+
+class SumTree:
+    ''' Binary tree of priority sums over a fixed number of leaves.
+
+    Updating k leaves and drawing k samples both walk one root to leaf
+    path per item, O(k log n), vectorized over the k items level by level.
+    '''
+    size: int
+    depth: int
+    tree: np.ndarray
+
+    def __init__(self, capacity: int):
+        self.depth = max(int(np.ceil(np.log2(max(capacity, 2)))), 1)
+        self.size = 1 << self.depth
+        # node i has children 2i and 2i+1, leaves start at size
+        self.tree = np.zeros(2 * self.size, dtype=np.float64)
+
+    def total(self)->float:
+        return float(self.tree[1])
+
+    def priorities(self, leaves: np.ndarray)->np.ndarray:
+        return self.tree[leaves + self.size]
+
+    def update(self, leaves: np.ndarray, priorities: np.ndarray):
+        nodes = leaves + self.size
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            # a parent listed twice just gets the same sum twice
+            nodes //= 2
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values: np.ndarray)->np.ndarray:
+        ''' Leaf of each value in [0, total), by cumulative priority '''
+        values = values.copy()
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            # never step into an empty subtree, whatever the rounding
+            go_right = (values >= left_sum) & (self.tree[left + 1] > 0)
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.size
+
+
+class PrioritizedReplay:
+    ''' Replay memory sampled in proportion to TD error.
+
+    Transitions live in a TransitionBuffer of CAPACITY rows; the priority
+    of row i is leaf i of a SumTree. New rows get the highest priority seen
+    so far so they are trained on at least once; sampled rows are
+    re-prioritized with |TD error| ** ALPHA. sample() also returns the
+    importance-sampling weights (N * P(i)) ** -BETA, scaled to at most 1,
+    that correct the loss for the non-uniform sampling.
+    '''
+    CAPACITY: int
+    ALPHA: float
+    BETA: float
+    # keeps every transition sampleable
+    PRIORITY_EPSILON: float
+
+    memory: TransitionBuffer
+    tree: SumTree
+    max_priority: float
+
+    def __init__(self, capacity: int, state_dim: int,
+                 alpha: float = 0.6, beta: float = 0.4):
+        self.CAPACITY = capacity
+        self.ALPHA = alpha
+        self.BETA = beta
+        self.PRIORITY_EPSILON = 1e-3
+
+        self.memory = TransitionBuffer(capacity, state_dim)
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+
+    def __len__(self)->int:
+        return len(self.memory)
+
+    def extend(self, buffer: TransitionBuffer):
+        ''' Add the rows of a complete episode buffer '''
+        rows = self.memory.extend(buffer)
+        # overwritten rows take their new priority with them
+        self.tree.update(rows, np.full(len(rows), self.max_priority))
+
+    def sample(self, batch_size: int)->Tuple[np.ndarray, torch.Tensor]:
+        ''' Rows drawn by priority, one from each of batch_size equal
+        slices of the total, and their importance-sampling weights '''
+        total = self.tree.total()
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+        rows = self.tree.find(np.minimum(values, np.nextafter(total, 0)))
+
+        probabilities = self.tree.priorities(rows) / total
+        weights = (len(self.memory) * probabilities) ** -self.BETA
+        weights /= weights.max()
+        return rows, torch.as_tensor(weights, dtype=torch.float32)
+
+    def update_priorities(self, rows: np.ndarray, td_errors: np.ndarray):
+        priorities = (np.abs(td_errors) + self.PRIORITY_EPSILON) ** self.ALPHA
+        self.tree.update(rows, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
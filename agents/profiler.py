@@ -0,0 +1,198 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import functools
+import importlib
+import signal
+import time
+
+'''
+Hot-path profiling of training runs.
+
+enable() wraps the functions of the training loop listed in PHASES with
+timers, and disable() puts the originals back: while profiling is off
+nothing is wrapped, so it costs nothing at all, and it can be switched
+on and off in a running process (train.py --profile, or SIGUSR1, see
+install_signal_toggle).
+
+Every phase keeps its calls, inclusive time and self time (inclusive
+minus the phases called from it; training runs inside play_game, and
+inference inside rlcard's env.run). COUNTERS only count their calls,
+and PHASE_COUNTERS are the calls of phases (games are play_game calls,
+so the batched backend's games show in its throughput reports only).
+report_line() is a one-line summary of the time since the last one,
+appended to the throughput reports of env.ThroughputMeter while
+enabled; breakdown() is the table of the whole profiled time.
+
+Phases nest through one stack, so only the training thread may run the
+profiled functions (the snapshot writer's thread runs none of them).
+The actor processes of actor_learner are not profiled.
+'''
+
+# (phase, module, owner in the module or None for a module function,
+#  function name)
+PHASES: List[Tuple[str, str, Optional[str], str]] = [
+    ('play_game',        'env',                     None,                'play_game'),
+    ('rlcard_step',      'rlcard.envs.env',         'Env',               'step'),
+    ('encode',           'agents.state_translator', 'StateEncoder',      'translate'),
+    ('inference',        'agents.deep_uno_agent',   'DeepUnoAgent',      '_greedy_action'),
+    ('batch_inference',  'agents.inference_broker', 'InferenceBroker',   'flush'),
+    ('train',            'agents.deep_uno_agent',   'DeepUnoAgent',      'train_online_nn'),
+    ('stacked_train',    'agents.stacked_training', 'StackedTrainer',    'train'),
+    ('q_targets',        'agents.deepq',            'DeepQAgent',        'compute_targets'),
+    ('mc_targets',       'agents.deepmc',           'DeepMCAgent',       'compute_targets'),
+    ('train_batch',      'agents.deeprl_nn',        'DeepRL_NN',         'train_batch'),
+    ('stacked_step',     'agents.stacked_training', 'StackedModels',     'step'),
+    ('checkpoint',       'agents.deep_uno_agent',   'DeepUnoAgent',      'save_checkpoint'),
+    ('snapshot',         'env',                     None,                'training_snapshot'),
+]
+
+# (counter, module, owner, function name)
+COUNTERS: List[Tuple[str, str, Optional[str], str]] = [
+    ('decisions',   'agents.state_translator',  'StateEncoder',     'translate'),
+    ('transitions', 'agents.transition_buffer', 'TransitionBuffer', 'add_outcome'),
+]
+
+# counters that are the calls of phases
+PHASE_COUNTERS: Dict[str, Tuple[str, ...]] = {
+    'games': ('play_game',),
+    'train_steps': ('train_batch', 'stacked_step'),
+}
+
+
+class Phase:
+    calls: int
+    # seconds, including and excluding the phases called from it
+    total: float
+    own: float
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+
+
+# state of the profiled run
+phases: Dict[str, Phase] = {}
+counts: Dict[str, int] = {}
+ENABLED = False
+# profiled time, from enable() to disable()
+_started = 0.0
+_stopped = 0.0
+# (owner, name, original) of every wrapped function, to restore
+_patched: List[Tuple[object, str, Callable]] = []
+# time of the phases called from each running phase
+_children: List[float] = []
+# time, counters and self times at the last report_line
+_last_report: Tuple[float, Dict[str, int], Dict[str, float]] = (0.0, {}, {})
+
+def _timed(phase: Phase, function: Callable)->Callable:
+    children = _children
+    perf_counter = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        children.append(0.0)
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            inner = children.pop()
+            phase.calls += 1
+            phase.total += elapsed
+            phase.own += elapsed - inner
+            if children:
+                children[-1] += elapsed
+    return wrapper
+
+def _counted(counter: str, function: Callable)->Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        counts[counter] += 1
+        return function(*args, **kwargs)
+    return wrapper
+
+def _patch(module: str, owner: Optional[str], name: str, wrap: Callable[[Callable], Callable]):
+    target = importlib.import_module(module)
+    if owner is not None:
+        target = getattr(target, owner)
+    original = getattr(target, name)
+    setattr(target, name, wrap(original))
+    _patched.append((target, name, original))
+
+def enable():
+    ''' Start profiling (from zero) '''
+    global ENABLED, _started, _last_report
+    if ENABLED:
+        return
+    phases.clear()
+    counts.clear()
+    for phase, module, owner, name in PHASES:
+        phases[phase] = Phase()
+        _patch(module, owner, name, functools.partial(_timed, phases[phase]))
+    # counters go around the timers, their cost stays out of the phases
+    for counter, module, owner, name in COUNTERS:
+        counts[counter] = 0
+        _patch(module, owner, name, functools.partial(_counted, counter))
+    ENABLED = True
+    _started = time.perf_counter()
+    _last_report = (_started, totals(), {})
+
+def disable():
+    ''' Stop profiling, the results stay until the next enable() '''
+    global ENABLED, _stopped
+    if ENABLED:
+        _stopped = time.perf_counter()
+    # restored in reverse, a function wrapped twice gets its original back
+    while _patched:
+        target, name, original = _patched.pop()
+        setattr(target, name, original)
+    ENABLED = False
+
+def toggle():
+    if ENABLED:
+        print(breakdown())
+        disable()
+    else:
+        enable()
+
+def install_signal_toggle(signal_number: int = signal.SIGUSR1):
+    ''' Switch profiling on or off when the process gets signal_number
+    (printing the breakdown when switching off) '''
+    signal.signal(signal_number, lambda *_: toggle())
+
+def totals()->Dict[str, int]:
+    ''' Every counter, the PHASE_COUNTERS included '''
+    result = {counter: sum(phases[phase].calls for phase in sources)
+              for counter, sources in PHASE_COUNTERS.items()}
+    result.update(counts)
+    return result
+
+def report_line()->str:
+    ''' Rates and the largest self times since the last report_line '''
+    global _last_report
+    now = time.perf_counter()
+    last_time, last_counts, last_own = _last_report
+    elapsed = max(now - last_time, 1e-9)
+    current = totals()
+    rates = " ".join(f"{counter} {(count - last_counts.get(counter, 0)) / elapsed:.1f}/s"
+                     for counter, count in current.items())
+    own = {phase: values.own - last_own.get(phase, 0.0) for phase, values in phases.items()}
+    top = sorted(own.items(), key=lambda item: -item[1])[:4]
+    shares = " ".join(f"{phase} {seconds / elapsed * 100:.0f}%" for phase, seconds in top if seconds > 0)
+    _last_report = (now, current, {phase: values.own for phase, values in phases.items()})
+    return f"{rates} | {shares}"
+
+def breakdown()->str:
+    ''' Table of every phase over the whole profiled time '''
+    wall = max((time.perf_counter() if ENABLED else _stopped) - _started, 1e-9)
+    lines = [f"profile of {wall:.1f} s:",
+             f"{'phase':>18} {'calls':>10} {'total s':>9} {'self s':>9} {'self %':>7} {'us/call':>9}"]
+    for phase, values in sorted(phases.items(), key=lambda item: -item[1].own):
+        if values.calls == 0:
+            continue
+        lines.append(f"{phase:>18} {values.calls:>10} {values.total:>9.2f} {values.own:>9.2f}"
+                     f" {values.own / wall * 100:>6.1f}% {values.total / values.calls * 1e6:>9.1f}")
+    unprofiled = wall - sum(values.own for values in phases.values())
+    lines.append(f"{'(outside phases)':>18} {'':>10} {'':>9} {unprofiled:>9.2f} {unprofiled / wall * 100:>6.1f}%")
+    lines.append(" ".join(f"{counter} {count} ({count / wall:.1f}/s)" for counter, count in totals().items()))
+    return "\n".join(lines)
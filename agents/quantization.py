@@ -0,0 +1,63 @@
+from agents.checkpoint_manifest import load_state_dict
+from agents.deeprl_nn import DeepRL_NN
+from typing import Dict, Optional, Union
+import copy
+import os
+import warnings
+import torch
+
+'''
+Int8 inference models from model_history checkpoints.
+
+quantize_dynamic stores the Linear weights as int8, one scale per output
+row, and quantizes activations on the fly, so no calibration data is
+needed. The quantized network is traced (see CompiledInference): eager
+quantized modules cost more per call than float ones at batch 1, traced
+they cost less. The result is a TorchScript archive that loads without
+DeepRL_NN, and is for inference only: it does not follow further
+training of the float network.
+'''
+
+def load_checkpoint(checkpoint: Union[str, Dict])->DeepRL_NN:
+    ''' Float network of a model_history checkpoint, given as a file path
+    or as its state dict (CheckpointManifest.load, which also reads
+    archived checkpoints), on the CPU whatever device it was saved from '''
+    state_dict = load_state_dict(checkpoint) if isinstance(checkpoint, str) else checkpoint
+    action_dim, state_dim = state_dict['fc3.weight'].shape[0], state_dict['fc1.weight'].shape[1]
+    model = DeepRL_NN(state_dim=state_dim, action_dim=action_dim)
+    model.load_state_dict(state_dict)
+    return model.cpu().eval()
+
+def quantize_model(model: DeepRL_NN)->torch.jit.ScriptModule:
+    ''' Dynamically quantized int8 copy of model, traced '''
+    model = copy.deepcopy(model).cpu().eval()
+    with warnings.catch_warnings():
+        # torch.ao and torch.jit both warn about their future in torch 2.x
+        warnings.simplefilter('ignore')
+        quantized = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear: torch.ao.quantization.per_channel_dynamic_qconfig},
+                dtype=torch.qint8)
+        with torch.no_grad():
+            traced = torch.jit.trace(
+                    quantized, torch.zeros((1, model.fc1.in_features)))
+        return torch.jit.freeze(traced.eval())
+
+def quantize_checkpoint(checkpoint: Union[str, Dict], output_dir: str,
+                        name: Optional[str] = None)->str:
+    ''' Write the int8 model of a checkpoint (as load_checkpoint) to
+    output_dir, under name (by default the checkpoint file's), and return
+    its path '''
+    if name is None:
+        name = os.path.basename(checkpoint)
+    os.makedirs(output_dir, exist_ok=True)
+    output = os.path.join(output_dir, name)
+    quantized = quantize_model(load_checkpoint(checkpoint))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        torch.jit.save(quantized, output)
+    return output
+
+def load_quantized(path: str)->torch.jit.ScriptModule:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        return torch.jit.load(path, map_location='cpu')
@@ -0,0 +1,230 @@
+from agents.deep_uno_agent import DeepUnoAgent
+from agents.deeprl_nn import DeepRL_NN
+from typing import Dict, List, Optional, Set, Tuple
+import torch
+
+Batch = Tuple[torch.Tensor, torch.Tensor, torch.Tensor, Optional[torch.Tensor]]
+
+# gradient norm each model is clipped to, as in DeepRL_NN.train_batch
+MAX_GRAD_NORM = 10.0
+
+
+class StackedModels:
+    ''' Models of the same shape trained together, with their parameters
+    and Adam state kept stacked.
+
+    Every parameter of the models is one (models, ...) tensor here, and
+    each model's own parameter is a view of its row, as are the exp_avg,
+    exp_avg_sq and step of its Adam optimizer. Nothing is copied per
+    step: step() runs one forward and backward over the stacked tensors
+    (DeepRL_NN.stacked_forward, one batched matmul per layer), clips each
+    model's gradient and applies Adam to all rows at once. A model
+    training alone (DeepRL_NN.train_batch) or loading weights writes its
+    views in place, so the stacked state stays current either way.
+    Checkpoints and training snapshots see each model's own row (they
+    clone the views, see DeepUnoAgent.save_checkpoint).
+
+    Batches are padded to the longest one and padding rows get weight 0,
+    so each model's loss is exactly the one train_batch would compute.
+    Parameters or optimizer state replaced by something else (an
+    optimizer's load_state_dict, a move with .to()) are taken back in on
+    the next step. The optimizers must be plain Adam with the same betas
+    and eps; learning rates may differ.
+    '''
+    models: List[DeepRL_NN]
+    params: Dict[str, torch.nn.Parameter]
+    exp_avg: Dict[str, torch.Tensor]
+    exp_avg_sq: Dict[str, torch.Tensor]
+    # Adam steps of each model's parameter, on the CPU as Adam keeps them
+    steps: Dict[str, torch.Tensor]
+
+    def __init__(self, models: List[DeepRL_NN]):
+        groups = [model.optimizer.param_groups[0] for model in models]
+        for model, group in zip(models, groups):
+            if not isinstance(model.optimizer, torch.optim.Adam) or group['weight_decay'] != 0 \
+                    or group['amsgrad'] or group['maximize']:
+                raise ValueError("stacked training needs plain Adam optimizers")
+            if group['betas'] != groups[0]['betas'] or group['eps'] != groups[0]['eps']:
+                raise ValueError("stacked models need the same Adam betas and eps")
+        self.models = models
+        self.betas = groups[0]['betas']
+        self.eps = groups[0]['eps']
+        self.params = {}
+        self.exp_avg = {}
+        self.exp_avg_sq = {}
+        self.steps = {}
+        for name, parameter in models[0].named_parameters():
+            shape = (len(models),) + parameter.shape
+            self.params[name] = torch.nn.Parameter(
+                    torch.zeros(shape, dtype=parameter.dtype, device=parameter.device))
+            self.exp_avg[name] = torch.zeros_like(self.params[name].data)
+            self.exp_avg_sq[name] = torch.zeros_like(self.params[name].data)
+            self.steps[name] = torch.zeros(len(models), dtype=torch.float32)
+        self.bind()
+
+    def bind(self):
+        ''' Make every model parameter and Adam state a view of its row,
+        taking in the values of those that are not (yet) '''
+        for index, model in enumerate(self.models):
+            for name, parameter in model.named_parameters():
+                row = self.params[name].data[index]
+                if parameter.data_ptr() != row.data_ptr():
+                    row.copy_(parameter.data)
+                    parameter.data = row
+
+                state = model.optimizer.state[parameter]
+                exp_avg = self.exp_avg[name][index]
+                if state.get('exp_avg') is not None and state['exp_avg'].data_ptr() == exp_avg.data_ptr():
+                    continue
+                exp_avg_sq, step = self.exp_avg_sq[name][index], self.steps[name][index]
+                if len(state) > 0:
+                    exp_avg.copy_(state['exp_avg'])
+                    exp_avg_sq.copy_(state['exp_avg_sq'])
+                    step.copy_(state['step'])
+                else:
+                    exp_avg.zero_()
+                    exp_avg_sq.zero_()
+                    step.zero_()
+                state.update({'step': step, 'exp_avg': exp_avg, 'exp_avg_sq': exp_avg_sq})
+
+    def step(self, batches: List[Batch])->List[float]:
+        ''' One gradient step of each model on its own batch, returns each
+        model's loss '''
+        self.bind()
+        device = self.models[0].device
+        model_count = len(self.models)
+        row_count = max(len(states) for states, _, _, _ in batches)
+
+        states = torch.zeros((model_count, row_count, self.models[0].fc1.in_features),
+                             dtype=torch.float32, device=device)
+        actions = torch.zeros((model_count, row_count), dtype=torch.long, device=device)
+        targets = torch.zeros((model_count, row_count), dtype=torch.float32, device=device)
+        weights = torch.zeros((model_count, row_count), dtype=torch.float32, device=device)
+        for index, (batch_states, batch_actions, batch_targets, batch_weights) in enumerate(batches):
+            count = len(batch_states)
+            states[index, :count] = torch.as_tensor(batch_states, device=device)
+            actions[index, :count] = torch.as_tensor(batch_actions, device=device)
+            targets[index, :count] = torch.as_tensor(batch_targets, device=device)
+            weights[index, :count] = 1.0 if batch_weights is None else batch_weights.to(device)
+        counts = torch.tensor([len(batch[0]) for batch in batches], dtype=torch.float32, device=device)
+
+        predicted_q_values = self.models[0].stacked_forward(self.params, states)
+        current_q_values = predicted_q_values.gather(2, actions.unsqueeze(2)).squeeze(2)
+        # per model mean over its own rows, as F.mse_loss (or the weighted loss)
+        losses = (weights * (current_q_values - targets) ** 2).sum(dim=1) / counts
+        losses.sum().backward()
+
+        with torch.no_grad():
+            # clip_grad_norm_ of each model: its norm over all its parameters
+            norms = torch.linalg.vector_norm(torch.stack([
+                    torch.linalg.vector_norm(parameter.grad.flatten(1), dim=1)
+                    for parameter in self.params.values()]), dim=0)
+            clip = (MAX_GRAD_NORM / (norms + 1e-6)).clamp(max=1.0)
+            lrs = torch.tensor([model.optimizer.param_groups[0]['lr'] for model in self.models],
+                               dtype=torch.float64)
+            beta1, beta2 = self.betas
+            for name, parameter in self.params.items():
+                rows = (-1,) + (1,) * (parameter.dim() - 1)
+                grad = parameter.grad.mul_(clip.view(rows))
+                steps = self.steps[name]
+                steps += 1
+                # the bias corrections of Adam, in double as it computes them
+                step_size = (lrs / (1 - beta1 ** steps.double())).to(device, torch.float32)
+                correction2_sqrt = (1 - beta2 ** steps.double()).sqrt().to(device, torch.float32)
+
+                exp_avg, exp_avg_sq = self.exp_avg[name], self.exp_avg_sq[name]
+                exp_avg.lerp_(grad, 1 - beta1)
+                exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+                denom = (exp_avg_sq.sqrt() / correction2_sqrt.view(rows)).add_(self.eps)
+                parameter.data.addcdiv_(exp_avg * -step_size.view(rows), denom)
+                parameter.grad = None
+        return losses.detach().cpu().tolist()
+
+
+class StackedTrainer:
+    ''' Trains agents with the same state dimension together.
+
+    Agents get this trainer as agent.trainer, and then request training
+    instead of training in after_game. Once every agent of a group has
+    asked, the group trains one step at a time through each agent's
+    training_batches: steps with a batch for every agent of the group go
+    through its StackedModels, the others (an agent with more batches
+    than the rest) through the agent's own train_batch. Buffers are then
+    reset. Weights, optimizers and model_history checkpoints stay per
+    agent.
+
+    An agent that keeps playing while it waits for its group trains on
+    those games too. Groups of one agent train on their own. Agents of
+    a group need the same EPOCH_PER_TRAIN. flush() trains whatever is
+    still waiting, for the end of a run.
+    '''
+    groups: Dict[int, List[DeepUnoAgent]]
+    stacked: Dict[int, StackedModels]
+    pending: Set[int]
+
+    def __init__(self, agents: List[DeepUnoAgent]):
+        self.groups = {}
+        for agent in agents:
+            self.groups.setdefault(agent.state_dim, []).append(agent)
+            agent.trainer = self
+        self.stacked = {
+            state_dim: StackedModels([agent.online_nn for agent in group])
+            for state_dim, group in self.groups.items() if len(group) > 1
+        }
+        self.pending = set()
+
+    def request(self, agent: DeepUnoAgent):
+        self.pending.add(id(agent))
+        group = self.groups[agent.state_dim]
+        if all(id(member) in self.pending for member in group):
+            self.train(group)
+
+    def flush(self):
+        for group in self.groups.values():
+            waiting = [agent for agent in group if id(agent) in self.pending]
+            if len(waiting) > 0:
+                self.train(waiting)
+
+    def close(self):
+        ''' Flush, and give the agents back their own training '''
+        self.flush()
+        for group in self.groups.values():
+            for agent in group:
+                agent.trainer = None
+
+    def train(self, agents: List[DeepUnoAgent]):
+        ready = [agent for agent in agents if agent.can_train()]
+        if len(ready) == 1:
+            ready[0].train_online_nn()
+        elif len(ready) > 1:
+            group = self.groups[ready[0].state_dim]
+            steps = {id(agent): agent.training_batches() for agent in ready}
+            active = ready
+            while True:
+                batches = {}
+                for agent in active:
+                    batch = next(steps[id(agent)], None)
+                    if batch is not None:
+                        batches[id(agent)] = batch
+                active = [agent for agent in active if id(agent) in batches]
+                if len(active) == 0:
+                    break
+                if len(active) < len(group):
+                    for agent in active:
+                        agent.record_loss(agent.online_nn.train_batch(*batches[id(agent)]))
+                    continue
+                # the group's order, as its StackedModels
+                active = [agent for agent in group if id(agent) in batches]
+                # average loss per epoch, as train_batch
+                epochs = active[0].online_nn.EPOCH_PER_TRAIN
+                total_losses = [0.0] * len(active)
+                for _ in range(epochs):
+                    losses = self.stacked[active[0].state_dim].step(
+                            [batches[id(agent)] for agent in active])
+                    total_losses = [total + loss for total, loss in zip(total_losses, losses)]
+                for agent, total in zip(active, total_losses):
+                    agent.record_loss(total / epochs)
+
+        for agent in agents:
+            agent.reset_buffer()
+            self.pending.discard(id(agent))
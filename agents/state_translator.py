@@ -1,4 +1,4 @@
-from typing import Dict, Tuple, List
+from typing import Dict, NamedTuple, Tuple, List
 from enum import IntEnum
 
 '''
@@ -170,6 +170,46 @@ def translate_card(card: str)->Tuple[Color, Suit, int]:
 
     return color, suit, num
 
+class CardInfo(NamedTuple):
+    ''' Everything the state translators need to know about one card string '''
+    color: Color
+    suit: Suit
+    number: int
+    # action id, same as card_to_int
+    card_id: int
+    # strat state slots the card counts towards, relative to the hand
+    # (or discarded) section: its color (not for wilds) and its suit
+    strat_slots: Tuple[int, ...]
+    # card state slot relative to the hand (or discarded) section. Number
+    # cards all count towards slot 9 of their color, as the original
+    # index computation did.
+    card_slot: int
+    # slots set to 1 when the card is the target, relative to the target
+    # section: color onehot, suit onehot, number onehot
+    target_slots: Tuple[int, ...]
+
+def _card_info(card: str)->CardInfo:
+    color, suit, number = translate_card(card)
+    strat_slots = (4 + suit,)
+    if suit != Suit.WILD and suit != Suit.WILD_DRAW_4:
+        strat_slots = (color,) + strat_slots
+    if number != -1 and suit != Suit.NUMBER:
+        card_slot = color * 15 + number
+    else:
+        card_slot = color * 15 + suit + 9
+    target_slots = (color, 4 + suit)
+    if suit == Suit.NUMBER and number != -1:
+        target_slots += (10 + number,)
+    return CardInfo(color, suit, number, card_to_int(card),
+                    strat_slots, card_slot, target_slots)
+
+# every card string rlcard can produce (wild cards carry a color too),
+# parsed once so that translating a state is only table lookups
+CARD_TABLE: Dict[str, CardInfo] = {
+    int_to_action(card_id): _card_info(int_to_action(card_id))
+    for card_id in range(60)
+}
+
 # TODO: implement state translation for tabular
 def tabular_state_translate(state: Dict):
     pass
@@ -201,42 +241,29 @@ def strategic_state_translate(state: Dict)->List[int]:
     '''
 
     real_state = state['raw_obs']
-    strat_state = [0 for _ in range(41)]
+    strat_state = [0] * STRAT_STATE_DIM_COUNT
 
     agent_player_id = real_state['current_player']
     opp_player_id = 0 if agent_player_id == 1 else 1
 
     # agent hand
-    color_start_index = 0
-    suit_start_index = 4
     for card in real_state['hand']:
-        color, suit, _ = translate_card(card)
-        if suit != Suit.WILD and suit != Suit.WILD_DRAW_4:
-            strat_state[color_start_index + color] += 1
-        strat_state[suit_start_index + suit] += 1
+        for slot in CARD_TABLE[card].strat_slots:
+            strat_state[slot] += 1
 
     # opponent hand count
     strat_state[10] = real_state['card_num'][opp_player_id]
 
     # discarded deck
-    color_start_index = 11
-    suit_start_index = 15
+    start_index = 11
     for card in real_state['played_cards']:
-        color, suit, _ = translate_card(card)
-        if suit != Suit.WILD and suit != Suit.WILD_DRAW_4:
-            strat_state[color_start_index + color] += 1
-        strat_state[suit_start_index + suit] += 1
+        for slot in CARD_TABLE[card].strat_slots:
+            strat_state[start_index + slot] += 1
 
     # target card
-    color_start_index = 21
-    suit_start_index = 25
-    number_start_index = 31
-    color, suit, number = translate_card(real_state['target'])
-    strat_state[color_start_index + color] = 1
-    strat_state[suit_start_index + suit] = 1
-    # NOTE: For safety
-    if suit == Suit.NUMBER and number != -1:
-        strat_state[number_start_index + number] = 1
+    start_index = 21
+    for slot in CARD_TABLE[real_state['target']].target_slots:
+        strat_state[start_index + slot] = 1
     
     return strat_state
 
@@ -244,22 +271,14 @@ def card_state_translate(state: Dict):
     ''' Translate from env given state to card state:
     '''
     real_state = state['raw_obs']
-    card_state = [0 for _ in range(CARD_STATE_DIM_COUNT)]
+    card_state = [0] * CARD_STATE_DIM_COUNT
 
     agent_player_id = real_state['current_player']
     opp_player_id = 0 if agent_player_id == 1 else 1
 
     # agent hand
-    start_index = 0
     for card in real_state['hand']:
-        index = 0
-        color, suit, number = translate_card(card)
-        index += color * 15
-        if number != -1 and suit != Suit.NUMBER:
-            index += number
-        else:
-            index += suit + 9
-        card_state[start_index + index] += 1
+        card_state[CARD_TABLE[card].card_slot] += 1
 
     # opp hand count
     card_state[60] = real_state['card_num'][opp_player_id]
@@ -267,27 +286,130 @@ def card_state_translate(state: Dict):
     # discarded deck
     start_index = 61
     for card in real_state['played_cards']:
-        index = 0
-        color, suit, number = translate_card(card)
-        index += color * 15
-        if number != -1 and suit != Suit.NUMBER:
-            index += number
-        else:
-            index += suit + 9
-        card_state[start_index + index] += 1
+        card_state[start_index + CARD_TABLE[card].card_slot] += 1
 
     # target card
-    color_start_index = 121
-    suit_start_index = 125
-    number_start_index = 131
-    color, suit, number = translate_card(real_state['target'])
-    card_state[color_start_index + color] = 1
-    card_state[suit_start_index + suit] = 1
-    if suit == Suit.NUMBER and number != -1:
-        card_state[number_start_index + number] = 1
+    start_index = 121
+    for slot in CARD_TABLE[real_state['target']].target_slots:
+        card_state[start_index + slot] = 1
 
     return card_state
 
+class StateEncoder:
+    ''' Incremental state translation for the states of one game.
+
+    Produces the same vectors as strategic_state_translate (or
+    card_state_translate) without rescanning played_cards each decision:
+    discard counts are kept and only the cards played since the last call
+    are added, and the hand section is updated from the cards that left
+    and joined the hand. Both deltas are checked against the previous
+    lists, so a reshuffled discard pile (or a state from another game)
+    falls back to recounting and the result is always exact.
+
+    Owned by one agent for one game, reset() between games.
+    '''
+    dim: int
+    card_slots: Dict[str, Tuple[int, ...]]
+    OPP_INDEX: int
+    DISCARD_START: int
+    TARGET_START: int
+
+    def __init__(self, dim: int, card_slots: Dict[str, Tuple[int, ...]],
+                 opp_index: int, discard_start: int, target_start: int):
+        self.dim = dim
+        self.card_slots = card_slots
+        self.OPP_INDEX = opp_index
+        self.DISCARD_START = discard_start
+        self.TARGET_START = target_start
+
+        # absolute state slots per card string, for each section
+        self.hand_slots = card_slots
+        self.discard_slots = {
+            card: tuple(discard_start + slot for slot in slots)
+            for card, slots in card_slots.items()
+        }
+        self.target_slots = {
+            card: tuple(target_start + slot for slot in info.target_slots)
+            for card, info in CARD_TABLE.items()
+        }
+        self.reset()
+
+    def reset(self):
+        # hand and discarded sections of the state, the rest stays 0
+        self.counts = [0] * self.dim
+        self.hand: List[str] = []
+        self.played: List[str] = []
+
+    def fresh(self)->'StateEncoder':
+        ''' A new encoder with the same layout, for another game '''
+        return StateEncoder(self.dim, self.card_slots, self.OPP_INDEX,
+                            self.DISCARD_START, self.TARGET_START)
+
+    def translate(self, state: Dict)->List[int]:
+        real_state = state['raw_obs']
+        counts = self.counts
+
+        # discarded deck: count the new cards if the old ones are still there
+        discard_slots = self.discard_slots
+        played = real_state['played_cards']
+        seen = len(self.played)
+        if seen > len(played) or played[:seen] != self.played:
+            # reshuffled into the deck
+            for card in self.played:
+                for slot in discard_slots[card]:
+                    counts[slot] -= 1
+            seen = 0
+        for card in played[seen:]:
+            for slot in discard_slots[card]:
+                counts[slot] += 1
+        self.played = played
+
+        # agent hand: rlcard pops the played card and appends drawn ones
+        hand_slots = self.hand_slots
+        hand = real_state['hand']
+        old_hand = self.hand
+        kept = len(old_hand)
+        if hand[:kept] == old_hand:
+            removed, added = (), hand[kept:]
+        else:
+            for index, (card, old_card) in enumerate(zip(hand, old_hand)):
+                if card != old_card:
+                    break
+            else:
+                index = min(len(hand), kept)
+            if hand[index:kept - 1] == old_hand[index + 1:]:
+                removed, added = (old_hand[index],), hand[kept - 1:]
+            else:
+                removed, added = old_hand, hand
+        for card in removed:
+            for slot in hand_slots[card]:
+                counts[slot] -= 1
+        for card in added:
+            for slot in hand_slots[card]:
+                counts[slot] += 1
+        self.hand = hand
+
+        encoded = counts.copy()
+        opp_player_id = 0 if real_state['current_player'] == 1 else 1
+        encoded[self.OPP_INDEX] = real_state['card_num'][opp_player_id]
+        for slot in self.target_slots[real_state['target']]:
+            encoded[slot] = 1
+        return encoded
+
+def strategic_state_encoder()->StateEncoder:
+    ''' Incremental strategic_state_translate '''
+    return StateEncoder(
+            dim=STRAT_STATE_DIM_COUNT,
+            card_slots={card: info.strat_slots for card, info in CARD_TABLE.items()},
+            opp_index=10, discard_start=11, target_start=21)
+
+def card_state_encoder()->StateEncoder:
+    ''' Incremental card_state_translate '''
+    return StateEncoder(
+            dim=CARD_STATE_DIM_COUNT,
+            card_slots={card: (info.card_slot,) for card, info in CARD_TABLE.items()},
+            opp_index=60, discard_start=61, target_start=121)
+
 def strat_state_reward(
         prev_state: List[int], 
         curr_state: List[int], 
@@ -0,0 +1,144 @@
+from agents.deep_uno_agent import DeepUnoAgent
+from agents.opponent_pool import OpponentPool
+from typing import Dict, List, Optional
+import os
+import random
+import tempfile
+import threading
+import numpy as np
+import torch
+
+'''
+Full training state snapshots, to resume a run where it stopped.
+
+A snapshot holds, for every training agent, DeepUnoAgent.training_state
+(weights, optimizer, target network, replay memory, buffered games,
+epsilon, counters, win and loss statistics, the metrics bucket in
+progress), the python, numpy and torch random generator states (rlcard
+deals from the global ones), the number of rounds played, and the
+contents of the opponent pool if there is one. Restoring it into freshly
+built agents and playing the remaining rounds gives the same run as
+never stopping.
+
+Snapshots are taken between rounds, when no game is in progress. Taking
+one only copies the state; SnapshotWriter pickles and writes the copy
+from a background thread, into a temporary file renamed over the
+previous snapshot, so a crash mid-write leaves the previous one intact.
+'''
+
+# 2: training states have loss_count and the metrics bucket in progress
+SNAPSHOT_VERSION = 2
+
+def training_snapshot(rounds: int, agents: List[DeepUnoAgent],
+                      pool: Optional[OpponentPool] = None)->Dict:
+    ''' Copy of the training state after the given number of rounds '''
+    for agent in agents:
+        if agent.trainer is not None and len(agent.trainer.pending) > 0:
+            raise RuntimeError("snapshot taken while a stacked training is pending")
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'rounds': rounds,
+        'random': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+        'agents': {agent.FILE_NAME: agent.training_state() for agent in agents},
+    }
+    if pool is not None:
+        snapshot['opponent_pool'] = pool.state_dict()
+    return snapshot
+
+def restore_snapshot(snapshot: Dict, agents: List[DeepUnoAgent],
+                     pool: Optional[OpponentPool] = None)->int:
+    ''' Put a snapshot's state into agents (and pool) built as for the
+    snapshotted run; returns the number of rounds played '''
+    if snapshot['version'] != SNAPSHOT_VERSION:
+        raise ValueError(f"snapshot version {snapshot['version']}, expected {SNAPSHOT_VERSION}")
+    names = sorted(agent.FILE_NAME for agent in agents)
+    if names != sorted(snapshot['agents']):
+        raise ValueError(f"snapshot of agents {sorted(snapshot['agents'])}, training {names}")
+    if (pool is not None) != ('opponent_pool' in snapshot):
+        raise ValueError("snapshot and run differ in having an opponent pool")
+    for agent in agents:
+        agent.load_training_state(snapshot['agents'][agent.FILE_NAME])
+    if pool is not None:
+        pool.load_state_dict(snapshot['opponent_pool'])
+    random.setstate(snapshot['random'])
+    np.random.set_state(snapshot['numpy'])
+    torch.set_rng_state(snapshot['torch'])
+    return snapshot['rounds']
+
+def write_snapshot(path: str, snapshot: Dict):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            torch.save(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates files readable by the owner only
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+def load_snapshot(path: str)->Dict:
+    # our own pickles: buffers and generator states are not plain tensors
+    return torch.load(path, map_location='cpu', weights_only=False)
+
+
+class SnapshotWriter:
+    ''' Writes snapshots to path from a background thread.
+
+    save() hands over a snapshot and returns at once. While one is being
+    written the next waits, and a newer one replaces it, so at most two
+    snapshots are held in memory and the game loop never waits on the
+    disk. An error of the thread is raised by the next save or close.
+    '''
+    path: str
+    # snapshots written so far
+    written: int
+
+    def __init__(self, path: str):
+        self.path = path
+        self.written = 0
+        self._waiting: Optional[Dict] = None
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, snapshot: Dict):
+        with self._condition:
+            self._raise_error()
+            self._waiting = snapshot
+            self._condition.notify()
+
+    def close(self):
+        ''' Write the waiting snapshot, if any, and stop the thread '''
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._waiting is None and not self._closed:
+                    self._condition.wait()
+                if self._waiting is None:
+                    return
+                snapshot, self._waiting = self._waiting, None
+            try:
+                write_snapshot(self.path, snapshot)
+                self.written += 1
+            except BaseException as error:
+                self._error = error
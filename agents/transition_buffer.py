@@ -0,0 +1,165 @@
+from typing import List, Tuple
+import numpy as np
+import torch
+
+def _as_uint8(state: List[int])->np.ndarray:
+    # bytes() is the quickest way from a list of ints to uint8, and it
+    # refuses counts that don't fit
+    return np.frombuffer(bytes(state), dtype=np.uint8)
+
+# next state of a terminal transition
+TERMINAL = -1
+
+class TransitionBuffer:
+    ''' Fixed-capacity ring buffer of transitions in contiguous arrays.
+
+    Columns follow the agent's buffers: states and actions are appended
+    together (add_state), rewards, next states and dones together
+    (add_outcome), and the two halves of a row may be filled at different
+    times, as before_game and after_game do. Each half has its own count;
+    a row is complete once both are written.
+
+    A next state is always a state that was buffered too, so it is kept
+    as the row of that state in next_index (TERMINAL when the game ended)
+    rather than as a second copy of the vector.
+
+    Encoded states hold small card counts and are stored as uint8, actions
+    as int16, rewards as float32 and dones as bool. Past CAPACITY rows the
+    oldest row is overwritten. The *_rows methods return tensors sharing
+    memory with the arrays (copied only while the rows wrap around).
+    '''
+    CAPACITY: int
+    state_dim: int
+
+    states:      np.ndarray
+    actions:     np.ndarray
+    rewards:     np.ndarray
+    next_index:  np.ndarray
+    dones:       np.ndarray
+
+    def __init__(self, capacity: int, state_dim: int):
+        self.CAPACITY = capacity
+        self.state_dim = state_dim
+
+        self.states      = np.zeros((capacity, state_dim), dtype=np.uint8)
+        self.actions     = np.zeros(capacity, dtype=np.int16)
+        self.rewards     = np.zeros(capacity, dtype=np.float32)
+        self.next_index  = np.full(capacity, TERMINAL, dtype=np.int32)
+        self.dones       = np.zeros(capacity, dtype=bool)
+
+        # oldest row, rows with state/action, rows with reward/next/done
+        self.start = 0
+        self.state_count = 0
+        self.outcome_count = 0
+
+    def add_state(self, state: List[int], action: int)->int:
+        ''' Returns the row the state went to, for add_outcome '''
+        if self.state_count == self.CAPACITY:
+            self._drop_oldest()
+        row = (self.start + self.state_count) % self.CAPACITY
+        self.states[row] = _as_uint8(state)
+        self.actions[row] = action
+        self.state_count += 1
+        return row
+
+    def add_outcome(self, reward: float, next_row: int, done: bool):
+        ''' next_row: row of the next state (from add_state), or TERMINAL '''
+        if self.outcome_count == self.CAPACITY:
+            self._drop_oldest()
+        row = (self.start + self.outcome_count) % self.CAPACITY
+        self.rewards[row] = reward
+        self.next_index[row] = next_row
+        self.dones[row] = done
+        self.outcome_count += 1
+
+    def extend(self, other: 'TransitionBuffer')->np.ndarray:
+        ''' Append all rows of other, a complete buffer (as after a game),
+        keeping their next states. Returns the rows they were written to. '''
+        if other.state_count != other.outcome_count:
+            raise ValueError("can only extend from a buffer of complete rows")
+        # past CAPACITY only the newest rows fit; next states are newer
+        # than their transitions, so the kept rows stay whole
+        skipped = max(len(other) - self.CAPACITY, 0)
+        count = len(other) - skipped
+        overflow = self.state_count + count - self.CAPACITY
+        if overflow > 0:
+            self.start = (self.start + overflow) % self.CAPACITY
+            self.state_count -= overflow
+            self.outcome_count = max(self.outcome_count - overflow, 0)
+
+        first = (self.start + self.state_count) % self.CAPACITY
+        rows = (first + np.arange(count)) % self.CAPACITY
+        kept = slice(skipped, skipped + count)
+        self.states[rows] = other.state_rows()[kept].numpy()
+        self.actions[rows] = other.action_rows()[kept].numpy()
+        self.rewards[rows] = other.reward_rows()[kept].numpy()
+        self.dones[rows] = other.done_rows()[kept].numpy()
+        next_rows = (first + other.next_positions()[kept].numpy() - skipped) % self.CAPACITY
+        terminal = other._rows(other.next_index, other.outcome_count)[kept].numpy() == TERMINAL
+        self.next_index[rows] = np.where(terminal, TERMINAL, next_rows)
+        self.state_count += count
+        self.outcome_count += count
+        return rows
+
+    def gather(self, rows: np.ndarray)->Tuple[torch.Tensor, ...]:
+        ''' states, actions, rewards, next states (zeros when terminal) and
+        dones of the given rows, as new tensors '''
+        next_index = self.next_index[rows]
+        next_states = self.states[np.where(next_index == TERMINAL, rows, next_index)]
+        next_states[next_index == TERMINAL] = 0
+        return (torch.from_numpy(self.states[rows]),
+                torch.from_numpy(self.actions[rows]),
+                torch.from_numpy(self.rewards[rows]),
+                torch.from_numpy(next_states),
+                torch.from_numpy(self.dones[rows]))
+
+    def _drop_oldest(self):
+        self.start = (self.start + 1) % self.CAPACITY
+        self.state_count = max(self.state_count - 1, 0)
+        self.outcome_count = max(self.outcome_count - 1, 0)
+
+    def clear(self):
+        self.start = 0
+        self.state_count = 0
+        self.outcome_count = 0
+
+    def __len__(self)->int:
+        ''' Number of complete rows '''
+        return min(self.state_count, self.outcome_count)
+
+    def _rows(self, array: np.ndarray, count: int)->torch.Tensor:
+        end = self.start + count
+        if end <= self.CAPACITY:
+            return torch.from_numpy(array[self.start:end])
+        return torch.from_numpy(np.concatenate((array[self.start:], array[:end - self.CAPACITY])))
+
+    def state_rows(self)->torch.Tensor:
+        return self._rows(self.states, self.state_count)
+
+    def action_rows(self)->torch.Tensor:
+        return self._rows(self.actions, self.state_count)
+
+    def reward_rows(self)->torch.Tensor:
+        return self._rows(self.rewards, self.outcome_count)
+
+    def next_positions(self)->torch.Tensor:
+        ''' Position of each outcome's next state in state_rows(), 0 for
+        terminal transitions (mask those with done_rows()) '''
+        next_index = self._rows(self.next_index, self.outcome_count).numpy()
+        positions = (next_index - self.start) % self.CAPACITY
+        positions[next_index == TERMINAL] = 0
+        return torch.from_numpy(positions.astype(np.int64))
+
+    def next_state_rows(self)->torch.Tensor:
+        ''' Next states gathered into a new tensor, zeros when terminal '''
+        next_states = self.state_rows()[self.next_positions()]
+        next_index = self._rows(self.next_index, self.outcome_count)
+        next_states[next_index == TERMINAL] = 0
+        return next_states
+
+    def done_rows(self)->torch.Tensor:
+        return self._rows(self.dones, self.outcome_count)
+
+    def nbytes(self)->int:
+        return (self.states.nbytes + self.actions.nbytes + self.rewards.nbytes
+                + self.next_index.nbytes + self.dones.nbytes)
@@ -1,9 +1,34 @@
 #!/usr/bin/env python3
 
+''' Learning curves of the statistics/win_* files.
+
+Usage: ./analysis.py [--full] [--workers N]
+
+Incremental: the parsed and derived columns of each file are cached in
+analysis/.cache/<agent>.npz. The statistics files only grow (see
+agents/metrics_writer.py), so a file whose cached part is unchanged is
+only parsed from where the cache stopped, and the rolling columns are
+only computed for the new buckets (plus the ROLLING_WINDOW - 1 before
+them they depend on). A file that was rewritten, or a change of the
+config below, recomputes that file from scratch; --full ignores the
+cache altogether.
+
+Each figure has a fingerprint of everything it is drawn from, and is
+only rendered again when that changed or its PNG is missing. Figures
+left to render are drawn in a process pool. Every stage prints its time.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+import argparse
+import hashlib
+import io
+import json
 import math
+import os
+import time
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 # ----------------------------------------------------------------------
 # Config
@@ -20,97 +45,173 @@ FILES = {
     "Q-Strat":  "statistics/win_qstrat",
 }
 
+OUTPUT_DIR = "analysis"
+CACHE_DIR = os.path.join(OUTPUT_DIR, ".cache")
+FINGERPRINTS = os.path.join(CACHE_DIR, "figures.json")
+# bytes before the parsed end of a file compared to the cache, to tell
+# an appended file from a rewritten one
+CHECK_BYTES = 256
+
+CONFIG = {
+    "bucket_size_games": BUCKET_SIZE_GAMES,
+    "rolling_window": ROLLING_WINDOW,
+    "ci_z": CI_Z,
+}
+
+# columns cached per agent, by bucket
+COLUMNS = ["bucket", "wins", "rolling_win_rate_pct", "roll_wr", "roll_ci_low", "roll_ci_high"]
+
+def slugify(name: str) -> str:
+    return name.lower().replace("-", "_").replace(" ", "_")
+
 # ----------------------------------------------------------------------
-# Loading and preprocessing
+# Loading and preprocessing, incremental
 # ----------------------------------------------------------------------
-def load_agent_df(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+def _cache_path(name: str) -> str:
+    return os.path.join(CACHE_DIR, f"{slugify(name)}.npz")
+
+def load_cache(name: str) -> Tuple[Dict[str, np.ndarray], Dict]:
+    path = _cache_path(name)
+    if not os.path.exists(path):
+        return {}, {}
+    with np.load(path) as saved:
+        columns = {column: saved[column] for column in COLUMNS}
+        meta = json.loads(str(saved["meta"]))
+    return columns, meta
+
+def save_cache(name: str, columns: Dict[str, np.ndarray], meta: Dict):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temporary = _cache_path(name) + ".tmp.npz"
+    np.savez(temporary, meta=np.array(json.dumps(meta)), **columns)
+    os.replace(temporary, _cache_path(name))
+
+def _parse_rows(lines: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    if len(lines) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    df = pd.read_csv(io.StringIO("\n".join(lines)), header=None, usecols=[0, 1])
+    return df[0].to_numpy(dtype=np.int64), df[1].to_numpy(dtype=np.int64)
+
+def read_new_rows(path: str, meta: Dict) -> Tuple[bool, np.ndarray, np.ndarray, Dict]:
+    ''' (appended, buckets, wins, meta): the rows after the cached part of
+    the file if it was only appended to, else all of its rows '''
+    with open(path, "rb") as f:
+        data = f.read()
+    # complete lines only, a training run may be appending to the file
+    end = data.rfind(b"\n") + 1
+    offset = meta.get("offset", 0)
+    appended = (meta.get("config") == CONFIG and 0 < offset <= end
+                and data[max(offset - CHECK_BYTES, 0):offset].hex() == meta.get("check"))
+    # rows from this one read, so the offset stored below is where they end
+    if appended:
+        lines = data[offset:end].decode().splitlines()
+    else:
+        # the header line, then rows
+        lines = data[:end].decode().splitlines()[1:]
+    buckets, wins = _parse_rows(lines)
+    new_meta = {
+        "config": CONFIG,
+        "offset": end,
+        "check": data[max(end - CHECK_BYTES, 0):end].hex(),
+    }
+    return appended, buckets, wins, new_meta
+
+def derive(wins: np.ndarray) -> Dict[str, np.ndarray]:
+    ''' Rolling columns of every bucket of wins '''
+    p = pd.Series(wins / BUCKET_SIZE_GAMES)
+    win_rate_pct = p * 100.0
+
+    # Rolling mean for smoother learning curves
+    rolling_win_rate_pct = win_rate_pct.rolling(window=ROLLING_WINDOW, min_periods=1).mean()
 
+    # rolling mean & std over buckets, full windows only
+    roll_mean_p = p.rolling(ROLLING_WINDOW, min_periods=ROLLING_WINDOW).mean()
+    roll_std_p = p.rolling(ROLLING_WINDOW, min_periods=ROLLING_WINDOW).std(ddof=1)
+    # standard error of the mean for a window of ROLLING_WINDOW buckets
+    roll_se = roll_std_p / np.sqrt(ROLLING_WINDOW)
+    return {
+        "rolling_win_rate_pct": rolling_win_rate_pct.to_numpy(),
+        "roll_wr": (roll_mean_p * 100).to_numpy(),
+        "roll_ci_low": ((roll_mean_p - CI_Z * roll_se) * 100).to_numpy(),
+        "roll_ci_high": ((roll_mean_p + CI_Z * roll_se) * 100).to_numpy(),
+    }
+
+def update_columns(name: str, path: str, full: bool) -> Tuple[Dict[str, np.ndarray], int]:
+    ''' Cached columns of an agent brought up to date with its file, and
+    the number of buckets parsed for it '''
+    columns, meta = ({}, {}) if full else load_cache(name)
+    appended, buckets, wins, meta = read_new_rows(path, meta)
+    if not appended:
+        columns = {column: np.zeros(0) for column in COLUMNS}
+    old_count = len(columns["bucket"])
+    if len(buckets) > 0:
+        all_wins = np.concatenate([columns["wins"], wins]).astype(np.int64)
+        # the new buckets' windows reach ROLLING_WINDOW - 1 buckets back
+        start = max(old_count - (ROLLING_WINDOW - 1), 0)
+        derived = derive(all_wins[start:])
+        columns = {
+            "bucket": np.concatenate([columns["bucket"], buckets]).astype(np.int64),
+            "wins": all_wins,
+            **{column: np.concatenate([columns[column], values[old_count - start:]])
+               for column, values in derived.items()},
+        }
+    save_cache(name, columns, meta)
+    return columns, len(buckets)
+
+def to_frame(columns: Dict[str, np.ndarray]) -> pd.DataFrame:
+    ''' The per-bucket columns analysis has always used, from the cached ones '''
+    df = pd.DataFrame(columns)
     # games_seen: cumulative eval games up to that bucket
     df["games_seen"] = (df["bucket"] + 1) * BUCKET_SIZE_GAMES
-
     # p = win probability per bucket (0–1); win_rate is percent in file
     df["p"] = df["wins"] / BUCKET_SIZE_GAMES
     df["win_rate_pct"] = df["p"] * 100.0
-
     # Binomial normal-approximation CI per bucket
     df["se"] = np.sqrt(df["p"] * (1.0 - df["p"]) / BUCKET_SIZE_GAMES)
     df["ci_low_pct"] = (df["p"] - CI_Z * df["se"]) * 100.0
     df["ci_high_pct"] = (df["p"] + CI_Z * df["se"]) * 100.0
-
-    # Rolling mean for smoother learning curves
-    df["rolling_win_rate_pct"] = df["win_rate_pct"].rolling(
-        window=ROLLING_WINDOW,
-        min_periods=1
-    ).mean()
-
     return df
 
-results = {name: load_agent_df(path) for name, path in FILES.items()}
-
 # ----------------------------------------------------------------------
-# Per-model plots for each category
+# Figures, rendered in the pool's processes
 # ----------------------------------------------------------------------
-
-def slugify(name: str) -> str:
-    return name.lower().replace("-", "_").replace(" ", "_")
+def _figure():
+    # imported only where figures are rendered, without a display
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    plt.figure()
+    return plt
 
 # 1) Raw win-rate curves (per model)
-for name, df in results.items():
-    s = slugify(name)
-    plt.figure()
-    plt.plot(df["bucket"], df["win_rate_pct"], label=name)
+def plot_raw(output: str, name: str, bucket: np.ndarray, win_rate_pct: np.ndarray):
+    plt = _figure()
+    plt.plot(bucket, win_rate_pct, label=name)
     plt.axhline(50, linestyle="--")
     plt.xlabel("Training bucket")
     plt.ylabel("Win rate (%)")
     plt.title(f"{name} – Raw Win Rate per Bucket")
     plt.legend()
     plt.tight_layout()
-    plt.savefig(f"analysis/raw_{s}.png", dpi=300)
+    plt.savefig(output, dpi=300)
     plt.close()
 
 # 2) Smoothed curves (per model)
-for name, df in results.items():
-    s = slugify(name)
-    plt.figure()
-    plt.plot(df["games_seen"], df["rolling_win_rate_pct"], label=name)
+def plot_smoothed(output: str, name: str, games_seen: np.ndarray, rolling_win_rate_pct: np.ndarray):
+    plt = _figure()
+    plt.plot(games_seen, rolling_win_rate_pct, label=name)
     plt.axhline(50, linestyle="--")
     plt.xlabel("Games seen")
     plt.ylabel(f"Rolling mean win rate (%) (window={ROLLING_WINDOW})")
     plt.title(f"{name} – Smoothed Learning Curve")
     plt.legend()
     plt.tight_layout()
-    plt.savefig(f"analysis/smoothed_{s}.png", dpi=300)
+    plt.savefig(output, dpi=300)
     plt.close()
 
 # 3) Win-rate with CI band (per model)
-for name, df in results.items():
-    d = df.copy()
-
-    # --- per-bucket probability ---
-    p = d["win_rate_pct"] / 100.0   # turn % into probability
-
-    # --- rolling mean & std over buckets ---
-    roll_mean_p = p.rolling(ROLLING_WINDOW, min_periods=ROLLING_WINDOW).mean()
-    roll_std_p  = p.rolling(ROLLING_WINDOW, min_periods=ROLLING_WINDOW).std(ddof=1)
-
-    # standard error of the mean for a window of ROLL_WINDOW buckets
-    roll_se = roll_std_p / np.sqrt(ROLLING_WINDOW)
-
-    # --- rolling CI in % ---
-    d["roll_wr"]      = roll_mean_p * 100
-    d["roll_ci_low"]  = (roll_mean_p - CI_Z * roll_se) * 100
-    d["roll_ci_high"] = (roll_mean_p + CI_Z * roll_se) * 100
-
-    # drop the prefix part where the window is not full
-    m = d["roll_wr"].notna()
-    x = d.loc[m, "games_seen"]
-    y = d.loc[m, "roll_wr"]
-    lo = d.loc[m, "roll_ci_low"]
-    hi = d.loc[m, "roll_ci_high"]
-
-    # --- plot rolling WR with rolling CI band ---
-    plt.figure()
+def plot_rolling_ci(output: str, name: str, x: np.ndarray, y: np.ndarray,
+                    lo: np.ndarray, hi: np.ndarray):
+    plt = _figure()
     plt.plot(x, y, label=name)
     plt.fill_between(x, lo, hi, alpha=0.2)
     plt.axhline(50.0, linestyle="--", linewidth=1)  # baseline
@@ -124,47 +225,137 @@ for name, df in results.items():
 
     plt.legend()
     plt.tight_layout()
-    s = slugify(name)
-    plt.savefig(f"analysis/rolling_ci_{s}.png", dpi=300)
+    plt.savefig(output, dpi=300)
     plt.close()
 
+# 4) Final performance bar chart (all models together)
+def plot_final(output: str, names: List[str], means: List[float],
+               ci_lows: List[float], ci_highs: List[float]):
+    plt = _figure()
+    x = np.arange(len(names))
+    yerr = [np.array(means) - np.array(ci_lows), np.array(ci_highs) - np.array(means)]
+    plt.bar(x, means, yerr=yerr)
+    plt.xticks(x, names)
+    plt.ylabel("Win rate (%) (final segment)")
+    plt.title(f"Final Performance (Last {TAIL_BUCKETS} Buckets)")
+    plt.ylim(47, 53)
+    plt.tight_layout()
+    plt.savefig(output, dpi=300)
+    plt.close()
+
+def _render(figure: Tuple) -> Tuple[str, float]:
+    ''' (plot function, output, args) to (output, seconds) '''
+    start = time.perf_counter()
+    plot, output, args = figure
+    plot(output, *args)
+    return output, time.perf_counter() - start
+
+def fingerprint(figure: Tuple) -> str:
+    ''' Hash of a figure's kind, config and data '''
+    plot, output, args = figure
+    digest = hashlib.sha256(f"{plot.__name__}:{output}:{json.dumps(CONFIG)}:{TAIL_BUCKETS}".encode())
+    for arg in args:
+        if isinstance(arg, np.ndarray):
+            digest.update(np.ascontiguousarray(arg, dtype=np.float64).tobytes())
+        else:
+            digest.update(repr(arg).encode())
+    return digest.hexdigest()
+
+def figures(results: Dict[str, pd.DataFrame]) -> Tuple[List[Tuple], List[Tuple[str, float, float, float]]]:
+    ''' Every figure as (plot function, output, args), and the summary
+    rows (name, mean, CI low, CI high) of the final segment '''
+    figures = []
+    for name, df in results.items():
+        s = slugify(name)
+        figures.append((plot_raw, f"{OUTPUT_DIR}/raw_{s}.png",
+                        (name, df["bucket"].to_numpy(), df["win_rate_pct"].to_numpy())))
+        figures.append((plot_smoothed, f"{OUTPUT_DIR}/smoothed_{s}.png",
+                        (name, df["games_seen"].to_numpy(), df["rolling_win_rate_pct"].to_numpy())))
+        # drop the prefix part where the window is not full
+        m = df["roll_wr"].notna()
+        figures.append((plot_rolling_ci, f"{OUTPUT_DIR}/rolling_ci_{s}.png",
+                        (name, df.loc[m, "games_seen"].to_numpy(), df.loc[m, "roll_wr"].to_numpy(),
+                         df.loc[m, "roll_ci_low"].to_numpy(), df.loc[m, "roll_ci_high"].to_numpy())))
+
+    summary = []
+    for name, df in results.items():
+        tail = df.tail(TAIL_BUCKETS)
+        mean_wr = tail["win_rate_pct"].mean()
+        mean_p = tail["p"].mean()
+
+        se_mean = math.sqrt(mean_p * (1 - mean_p) / (BUCKET_SIZE_GAMES * TAIL_BUCKETS))
+        ci_low = (mean_p - CI_Z * se_mean) * 100
+        ci_high = (mean_p + CI_Z * se_mean) * 100
+        summary.append((name, mean_wr, ci_low, ci_high))
+    figures.append((plot_final, f"{OUTPUT_DIR}/final_performance.png",
+                    ([row[0] for row in summary], [row[1] for row in summary],
+                     [row[2] for row in summary], [row[3] for row in summary])))
+    return figures, summary
 
 # ----------------------------------------------------------------------
-# Final performance bar chart (still all models together)
+# Pipeline
 # ----------------------------------------------------------------------
-names = []
-means = []
-ci_lows = []
-ci_highs = []
-
-for name, df in results.items():
-    tail = df.tail(TAIL_BUCKETS)
-    mean_wr = tail["win_rate_pct"].mean()
-    mean_p = tail["p"].mean()
-
-    se_mean = math.sqrt(mean_p * (1 - mean_p) / (BUCKET_SIZE_GAMES * TAIL_BUCKETS))
-    ci_low = (mean_p - CI_Z * se_mean) * 100
-    ci_high = (mean_p + CI_Z * se_mean) * 100
-
-    names.append(name)
-    means.append(mean_wr)
-    ci_lows.append(ci_low)
-    ci_highs.append(ci_high)
-
-x = np.arange(len(names))
-yerr = [np.array(means) - np.array(ci_lows), np.array(ci_highs) - np.array(means)]
-
-plt.figure()
-plt.bar(x, means, yerr=yerr)
-plt.xticks(x, names)
-plt.ylabel("Win rate (%) (final segment)")
-plt.title(f"Final Performance (Last {TAIL_BUCKETS} Buckets)")
-plt.ylim(47, 53)
-plt.tight_layout()
-plt.savefig("analysis/final_performance.png", dpi=300)
-plt.close()
-
-print(f"Summary over last {TAIL_BUCKETS} buckets:")
-for i, name in enumerate(names):
-    print(f"{name}: {means[i]:.2f}%   CI ≈ [{ci_lows[i]:.2f}%, {ci_highs[i]:.2f}%]")
-
+class StageTimer:
+    ''' Prints the time of each stage as it ends '''
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+
+    def stage(self, name: str, detail: str = ""):
+        now = time.perf_counter()
+        print(f"[{now - self.last:7.3f} s] {name}" + (f": {detail}" if detail else ""))
+        self.last = now
+
+    def total(self):
+        print(f"[{time.perf_counter() - self.start:7.3f} s] total")
+
+def main(full: bool, workers: int):
+    timer = StageTimer()
+    results = {}
+    parsed = {}
+    for name, path in FILES.items():
+        columns, parsed[name] = update_columns(name, path, full)
+        results[name] = to_frame(columns)
+    timer.stage("load and derive", ", ".join(f"{name} +{count}" for name, count in parsed.items())
+                + " buckets parsed")
+
+    all_figures, summary = figures(results)
+    saved = {}
+    if not full and os.path.exists(FINGERPRINTS):
+        with open(FINGERPRINTS) as f:
+            saved = json.load(f)
+    fingerprints = {figure[1]: fingerprint(figure) for figure in all_figures}
+    stale = [figure for figure in all_figures
+             if saved.get(figure[1]) != fingerprints[figure[1]] or not os.path.exists(figure[1])]
+    timer.stage("fingerprint", f"{len(stale)} of {len(all_figures)} figures to render")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    if workers <= 1 or len(stale) <= 1:
+        rendered = [_render(figure) for figure in stale]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(stale))) as pool:
+            rendered = list(pool.map(_render, stale))
+    # only figures actually written are marked up to date
+    for output, _ in rendered:
+        saved[output] = fingerprints[output]
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(FINGERPRINTS, "w") as f:
+        json.dump(saved, f, indent=1)
+    timer.stage("render", f"{len(rendered)} figures, {workers} workers"
+                + (f", slowest {max(seconds for _, seconds in rendered):.2f} s" if rendered else ""))
+
+    print(f"Summary over last {TAIL_BUCKETS} buckets:")
+    for name, mean, ci_low, ci_high in summary:
+        print(f"{name}: {mean:.2f}%   CI ≈ [{ci_low:.2f}%, {ci_high:.2f}%]")
+    timer.total()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the cache: parse every file and render every figure")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="processes rendering figures, 1 to render in this process")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.full, args.workers)
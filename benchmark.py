@@ -0,0 +1,1166 @@
+#!/usr/bin/env python3
+
+''' Benchmarks and engine checks.
+
+Usage: ./benchmark.py <name> [arguments]
+    engine      vec_env games/sec with random players at N=1, 64, 1024,
+                against rlcard through env.play_game
+    parity      step vec_env alongside rlcard and compare legal actions,
+                encodings and the resulting game state at every decision
+    broker      per-decision inference cost of _greedy_step against
+                InferenceBroker batches of 1, 64 and 256 decisions, for
+                the four agents
+    encode      per-state cost of the state translators on the corpus,
+                parsing every card string against the CARD_TABLE lookups
+    incremental random games (and games interleaved into one encoder)
+                through StateEncoder against the state translators, and
+                the per-state cost of both
+    decision    per-decision latency of a greedy step for the four agents
+                on the corpus, encoding twice into fresh tensors against
+                the single encode path
+    buffer      memory, append and tensor conversion cost of the agents'
+                transition buffers filled from the corpus, python lists
+                against TransitionBuffer
+    replay      PrioritizedReplay with 1M card transitions: memory, and
+                the cost of sampling a batch and updating its priorities,
+                against an O(n) np.random.choice draw
+    returns     Monte Carlo returns of 10k, 100k and 1M transitions, the
+                python loop against discounted_returns
+    stacked     one training step of the card and the strat model pairs,
+                train_batch per model against StackedModels.step per state
+                dimension, at replay and episode buffer batch sizes
+    compiled    forward latency of a card and a strat network for 1, 64
+                and 256 states, eager against CompiledInference, and
+                that the compiled outputs follow training and a reload
+    numpy       latest checkpoint of each agent exported for the torch-free
+                runtime: process startup to a ready agent, torch frozen
+                agent against NumpyAgent (and that torch stays unloaded),
+                then per-decision cost and action agreement
+    manifest    latest checkpoint lookup in model_history, listing the
+                directory against a manifest (opened cold and warm), and
+                loading the checkpoints through the manifest (memory-mapped,
+                or from their archive) against torch.load of the files
+    archive     model_history packed into one CheckpointArchive per agent
+                with each encoding: size, and the time to load a random
+                checkpoint, against the checkpoint files
+    snapshot    training snapshot of the four agents with full replay
+                memories: time the game loop is held, saving with
+                torch.save in the loop against copying for SnapshotWriter,
+                and the rounds/sec of training while it writes
+    profile     training rounds/sec of the four agents with agents.profiler
+                off, on, and switched off again, then its breakdown
+    record [games] [seed]
+                play games (100) between the rule bot and the random bot
+                and record every decision into CORPUS_PATH, the corpus
+                the other benchmarks measure on (committed, so runs on
+                any tree measure the same states)
+    suite [repeats] [name ...]
+                time the SUITE benchmarks (all, or the names) on the
+                corpus and write the results as JSON to RESULTS_PATH
+    baseline [repeats] [name ...]
+                the same into BASELINE_PATH
+    compare [results] [baseline] [threshold]
+                compare results (RESULTS_PATH) against the baseline
+                (BASELINE_PATH), exits 1 if a benchmark is slower than
+                the baseline by more than threshold (0.10)
+
+The suite runs on the corpus states in game order, each encoder seeing
+the decisions of one player of one game like during play, with networks
+initialised from a fixed torch seed. Game benchmarks seed the global
+generators rlcard deals from, so they play the same games every run.
+Each benchmark is set up and timed repeats (5) times after a warm-up,
+the median is kept. Times are per operation (lower is better), games/sec
+rates per second (higher is better).
+'''
+
+from typing import Callable, Dict, List, Optional, Tuple
+import copy
+import gzip
+import hashlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import sys
+import time
+import tracemalloc
+import numpy as np
+import rlcard
+import torch
+from rlcard.agents.random_agent import RandomAgent
+
+import env
+from agents import profiler
+from agents.deep_uno_agent import DeepUnoAgent
+from agents.inference_broker import InferenceBroker
+from agents.transition_buffer import TransitionBuffer, TERMINAL
+from agents.prioritized_replay import PrioritizedReplay
+from agents.deepmc import discounted_returns
+from agents.deeprl_nn import DeepRL_NN
+from agents.compiled_inference import CompiledInference
+from agents.numpy_runtime import NumpyPolicy
+from agents.checkpoint_manifest import CheckpointManifest, ARCHIVE_SUFFIX, checkpoint_name, load_state_dict
+from agents.checkpoint_archive import CheckpointArchive, ENCODINGS
+from agents.stacked_training import StackedModels
+from agents.training_snapshot import SnapshotWriter, training_snapshot, write_snapshot
+from agents.deepq_card import DeepQCardAgent
+from agents.deepq_strat import DeepQStratAgent
+from agents.deepmc_card import DeepMCCardAgent
+from agents.deepmc_strat import DeepMCStratAgent
+from vec_env import VecUnoEnv, RandomPolicy, IS_WILD_CARD, CARD_TRAIT, ACTION_COUNT
+from agents.state_translator import card_to_int, int_to_action, strategic_state_translate, card_state_translate
+from agents.state_translator import translate_card, Suit, STRAT_STATE_DIM_COUNT, CARD_STATE_DIM_COUNT
+from agents.state_translator import strategic_state_encoder, card_state_encoder
+
+CORPUS_VERSION = 1
+CORPUS_PATH = os.path.join("benchmarks", "corpus.json.gz")
+RESULTS_PATH = os.path.join("benchmarks", "results.json")
+BASELINE_PATH = os.path.join("benchmarks", "baseline.json")
+# decisions of one game: (player, state, action)
+Game = List[Tuple[int, Dict, int]]
+
+# ------------------------------------------------------
+# Corpus
+# ------------------------------------------------------
+
+class RecordingAgent:
+    ''' Plays as agent and records the states it decides on '''
+    def __init__(self, agent, player: int, game: Game):
+        self.agent = agent
+        self.player = player
+        self.game = game
+        self.use_raw = agent.use_raw
+
+    def step(self, state):
+        played = self.agent.step(state)
+        action = played
+        if isinstance(action, str):
+            action = 60 if action == 'draw' else card_to_int(action)
+        self.game.append((self.player, state, int(action)))
+        return played
+
+    def eval_step(self, state):
+        return self.step(state), []
+
+def record_corpus(game_count: int = 100, seed: int = 0, path: str = CORPUS_PATH):
+    game_count, seed = int(game_count), int(seed)
+    random.seed(seed)
+    np.random.seed(seed)
+    bots = [env.get_rule_based_agent(), RandomAgent(61)]
+    games = []
+    for game_idx in range(game_count):
+        decisions: Game = []
+        # both seatings, both bots on each side
+        seated = bots if game_idx % 2 == 0 else bots[::-1]
+        uno_env = rlcard.make('uno')
+        uno_env.set_agents([RecordingAgent(agent, player, decisions) for player, agent in enumerate(seated)])
+        _, payoffs = uno_env.run(is_training=False)
+        games.append({
+            'decisions': [{'player': player,
+                           'raw_obs': state['raw_obs'],
+                           'legal_actions': list(state['legal_actions']),
+                           'action': action}
+                          for player, state, action in decisions],
+            'payoffs': [int(payoff) for payoff in payoffs],
+        })
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    corpus = {'version': CORPUS_VERSION, 'seed': seed, 'games': games}
+    # mtime 0: the same games always give the same file
+    with open(path, 'wb') as f, gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+        gz.write(json.dumps(corpus, sort_keys=True).encode())
+    states = sum(len(game['decisions']) for game in games)
+    print(f"recorded {states} states of {game_count} games into {path} ({os.path.getsize(path)} bytes)")
+
+class Corpus:
+    ''' The recorded games, with states as rlcard gives them to agents '''
+    games: List[Game]
+    payoffs: List[List[int]]
+    sha256: str
+
+    def __init__(self, path: str = CORPUS_PATH):
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        corpus = json.loads(gzip.decompress(data))
+        if corpus['version'] != CORPUS_VERSION:
+            raise ValueError(f"{path}: corpus version {corpus['version']}, expected {CORPUS_VERSION}")
+        self.games = []
+        self.payoffs = []
+        for game in corpus['games']:
+            self.games.append([
+                (decision['player'],
+                 {'raw_obs': decision['raw_obs'],
+                  'legal_actions': decision['legal_actions']},
+                 decision['action'])
+                for decision in game['decisions']])
+            self.payoffs.append(game['payoffs'])
+
+    def states(self)->List[Dict]:
+        return [state for game in self.games for _, state, _ in game]
+
+    def player_games(self)->List[List[List[Dict]]]:
+        ''' Per game, the states each player saw '''
+        return [[[state for player, state, _ in game if player == seat] for seat in (0, 1)]
+                for game in self.games]
+
+# ------------------------------------------------------
+# Benchmarks and checks
+# ------------------------------------------------------
+
+def bench_engine():
+    rng = np.random.default_rng(0)
+    for num_envs in (1, 64, 1024):
+        engine = VecUnoEnv(num_envs, seed=0)
+        policy = RandomPolicy(rng)
+        target_games = max(500, 4 * num_envs)
+        finished_games = 0
+        start = time.perf_counter()
+        while finished_games < target_games:
+            mask = engine.legal_mask()
+            engine.step(policy.act(engine, np.arange(num_envs), mask))
+            finished = np.flatnonzero(engine.done)
+            finished_games += len(finished)
+            engine.reset(finished)
+        elapsed = time.perf_counter() - start
+        print(f"vec_env N={num_envs:<5} {finished_games / elapsed:10.1f} games/sec")
+
+    randbot = RandomAgent(61)
+    game_count = 500
+    start = time.perf_counter()
+    for _ in range(game_count):
+        env.play_game([randbot, randbot], is_training=False)
+    elapsed = time.perf_counter() - start
+    print(f"rlcard play_game {game_count / elapsed:10.1f} games/sec")
+
+def _load_rlcard_game(engine: VecUnoEnv, slot: int, game):
+    ''' Copy an rlcard uno game into one engine slot '''
+    # card.str is the color a card was created with, card.color the current one
+    cards = [card for player in game.players for card in player.hand]
+    cards += game.dealer.deck + game.round.played_cards
+    for card in cards:
+        engine.color[slot, card_to_int(card.str)] = 'rgby'.index(card.color)
+
+    engine.hands[slot] = 0
+    for player_id, player in enumerate(game.players):
+        for card in player.hand:
+            engine.hands[slot, player_id, card_to_int(card.str)] += 1
+    deck = [card_to_int(card.str) for card in game.dealer.deck]
+    engine.deck[slot, :len(deck)] = deck
+    engine.deck_len[slot] = len(deck)
+    engine.played[slot] = 0
+    for card in game.round.played_cards:
+        engine.played[slot, card_to_int(card.str)] += 1
+    engine.target[slot] = card_to_int(game.round.target.str)
+    engine.current[slot] = game.round.current_player
+    engine.done[slot] = game.round.is_over
+    engine.winner[slot] = game.round.winner[0] if game.round.winner else -1
+
+def _merge_wild_colors(counts: np.ndarray)->np.ndarray:
+    ''' Fold wild cards of every color together, their color is random '''
+    counts = counts.reshape(-1, 4, 15).copy()
+    counts[:, 0, 13:] = counts[:, :, 13:].sum(axis=1)
+    counts[:, 1:, 13:] = 0
+    return counts.reshape(counts.shape[0], -1)
+
+def check_parity(game_count: int = 300):
+    game_count = int(game_count)
+    rng = np.random.default_rng(0)
+    uno = rlcard.make('uno', config={'allow_raw_data': True})
+    engine = VecUnoEnv(1, seed=0)
+    checks = {'legal': 0, 'strat': 0, 'card': 0, 'transition': 0}
+    mismatches = {name: 0 for name in checks}
+
+    for _ in range(game_count):
+        state, _ = uno.init_game()
+        while not uno.is_over():
+            game = uno.game
+            _load_rlcard_game(engine, 0, game)
+
+            expected_mask = np.zeros(ACTION_COUNT, dtype=bool)
+            expected_mask[state['legal_actions']] = True
+            mask = engine.legal_mask()[0]
+            checks['legal'] += 1
+            mismatches['legal'] += int(not np.array_equal(mask, expected_mask))
+
+            checks['strat'] += 1
+            mismatches['strat'] += int(not np.array_equal(
+                engine.strategic_states()[0], strategic_state_translate(state)))
+            checks['card'] += 1
+            mismatches['card'] += int(not np.array_equal(
+                engine.card_states()[0], card_state_translate(state)))
+
+            action = int(rng.choice(state['legal_actions']))
+            engine.step(np.array([action]))
+            state, _ = uno.step(int_to_action(action), raw_action=True)
+
+            # the engine is compared up to the color of wild cards, which
+            # both sides pick at random
+            expected = VecUnoEnv(1)
+            _load_rlcard_game(expected, 0, uno.game)
+            target, expected_target = engine.target[0], expected.target[0]
+            same_target = (target == expected_target
+                           or (IS_WILD_CARD[target] and CARD_TRAIT[target] == CARD_TRAIT[expected_target]))
+            same = (same_target
+                    and engine.current[0] == expected.current[0]
+                    and engine.deck_len[0] == expected.deck_len[0]
+                    and engine.done[0] == expected.done[0]
+                    and engine.winner[0] == expected.winner[0]
+                    and np.array_equal(_merge_wild_colors(engine.hands[0]), _merge_wild_colors(expected.hands[0]))
+                    and np.array_equal(_merge_wild_colors(engine.played), _merge_wild_colors(expected.played)))
+            checks['transition'] += 1
+            mismatches['transition'] += int(not same)
+
+    for name in checks:
+        print(f"{name:<10} {checks[name] - mismatches[name]}/{checks[name]} match")
+    return all(count == 0 for count in mismatches.values())
+
+def _sample_states(count: int):
+    ''' rlcard states seen by random players '''
+    uno = rlcard.make('uno', config={'allow_raw_data': True})
+    states = []
+    while len(states) < count:
+        state, _ = uno.init_game()
+        while not uno.is_over() and len(states) < count:
+            states.append(state)
+            state, _ = uno.step(int(np.random.choice(state['legal_actions'])))
+    return states
+
+def bench_broker():
+    states = _sample_states(1024)
+    for agent in (DeepQCardAgent(), DeepQStratAgent(), DeepMCCardAgent(), DeepMCStratAgent()):
+        start = time.perf_counter()
+        for state in states:
+            agent._greedy_step(state)
+        single = (time.perf_counter() - start) / len(states)
+
+        start = time.perf_counter()
+        encoded = [agent.state_translation(state) for state in states]
+        encode = (time.perf_counter() - start) / len(states)
+
+        # _greedy_step encodes the state itself, the broker gets encoded states
+        line = (f"{type(agent).__name__:<18} us/decision: encode {encode * 1e6:6.1f}"
+                f" | _greedy_step-encode {(single - encode) * 1e6:6.1f}")
+        for batch_size in (1, 64, 256):
+            broker = InferenceBroker()
+            start = time.perf_counter()
+            for first in range(0, len(states), batch_size):
+                for ticket in range(first, min(first + batch_size, len(states))):
+                    broker.submit(agent, encoded[ticket], states[ticket]['legal_actions'], ticket)
+                broker.flush(is_training=False)
+            batched = (time.perf_counter() - start) / len(states)
+            line += f" | broker B={batch_size:<3} {batched * 1e6:6.1f}"
+        print(line)
+
+def _parsed_strategic_state_translate(state):
+    ''' strategic_state_translate as it was before CARD_TABLE '''
+    real_state = state['raw_obs']
+    strat_state = [0] * STRAT_STATE_DIM_COUNT
+    for start_index, cards in ((0, real_state['hand']), (11, real_state['played_cards'])):
+        for card in cards:
+            color, suit, _ = translate_card(card)
+            if suit != Suit.WILD and suit != Suit.WILD_DRAW_4:
+                strat_state[start_index + color] += 1
+            strat_state[start_index + 4 + suit] += 1
+    strat_state[10] = real_state['card_num'][1 - real_state['current_player']]
+    color, suit, number = translate_card(real_state['target'])
+    strat_state[21 + color] = 1
+    strat_state[25 + suit] = 1
+    if suit == Suit.NUMBER and number != -1:
+        strat_state[31 + number] = 1
+    return strat_state
+
+def _parsed_card_state_translate(state):
+    ''' card_state_translate as it was before CARD_TABLE '''
+    real_state = state['raw_obs']
+    card_state = [0] * CARD_STATE_DIM_COUNT
+    for start_index, cards in ((0, real_state['hand']), (61, real_state['played_cards'])):
+        for card in cards:
+            color, suit, number = translate_card(card)
+            index = color * 15
+            if number != -1 and suit != Suit.NUMBER:
+                index += number
+            else:
+                index += suit + 9
+            card_state[start_index + index] += 1
+    card_state[60] = real_state['card_num'][1 - real_state['current_player']]
+    color, suit, number = translate_card(real_state['target'])
+    card_state[121 + color] = 1
+    card_state[125 + suit] = 1
+    if suit == Suit.NUMBER and number != -1:
+        card_state[131 + number] = 1
+    return card_state
+
+def bench_encode():
+    states = Corpus().states()
+    same = True
+    for name, parsed, table in (
+            ('strategic', _parsed_strategic_state_translate, strategic_state_translate),
+            ('card', _parsed_card_state_translate, card_state_translate)):
+        timings = []
+        for translate in (parsed, table):
+            start = time.perf_counter()
+            for state in states:
+                translate(state)
+            timings.append((time.perf_counter() - start) / len(states))
+        matches = sum(parsed(state) == table(state) for state in states)
+        same = same and matches == len(states)
+        print(f"{name:<10} us/state: parsed {timings[0] * 1e6:6.1f} | table {timings[1] * 1e6:6.1f}"
+              f" | {timings[0] / timings[1]:4.1f}x | {matches}/{len(states)} identical")
+    return same
+
+def _sample_games(game_count: int, seed: int):
+    ''' Per game, the states each player saw, from random play '''
+    rng = np.random.default_rng(seed)
+    # rlcard deals from the global numpy generator
+    np.random.seed(seed)
+    uno = rlcard.make('uno', config={'allow_raw_data': True})
+    games = []
+    for _ in range(game_count):
+        seen = [[], []]
+        state, player_id = uno.init_game()
+        while not uno.is_over():
+            seen[player_id].append(state)
+            state, player_id = uno.step(int(rng.choice(state['legal_actions'])))
+        games.append(seen)
+    return games
+
+def check_incremental(game_count: int = 300, seed: int = 0):
+    games = _sample_games(int(game_count), int(seed))
+    rng = np.random.default_rng(int(seed))
+    same = True
+    for name, make_encoder, translate in (
+            ('strategic', strategic_state_encoder, strategic_state_translate),
+            ('card', card_state_encoder, card_state_translate)):
+        # one encoder per player per game, as the agents use them
+        checks = mismatches = 0
+        encoder = make_encoder()
+        for game in games:
+            for states in game:
+                encoder.reset()
+                for state in states:
+                    checks += 1
+                    mismatches += int(encoder.translate(state) != translate(state))
+
+        # states of many games in random order through one encoder, every
+        # delta check has to catch the switch
+        states = [state for game in games for player_states in game for state in player_states]
+        order = rng.permutation(len(states))[:len(states) // 4]
+        for index in order:
+            checks += 1
+            mismatches += int(encoder.translate(states[index]) != translate(states[index]))
+        print(f"{name:<10} {checks - mismatches}/{checks} identical")
+        same = same and mismatches == 0
+
+        # per-state cost by game length, a game is one player's states
+        for label, low, high in (('short games', 0, 30), ('long games', 30, 10**9)):
+            timed = [player_states for game in games for player_states in game
+                     if low <= len(player_states) < high]
+            state_count = max(sum(len(player_states) for player_states in timed), 1)
+            start = time.perf_counter()
+            for player_states in timed:
+                for state in player_states:
+                    translate(state)
+            stateless = (time.perf_counter() - start) / state_count
+            start = time.perf_counter()
+            for player_states in timed:
+                encoder.reset()
+                for state in player_states:
+                    encoder.translate(state)
+            incremental = (time.perf_counter() - start) / state_count
+            print(f"{'':<10} {label:<11} us/state: translate {stateless * 1e6:6.1f}"
+                  f" | incremental {incremental * 1e6:6.1f}")
+    return same
+
+def _two_encode_decision(agent, state)->int:
+    ''' eval_step before the single encode path, without recording '''
+    agent.state_translation(state)
+    curr_state = agent.state_translation(state)
+    q_values = agent.online_nn.forward(
+        torch.tensor(curr_state, dtype=torch.float32, device=agent.online_nn.device)
+    )
+    mask = torch.full_like(q_values, float('-inf'))
+    mask[state['legal_actions']] = 0.0
+    return int(torch.argmax(q_values + mask).item())
+
+def _single_encode_decision(agent, state)->int:
+    ''' eval_step without recording '''
+    return agent._greedy_action(agent.state_translation(state), state['legal_actions'])
+
+def bench_decision():
+    games = Corpus().player_games()
+    for agent in (DeepQCardAgent(), DeepQStratAgent(), DeepMCCardAgent(), DeepMCStratAgent()):
+        line = f"{type(agent).__name__:<18} us/decision:"
+        actions = []
+        for label, decide in (('two encodes', _two_encode_decision),
+                              ('single encode', _single_encode_decision)):
+            chosen = []
+            start = time.perf_counter()
+            for game in games:
+                for states in game:
+                    agent.encoder.reset()
+                    for state in states:
+                        chosen.append(decide(agent, state))
+            elapsed = (time.perf_counter() - start) / len(chosen)
+            actions.append(chosen)
+            line += f" {label} {elapsed * 1e6:6.1f} |"
+        same = sum(old == new for old, new in zip(*actions))
+        print(f"{line} {same}/{len(actions[0])} same action")
+
+def _fill_lists(states):
+    ''' The agents' list buffers before TransitionBuffer '''
+    lists = ([], [], [], [], [])
+    for state in states:
+        for column, value in zip(lists, (state, state, 0, 0.0, False)):
+            column.append(value)
+    return lists
+
+def _fill_buffer(states):
+    buffer = TransitionBuffer(len(states), len(states[0]))
+    for state in states:
+        row = buffer.add_state(state, 0)
+        buffer.add_outcome(reward=0.0, next_row=row, done=False)
+    return buffer
+
+def bench_buffer():
+    encoder = card_state_encoder()
+    encoded = []
+    for game in Corpus().player_games():
+        for states in game:
+            encoder.reset()
+            # fresh lists, as the agents get them
+            encoded += [encoder.translate(state) for state in states]
+
+    for count in (1000, 100000):
+        states = [list(encoded[i % len(encoded)]) for i in range(count)]
+        for label, fill in (('lists', _fill_lists), ('TransitionBuffer', _fill_buffer)):
+            # lists keep the encoded state lists alive, count those too
+            tracemalloc.start()
+            if label == 'lists':
+                states = [list(state) for state in states]
+            filled = fill(states)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            fill(states)
+            append = (time.perf_counter() - start) / count
+
+            start = time.perf_counter()
+            if label == 'lists':
+                state_list, next_state_list, action_list, rewards_list, dones = filled
+                tensors = (torch.tensor(state_list, dtype=torch.float32),
+                           torch.tensor(next_state_list, dtype=torch.float32),
+                           torch.tensor(action_list, dtype=torch.long),
+                           torch.tensor(rewards_list, dtype=torch.float32),
+                           torch.tensor(dones, dtype=torch.float32))
+            else:
+                # next states are read through their positions, as DeepQAgent does
+                tensors = (filled.state_rows().to(torch.float32),
+                           filled.next_positions(),
+                           filled.action_rows().to(torch.long),
+                           filled.reward_rows().to(torch.float32),
+                           filled.done_rows().to(torch.float32))
+            convert = time.perf_counter() - start
+            print(f"{count:>7} transitions {label:<17} {memory / 2**20:8.2f} MiB"
+                  f" | append {append * 1e6:5.2f} us/transition | to tensors {convert * 1e3:8.2f} ms")
+
+def bench_replay(transition_count: int = 1 << 20, batch_size: int = 256):
+    transition_count, batch_size = int(transition_count), int(batch_size)
+    rng = np.random.default_rng(0)
+    replay = PrioritizedReplay(capacity=transition_count, state_dim=CARD_STATE_DIM_COUNT)
+
+    # fill with 25-transition games of random states
+    games = TransitionBuffer(1 << 14, CARD_STATE_DIM_COUNT)
+    states = rng.integers(0, 8, (games.CAPACITY, CARD_STATE_DIM_COUNT)).tolist()
+    for index, state in enumerate(states):
+        row = games.add_state(state, 0)
+        done = index % 25 == 24
+        games.add_outcome(reward=0.0, next_row=TERMINAL if done else row + 1, done=done)
+    start = time.perf_counter()
+    while len(replay) < transition_count:
+        replay.extend(games)
+    fill = time.perf_counter() - start
+    replay.update_priorities(np.arange(transition_count), rng.exponential(size=transition_count))
+    tree_bytes = replay.tree.tree.nbytes
+    print(f"{len(replay)} transitions: memory {replay.memory.nbytes() / 2**20:.1f} MiB"
+          f" + sum tree {tree_bytes / 2**20:.1f} MiB, filled in {fill:.2f} s")
+
+    repeats = 200
+    timings = {'sample': 0.0, 'gather': 0.0, 'update_priorities': 0.0}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows, _ = replay.sample(batch_size)
+        timings['sample'] += time.perf_counter() - start
+        start = time.perf_counter()
+        replay.memory.gather(rows)
+        timings['gather'] += time.perf_counter() - start
+        start = time.perf_counter()
+        replay.update_priorities(rows, rng.exponential(size=batch_size))
+        timings['update_priorities'] += time.perf_counter() - start
+
+    priorities = replay.tree.priorities(np.arange(transition_count))
+    start = time.perf_counter()
+    for _ in range(10):
+        rng.choice(transition_count, size=batch_size, p=priorities / priorities.sum())
+    linear = (time.perf_counter() - start) / 10
+    line = f"batch {batch_size} us/call:"
+    for name, total in timings.items():
+        line += f" {name} {total / repeats * 1e6:7.1f} |"
+    print(f"{line} np.random.choice {linear * 1e6:9.1f}")
+
+def _loop_returns(rewards, dones, gamma: float):
+    ''' DeepMCAgent.compute_targets before discounted_returns '''
+    rewards, dones = rewards.tolist(), dones.tolist()
+    target_lst = [0.0] * len(rewards)
+    G = 0.0
+    for i in reversed(range(len(rewards))):
+        if dones[i]:
+            G = 0
+        G = rewards[i] + gamma * G
+        target_lst[i] = G
+    return torch.tensor(target_lst, dtype=torch.float32)
+
+def bench_returns():
+    rng = np.random.default_rng(0)
+    for count in (10000, 100000, 1000000):
+        # card rewards are small steps, each game ends on the +-1 payoff
+        rewards = torch.from_numpy(rng.choice([-0.05, 0.0, 0.05], size=count).astype(np.float32))
+        dones = torch.from_numpy(rng.random(count) < 1 / 25)
+        rewards[dones] = torch.from_numpy(rng.choice([-1.0, 1.0], size=int(dones.sum())).astype(np.float32))
+
+        timings = []
+        for returns in (_loop_returns, discounted_returns):
+            start = time.perf_counter()
+            result = returns(rewards, dones, 0.99)
+            timings.append(time.perf_counter() - start)
+        error = (result - _loop_returns(rewards, dones, 0.99)).abs().max()
+        print(f"{count:>8} transitions: loop {timings[0] * 1e3:8.2f} ms | discounted_returns"
+              f" {timings[1] * 1e3:7.2f} ms | {timings[0] / timings[1]:5.1f}x | max diff {error:.1e}")
+
+def bench_stacked(repeats: int = 50):
+    repeats = int(repeats)
+    rng = np.random.default_rng(0)
+    torch.manual_seed(0)
+    state_dims = (CARD_STATE_DIM_COUNT, CARD_STATE_DIM_COUNT, STRAT_STATE_DIM_COUNT, STRAT_STATE_DIM_COUNT)
+    for row_count in (256, 2500):
+        batches = [(torch.from_numpy(rng.integers(0, 8, (row_count, dim)).astype(np.uint8)),
+                    torch.from_numpy(rng.integers(0, ACTION_COUNT, row_count).astype(np.int16)),
+                    torch.from_numpy(rng.standard_normal(row_count).astype(np.float32)),
+                    None)
+                   for dim in state_dims]
+        models = [DeepRL_NN(dim, ACTION_COUNT) for dim in state_dims]
+        fused_models = [copy.deepcopy(model) for model in models]
+        groups = [[0, 1], [2, 3]]
+        stacked = [StackedModels([fused_models[index] for index in group]) for group in groups]
+
+        sequential_losses, fused_losses = [], []
+        start = time.perf_counter()
+        for _ in range(repeats):
+            sequential_losses = [model.train_batch(*batch[:3]) for model, batch in zip(models, batches)]
+        sequential = (time.perf_counter() - start) / repeats
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fused_losses = []
+            for group, models_of_group in zip(groups, stacked):
+                fused_losses += models_of_group.step([batches[index] for index in group])
+        fused = (time.perf_counter() - start) / repeats
+
+        error = max(abs(a - b) for a, b in zip(sequential_losses, fused_losses))
+        print(f"{row_count:>5} rows x 4 models: train_batch {sequential * 1e3:7.2f} ms |"
+              f" fused {fused * 1e3:7.2f} ms | {sequential / fused:4.2f}x"
+              f" | max loss diff after {repeats} steps {error:.1e}")
+
+def bench_compiled(repeats: int = 5000):
+    repeats = int(repeats)
+    rng = np.random.default_rng(0)
+    torch.manual_seed(0)
+    for name, state_dim in (('card', CARD_STATE_DIM_COUNT), ('strat', STRAT_STATE_DIM_COUNT)):
+        model = DeepRL_NN(state_dim, ACTION_COUNT)
+        compiled = CompiledInference(model)
+        line = f"{name:>5} us/forward:"
+        for row_count in (1, 64, 256):
+            states = torch.from_numpy(rng.integers(0, 8, (row_count, state_dim)).astype(np.float32))
+            timings = []
+            for forward in (model.forward, compiled):
+                with torch.inference_mode():
+                    for _ in range(100):
+                        forward(states)
+                    start = time.perf_counter()
+                    for _ in range(repeats):
+                        forward(states)
+                timings.append((time.perf_counter() - start) / repeats)
+            line += (f" | {row_count:>3} states eager {timings[0] * 1e6:6.1f}"
+                     f" compiled {timings[1] * 1e6:6.1f} ({timings[0] / timings[1]:4.2f}x)")
+        print(line)
+
+        # weights written in place must show without a rebuild
+        traced = compiled.traced
+        states = torch.from_numpy(rng.integers(0, 8, (256, state_dim)).astype(np.float32))
+        model.train_batch(states, torch.zeros(256, dtype=torch.long), torch.ones(256))
+        with torch.inference_mode():
+            after_train = (compiled(states) - model.forward(states)).abs().max()
+            model.load_state_dict(DeepRL_NN(state_dim, ACTION_COUNT).state_dict())
+            after_load = (compiled(states) - model.forward(states)).abs().max()
+        print(f"{name:>5} max diff after train_batch {after_train:.1e}, after load_state_dict"
+              f" {after_load:.1e}, traced again: {compiled.traced is not traced}")
+        if max(after_train, after_load) > 1e-5:
+            return False
+
+_TORCH_STARTUP = '''
+import time
+start = time.perf_counter()
+from test_agents import {name}
+agent = {name}()
+print(time.perf_counter() - start)
+'''
+
+_NUMPY_STARTUP = '''
+import sys, time
+start = time.perf_counter()
+import rlcard
+from agents.numpy_runtime import NumpyAgent
+agent = NumpyAgent({path!r})
+print(time.perf_counter() - start)
+assert 'torch' not in sys.modules
+'''
+
+def _startup(code: str, repeats: int)->float:
+    ''' Best time from interpreter start to a ready agent, in seconds '''
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def bench_numpy(game_count: int = 100, repeats: int = 3):
+    game_count, repeats = int(game_count), int(repeats)
+    # imported here, export.py needs test_agents which loads checkpoints
+    from export import export_checkpoint, latest_checkpoints, load_entry
+    from test_agents import DeepQCardFrozenAgent, DeepQStratFrozenAgent, DeepMCCardFrozenAgent, DeepMCStratFrozenAgent
+    frozen_classes = [DeepQCardFrozenAgent, DeepQStratFrozenAgent, DeepMCCardFrozenAgent, DeepMCStratFrozenAgent]
+    games = _sample_games(game_count, seed=0)
+
+    for entry, frozen_class in zip(latest_checkpoints(), frozen_classes):
+        path = export_checkpoint(load_entry(entry), name=checkpoint_name(entry))
+        torch_startup = _startup(_TORCH_STARTUP.format(name=frozen_class.__name__), repeats)
+        numpy_startup = _startup(_NUMPY_STARTUP.format(path=path), repeats)
+
+        agent = frozen_class()
+        policy = NumpyPolicy.load(path)
+        decisions = []
+        for game in games:
+            for states in game:
+                encoder = agent.encoder.fresh()
+                decisions += [(encoder.translate(state), state['legal_actions']) for state in states]
+        timings, actions = [], []
+        for greedy_action in (agent._greedy_action, policy.greedy_action):
+            start = time.perf_counter()
+            actions.append([greedy_action(state, legal) for state, legal in decisions])
+            timings.append((time.perf_counter() - start) / len(decisions))
+        agreement = np.mean(np.array(actions[0]) == np.array(actions[1]))
+        print(f"{checkpoint_name(entry):>16}: startup torch {torch_startup:5.2f} s"
+              f" numpy {numpy_startup:5.2f} s | us/decision torch {timings[0] * 1e6:5.1f}"
+              f" numpy {timings[1] * 1e6:5.1f} | agreement {agreement * 100:.2f}%"
+              f" of {len(decisions)} decisions")
+        if agreement < 0.999:
+            return False
+
+def _find_max_suffix_file(folder_path: str, prefix: str):
+    ''' Latest checkpoint lookup of the frozen agents before CheckpointManifest '''
+    best_file = None
+    best_num = -1
+    for name in os.listdir(folder_path):
+        if not name.startswith(prefix + "_"):
+            continue
+        suffix = name.rsplit("_", 1)[-1].split(".", 1)[0]
+        if not suffix.isdigit():
+            continue
+        if int(suffix) > best_num:
+            best_num = int(suffix)
+            best_file = name
+    return best_file
+
+def bench_manifest(repeats: int = 200):
+    repeats = int(repeats)
+    folder = os.path.join(".", "model_history")
+    prefixes = ["qcard", "qstrat", "mccard", "mcstrat"]
+    manifest = CheckpointManifest.open(folder)
+    entries = [manifest.latest(prefix) for prefix in prefixes]
+    # archived checkpoints (migrate_checkpoints.py) have no file to list
+    archived = any(entry['file'].endswith(ARCHIVE_SUFFIX) for entry in entries)
+    for prefix, entry in zip(prefixes, entries):
+        if not archived and entry['file'] != _find_max_suffix_file(folder, prefix):
+            print(f"{prefix}: manifest and directory disagree on the latest checkpoint")
+            return False
+
+    def listing():
+        return [_find_max_suffix_file(folder, prefix) for prefix in prefixes]
+    def cold():
+        opened = CheckpointManifest(folder)
+        return [opened.latest(prefix) for prefix in prefixes]
+    def warm():
+        return [manifest.latest(prefix) for prefix in prefixes]
+    line = f"latest of {len(prefixes)} agents, {len(os.listdir(folder))} files, us:"
+    for name, lookup in (('listdir', listing), ('manifest cold', cold), ('manifest warm', warm)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            lookup()
+        line += f" {name} {(time.perf_counter() - start) / repeats * 1e6:8.1f} |"
+    print(line)
+
+    loads = [('manifest.load', manifest.load)]
+    if not archived:
+        loads.insert(0, ('torch.load', lambda entry: torch.load(manifest.path(entry), map_location='cpu')))
+    line = f"load {len(entries)} checkpoints, ms:"
+    for name, load in loads:
+        start = time.perf_counter()
+        for _ in range(repeats // 10):
+            for entry in entries:
+                load(entry)
+        line += f" {name} {(time.perf_counter() - start) / (repeats // 10) * 1e3:6.2f} |"
+    print(line)
+
+def bench_archive(reads: int = 200):
+    reads = int(reads)
+    rng = np.random.default_rng(0)
+    manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+    entries = [entry for episodes in manifest.entries.values() for entry in episodes.values()
+               if not entry['file'].endswith(".ckpt")]
+    file_bytes = sum(os.path.getsize(manifest.path(entry)) for entry in entries)
+    chosen = [entries[index] for index in rng.integers(0, len(entries), reads)]
+    start = time.perf_counter()
+    for entry in chosen:
+        load_state_dict(manifest.path(entry))
+    file_time = (time.perf_counter() - start) / reads
+    print(f"{len(entries)} files: {file_bytes / 2**20:6.2f} MiB | random load {file_time * 1e3:.2f} ms")
+
+    state_dicts = {(entry['prefix'], entry['episode']): {name: tensor.numpy() for name, tensor
+                                                         in load_state_dict(manifest.path(entry)).items()}
+                   for entry in entries}
+    with tempfile.TemporaryDirectory() as directory:
+        for encoding in ENCODINGS:
+            archives = {}
+            for prefix, episode in sorted(state_dicts):
+                if prefix not in archives:
+                    archives[prefix] = CheckpointArchive(
+                            os.path.join(directory, f"{prefix}.{encoding}.ckpt"), encoding=encoding)
+                archives[prefix].append(episode, state_dicts[(prefix, episode)])
+            archive_bytes = sum(os.path.getsize(archive.path) for archive in archives.values())
+
+            # opened cold, as a fresh evaluation process would
+            start = time.perf_counter()
+            error = 0.0
+            for entry in chosen:
+                archive = CheckpointArchive(archives[entry['prefix']].path)
+                arrays = archive.read(entry['episode'])
+                # read every value, fp32 reads are lazy views
+                error = max(error, max(float(np.abs(array - state_dicts[(entry['prefix'], entry['episode'])][name]).max())
+                                       for name, array in arrays.items()))
+            archive_time = (time.perf_counter() - start) / reads
+            print(f"{len(archives)} {encoding:>5} archives: {archive_bytes / 2**20:6.2f} MiB"
+                  f" ({archive_bytes / file_bytes * 100:3.0f}%) | random load {archive_time * 1e3:.2f} ms"
+                  f" | max error {error:.1e}")
+
+def bench_snapshot(rounds: int = 300):
+    rounds = int(rounds)
+    agents = [DeepQCardAgent(), DeepQStratAgent(), DeepMCCardAgent(), DeepMCStratAgent()]
+    for agent in agents:
+        agent.SAVE_RATE = 1 << 62
+        if hasattr(agent, 'replay'):
+            # as late in a run, the memories full
+            for _ in range(agent.REPLAY_CAPACITY // agent.BUFFER_CAPACITY):
+                agent.buffer.clear()
+                for row in range(agent.BUFFER_CAPACITY):
+                    agent.buffer.add_state(np.random.randint(0, 3, agent.state_dim).tolist(), 0)
+                    agent.buffer.add_outcome(reward=0.0, next_row=TERMINAL, done=True)
+                agent.replay.extend(agent.buffer)
+            agent.buffer.clear()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshot.pt")
+        start = time.perf_counter()
+        write_snapshot(path, training_snapshot(0, agents))
+        blocking_save = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        start = time.perf_counter()
+        snapshot = training_snapshot(0, agents)
+        copy_time = time.perf_counter() - start
+        del snapshot
+        print(f"snapshot {size / 2**20:.0f} MiB | loop held: torch.save {blocking_save * 1e3:.0f} ms,"
+              f" copy for SnapshotWriter {copy_time * 1e3:.0f} ms")
+
+        def rounds_per_sec(writer: Optional[SnapshotWriter])->float:
+            env.play_games(agents, is_training=True)
+            if writer is not None:
+                writer.save(training_snapshot(0, agents))
+            start = time.perf_counter()
+            for _ in range(rounds):
+                env.play_games(agents, is_training=True)
+            return rounds / (time.perf_counter() - start)
+
+        idle = rounds_per_sec(None)
+        writer = SnapshotWriter(path)
+        writing = rounds_per_sec(writer)
+        writer.close()
+        print(f"training rounds/sec: {idle:.1f} idle, {writing:.1f} from a SnapshotWriter save on"
+              f" ({writer.written} written)")
+
+def bench_profile(rounds: int = 300):
+    rounds = int(rounds)
+    agents = [DeepQCardAgent(), DeepQStratAgent(), DeepMCCardAgent(), DeepMCStratAgent()]
+    for agent in agents:
+        agent.SAVE_RATE = 1 << 62
+    all_agents = agents + [env.get_rule_based_agent(), RandomAgent(61)] * len(agents)
+
+    def rounds_per_sec()->float:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            env.play_games(all_agents, is_training=True)
+        return rounds / (time.perf_counter() - start)
+
+    # warm up the buffers and the replay memories first
+    rounds_per_sec()
+    before = rounds_per_sec()
+    profiler.enable()
+    enabled = rounds_per_sec()
+    profiler.disable()
+    after = rounds_per_sec()
+    print(f"training rounds/sec: {before:.1f} off, {enabled:.1f} profiled"
+          f" ({(before / enabled - 1) * 100:+.1f}% time), {after:.1f} switched off again")
+    print(profiler.breakdown())
+
+# ------------------------------------------------------
+# Performance suite
+# ------------------------------------------------------
+# Each SUITE setup takes the corpus and returns a function running one repeat and the
+# number of operations in it.
+
+def _suite_agents()->List[DeepUnoAgent]:
+    torch.manual_seed(0)
+    agents = [DeepQCardAgent(), DeepQStratAgent(), DeepMCCardAgent(), DeepMCStratAgent()]
+    for agent in agents:
+        agent.SAVE_RATE = 1 << 62
+    return agents
+
+def _record_player(agent: DeepUnoAgent, corpus: Corpus, player: int):
+    ''' Record the games of player like play would, without training '''
+    agent.buffer.clear()
+    for game, payoffs in zip(corpus.games, corpus.payoffs):
+        agent.before_game()
+        for decision_player, state, _ in game:
+            if decision_player == player:
+                agent.record_observation(agent.state_translation(state))
+        agent.buffer.add_outcome(reward=payoffs[player], next_row=TERMINAL, done=True)
+
+def _setup_translate(translate: Callable)->Callable[[Corpus], Tuple[Callable, int]]:
+    def setup(corpus: Corpus):
+        states = corpus.states()
+        def run():
+            for state in states:
+                translate(state)
+        return run, len(states)
+    return setup
+
+def _setup_card_to_int(corpus: Corpus):
+    cards = [card for state in corpus.states() for card in state['raw_obs']['hand']]
+    def run():
+        for card in cards:
+            card_to_int(card)
+    return run, len(cards)
+
+def _setup_int_to_action(corpus: Corpus):
+    actions = [action for state in corpus.states() for action in state['legal_actions']]
+    def run():
+        for action in actions:
+            int_to_action(action)
+    return run, len(actions)
+
+def _setup_greedy_step(corpus: Corpus):
+    agents = _suite_agents()
+    def run():
+        for agent in agents:
+            for game in corpus.games:
+                agent.encoder.reset()
+                for player, state, _ in game:
+                    if player == 0:
+                        agent._greedy_step(state)
+    decisions = sum(player == 0 for game in corpus.games for player, _, _ in game)
+    return run, decisions * len(agents)
+
+def _setup_train_batch(corpus: Corpus, batch_size: int = 256):
+    agents = _suite_agents()[:2]
+    generator = np.random.default_rng(0)
+    batches = []
+    for agent in agents:
+        _record_player(agent, corpus, 0)
+        rows = generator.choice(agent.buffer.state_count, batch_size, replace=False)
+        batches.append((agent.online_nn, agent.buffer.state_rows()[rows], agent.buffer.action_rows()[rows],
+                        torch.as_tensor(generator.uniform(-1, 1, batch_size), dtype=torch.float32)))
+    def run():
+        for model, states, actions, targets in batches:
+            model.train_batch(states, actions, targets)
+    return run, len(batches)
+
+def _setup_compute_targets(agent_index: int)->Callable[[Corpus], Tuple[Callable, int]]:
+    def setup(corpus: Corpus):
+        agent = _suite_agents()[agent_index]
+        _record_player(agent, corpus, 0)
+        return agent.compute_targets, agent.buffer.state_count
+    return setup
+
+def _setup_play_game(is_training: bool)->Callable[[Corpus], Tuple[Callable, int]]:
+    def setup(corpus: Corpus, games: int = 200):
+        agents = _suite_agents()
+        opponents = [env.get_rule_based_agent(), RandomAgent(61)]
+        def run():
+            random.seed(0)
+            np.random.seed(0)
+            for game_idx in range(games):
+                pair = [agents[game_idx % len(agents)], opponents[game_idx // len(agents) % 2]]
+                env.play_game(pair if game_idx % 2 == 0 else pair[::-1], is_training=is_training)
+        return run, games
+    return setup
+
+# name: (setup, unit), '/sec' units are rates
+SUITE: Dict[str, Tuple[Callable[[Corpus], Tuple[Callable, int]], str]] = {
+    'strategic_state_translate': (_setup_translate(strategic_state_translate), 'us/state'),
+    'card_state_translate':      (_setup_translate(card_state_translate), 'us/state'),
+    'card_to_int':               (_setup_card_to_int, 'us/card'),
+    'int_to_action':             (_setup_int_to_action, 'us/action'),
+    'greedy_step':               (_setup_greedy_step, 'us/decision'),
+    'train_batch':               (_setup_train_batch, 'us/batch'),
+    'deepq_compute_targets':     (_setup_compute_targets(0), 'us/transition'),
+    'deepmc_compute_targets':    (_setup_compute_targets(2), 'us/transition'),
+    'play_game_eval':            (_setup_play_game(False), 'games/sec'),
+    'play_game_train':           (_setup_play_game(True), 'games/sec'),
+}
+
+def _run_suite(corpus: Corpus, names: List[str], repeats: int)->Dict:
+    results = {}
+    for name in names:
+        setup, unit = SUITE[name]
+        times = []
+        # the first repeat warms up; every repeat starts from a new setup,
+        # the same agents, buffers and generator states
+        for _ in range(repeats + 1):
+            run, operations = setup(corpus)
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        times = times[1:]
+        median = statistics.median(times)
+        value = operations / median if unit.endswith('/sec') else median / operations * 1e6
+        results[name] = {
+            'value': value,
+            'unit': unit,
+            'operations': operations,
+            'repeats': repeats,
+            'spread': (max(times) - min(times)) / median,
+        }
+        print(f"{name:>26} {value:12.3f} {unit:<14} (spread {results[name]['spread'] * 100:.1f}%)")
+    return {
+        'corpus': corpus.sha256,
+        'created': time.time(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+def compare_results(results: Dict, baseline: Dict, threshold: float)->bool:
+    ''' Print the change of every benchmark, returns False on a regression '''
+    if results['corpus'] != baseline['corpus']:
+        print("warning: results and baseline were measured on different corpora")
+    passed = True
+    print(f"{'benchmark':>26} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results['results'].items():
+        if name not in baseline['results']:
+            print(f"{name:>26} {'-':>12} {current['value']:12.3f} {'new':>8}")
+            continue
+        before = baseline['results'][name]['value']
+        # positive: slower
+        if current['unit'].endswith('/sec'):
+            change = before / current['value'] - 1
+        else:
+            change = current['value'] / before - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            passed = False
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:>26} {before:12.3f} {current['value']:12.3f} {change * 100:+7.1f}%{flag}")
+    return passed
+
+def _read_json(path: str)->Dict:
+    with open(path) as f:
+        return json.load(f)
+
+def _write_json(path: str, data: Dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+def _suite_command(output: str, repeats, names)->bool:
+    unknown = [name for name in names if name not in SUITE]
+    if unknown:
+        print(f"unknown suite benchmarks: {' '.join(unknown)}, expected some of {' '.join(SUITE)}")
+        return False
+    torch.set_num_threads(1)
+    _write_json(output, _run_suite(Corpus(), list(names) or list(SUITE), int(repeats)))
+    print(f"results written to {output}")
+    return True
+
+def bench_suite(repeats: int = 5, *names: str)->bool:
+    return _suite_command(RESULTS_PATH, repeats, names)
+
+def bench_baseline(repeats: int = 5, *names: str)->bool:
+    return _suite_command(BASELINE_PATH, repeats, names)
+
+def check_baseline(results: str = RESULTS_PATH, baseline: str = BASELINE_PATH,
+                   threshold: float = 0.10)->bool:
+    return compare_results(_read_json(results), _read_json(baseline), float(threshold))
+
+
+BENCHMARKS = {
+    'engine': bench_engine,
+    'parity': check_parity,
+    'broker': bench_broker,
+    'encode': bench_encode,
+    'incremental': check_incremental,
+    'decision': bench_decision,
+    'buffer': bench_buffer,
+    'replay': bench_replay,
+    'returns': bench_returns,
+    'stacked': bench_stacked,
+    'compiled': bench_compiled,
+    'numpy': bench_numpy,
+    'manifest': bench_manifest,
+    'archive': bench_archive,
+    'snapshot': bench_snapshot,
+    'profile': bench_profile,
+    'record': record_corpus,
+    'suite': bench_suite,
+    'baseline': bench_baseline,
+    'compare': check_baseline,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit(1)
+    result = BENCHMARKS[sys.argv[1]](*sys.argv[2:])
+    if result is False:
+        sys.exit(1)
@@ -1,57 +1,339 @@
 import rlcard
 from rlcard import models
 from rlcard.agents.random_agent import RandomAgent
-from typing import List
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
 import random
+import time
 
 # Please freely tune
 TEST_EPOCH = 500
 
 from agents.deep_uno_agent import DeepUnoAgent
+from agents.inference_broker import InferenceBroker
+from agents.opponent_pool import OpponentPool, PoolOpponent
+from agents import profiler
+from agents.stacked_training import StackedTrainer
+from agents.training_snapshot import SnapshotWriter, load_snapshot, restore_snapshot, training_snapshot
+from agents.state_translator import int_to_action
+
+_rule_based_agent = None
 
 def get_rule_based_agent():
-    uno_rule_model = models.load('uno-rule-v1')
-    return uno_rule_model.agents[0]
+    # the rule model is stateless, so one shared instance is enough (and
+    # keeps the env pool from growing a new seating per loaded copy)
+    global _rule_based_agent
+    if _rule_based_agent is None:
+        uno_rule_model = models.load('uno-rule-v1')
+        _rule_based_agent = uno_rule_model.agents[0]
+    return _rule_based_agent
+
+class EnvPool:
+    ''' Reusable RLCard Uno environments, keyed by seating.
+
+    rlcard.make('uno') per game rebuilds the env and re-binds the agents
+    every time, while env.run already starts a fresh game through
+    init_game. The pool keeps one env per ordered pair of agents (by
+    identity) so a seating is constructed and bound only once; the least
+    recently used envs are dropped past MAX_ENVS. Pool opponents are
+    keyed by their seat instead: an OpponentPool has far more of them
+    than MAX_ENVS has room for, so their envs are shared and just get
+    the opponent of each game through set_agents.
+    '''
+    MAX_ENVS: int
+
+    def __init__(self, max_envs: int = 64):
+        self.MAX_ENVS = max_envs
+        self.envs = OrderedDict()
+        # unbound envs for games played side by side, see play_concurrent_games
+        self.slot_envs = []
+
+    def get(self, agents: List):
+        key: Tuple[Optional[int], ...] = tuple(
+                None if isinstance(agent, PoolOpponent) else id(agent) for agent in agents)
+        env = self.envs.get(key)
+        if env is None:
+            env = rlcard.make('uno', config={
+                    'record_action': True,
+                })
+            env.set_agents(agents)
+            self.envs[key] = env
+            if len(self.envs) > self.MAX_ENVS:
+                self.envs.popitem(last=False)
+        else:
+            self.envs.move_to_end(key)
+            if None in key:
+                env.set_agents(agents)
+        return env
+
+    def slots(self, count: int)->List:
+        while len(self.slot_envs) < count:
+            self.slot_envs.append(rlcard.make('uno', config={
+                    'allow_raw_data': True,
+                    'record_action': True,
+                }))
+        return self.slot_envs[:count]
+
+    def clear(self):
+        self.envs.clear()
+        self.slot_envs.clear()
+
+ENV_POOL = EnvPool()
 
 def play_game(agents: List, is_training: bool):
-    env = rlcard.make('uno', config={
-            'record_action': True,
-        })
-    env.set_agents(agents)
+    env = ENV_POOL.get(agents)
     for index, agent in enumerate(agents):
-        if isinstance(agent, DeepUnoAgent):
+        if isinstance(agent, (DeepUnoAgent, PoolOpponent)):
             agent.before_game()
     _, payoff = env.run(is_training)
     for index, agent in enumerate(agents):
-        if isinstance(agent, DeepUnoAgent):
+        if isinstance(agent, (DeepUnoAgent, PoolOpponent)):
             agent.after_game(payoff=payoff[index])
 
-def play_games(agents: List, is_training: bool):
-    # divide agents into random pairs
+def round_pairs(agents: List)->List[List]:
+    ''' The pairs play_games would play for one round '''
     shuffled = agents.copy()
     if len(shuffled) % 2 != 0:
-        additional_agent = get_rule_based_agent()
-        shuffled.append(additional_agent)
+        shuffled.append(get_rule_based_agent())
     random.shuffle(shuffled)
     pairs = [shuffled[i:i+2] for i in range(0, len(shuffled), 2)]
+    return [pair for pair in pairs
+            if isinstance(pair[0], DeepUnoAgent) or isinstance(pair[1], DeepUnoAgent)]
 
+def play_games(agents: List, is_training: bool)->int:
+    ''' Play one round of random pairings, returns number of games played '''
     # force each pair against each other
+    pairs = round_pairs(agents)
     for pair in pairs:
-        if isinstance(pair[0], DeepUnoAgent) or isinstance(pair[1], DeepUnoAgent):
-            play_game(pair, is_training)
+        play_game(pair, is_training)
+    return len(pairs)
+
+def record_game(pair: List, episodes: List[List[List[int]]], payoff: List[int]):
+    ''' Default end of game for play_concurrent_games: agents learn from it,
+    pool opponents count it '''
+    for index, agent in enumerate(pair):
+        if isinstance(agent, DeepUnoAgent):
+            agent.record_episode(episodes[index], payoff=payoff[index])
+        elif isinstance(agent, PoolOpponent):
+            agent.after_game(payoff=payoff[index])
+
+def play_concurrent_games(pairs: Iterable[List], is_training: bool,
+                          concurrency: int = 256,
+                          broker: Optional[InferenceBroker] = None,
+                          on_game: Callable = record_game)->int:
+    ''' Play one game per pair, up to concurrency games side by side.
+
+    Each round every waiting deep agent submits its decision to the broker,
+    which answers all of them with one batched forward per network. A slot
+    whose game ends starts the next pair right away, so batches stay full.
+    States are kept per game and handed to on_game(pair, episodes, payoff)
+    when the game ends (by default record_episode of each deep agent), so
+    interleaved games don't mix in the agents' buffers. Likewise each game
+    gets its own state encoders rather than the agents' own.
+    Returns the number of games played.
+    '''
+    broker = broker if broker is not None else InferenceBroker()
+    pending = iter(pairs)
+    envs = ENV_POOL.slots(concurrency)
+    slot_pairs: List[Optional[List]] = [None] * concurrency
+    states: List = [None] * concurrency
+    player_ids = [0] * concurrency
+    episodes = [[[], []] for _ in range(concurrency)]
+    encoders: List[List] = [[None, None] for _ in range(concurrency)]
+
+    def start_game(slot: int)->bool:
+        pair = next(pending, None)
+        slot_pairs[slot] = pair
+        if pair is None:
+            return False
+        states[slot], player_ids[slot] = envs[slot].init_game()
+        episodes[slot] = [[], []]
+        encoders[slot] = [agent.encoder.fresh() if isinstance(agent, DeepUnoAgent) else None
+                          for agent in pair]
+        return True
+
+    running = [slot for slot in range(concurrency) if start_game(slot)]
+    played = 0
+    bot_actions = {}
+    while running:
+        for slot in running:
+            agent = slot_pairs[slot][player_ids[slot]]
+            state = states[slot]
+            if isinstance(agent, DeepUnoAgent):
+                encoded = encoders[slot][player_ids[slot]].translate(state)
+                episodes[slot][player_ids[slot]].append(encoded)
+                broker.submit(agent, encoded, state['legal_actions'], slot)
+            elif is_training:
+                bot_actions[slot] = agent.step(state)
+            else:
+                bot_actions[slot] = agent.eval_step(state)[0]
+        agent_actions = broker.flush(is_training)
+
+        still_running = []
+        for slot in running:
+            game_env = envs[slot]
+            if slot in agent_actions:
+                states[slot], player_ids[slot] = game_env.step(
+                        int_to_action(agent_actions[slot]), True)
+            else:
+                agent = slot_pairs[slot][player_ids[slot]]
+                states[slot], player_ids[slot] = game_env.step(
+                        bot_actions[slot], agent.use_raw)
+            if not game_env.is_over():
+                still_running.append(slot)
+                continue
+            on_game(slot_pairs[slot], episodes[slot], game_env.get_payoffs())
+            played += 1
+            if start_game(slot):
+                still_running.append(slot)
+        running = still_running
+        bot_actions.clear()
+    return played
+
+class ThroughputMeter:
+    ''' Games/sec over the whole run and since the last report, with the
+    agents.profiler summary of the same time while profiling. '''
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.games = self.last_games = 0
+
+    def add(self, games: int):
+        self.games += games
+
+    def report(self, prefix: str = "")->str:
+        now = time.perf_counter()
+        recent = (self.games - self.last_games) / max(now - self.last, 1e-9)
+        overall = self.games / max(now - self.start, 1e-9)
+        self.last, self.last_games = now, self.games
+        line = f"{prefix}games={self.games} | {recent:.1f} games/sec (avg {overall:.1f})"
+        if profiler.ENABLED:
+            line += " | " + profiler.report_line()
+        return line
 
 BOT_PHASE_GAMES = 750000
-def train(total_games: int, training_agents: List[DeepUnoAgent]):
+# print a throughput line after every REPORT_RATE rounds of play_games
+REPORT_RATE = 10000
+# snapshot the training state after every SNAPSHOT_RATE rounds
+SNAPSHOT_RATE = 10000
+def train(total_games: int, training_agents: List[DeepUnoAgent],
+          backend: str = 'rlcard', num_envs: int = 256, num_actors: int = 0,
+          stacked: bool = False, snapshot: Optional[str] = None, resume: bool = False,
+          pool: Optional[OpponentPool] = None):
+    ''' stacked: train agents with the same state dimension together, see
+    agents.stacked_training.StackedTrainer
+
+    pool: snapshot the agents into it every pool.INTERVAL rounds, and past
+    BOT_PHASE_GAMES rounds seat as many opponents sampled from it as there
+    are agents in each round (agents.opponent_pool). The vector backend
+    plays no rlcard agents and takes no pool.
+
+    snapshot: path to write training snapshots to (agents.training_snapshot),
+    after every SNAPSHOT_RATE rounds and at the end; resume: continue from
+    the snapshot there instead of starting over. Only the rlcard backend
+    without actors stops between rounds with no game in flight.
+
+    num_actors: play in that many actor processes (actor_learner), which
+    play as the batched backend, so it is the only backend with actors.
+    '''
+    if (snapshot is not None or resume) and (backend != 'rlcard' or num_actors > 0):
+        raise ValueError("snapshots need the rlcard backend without actors")
+    if resume and snapshot is None:
+        raise ValueError("resume needs a snapshot path")
+    if num_actors > 0 and backend != 'batched':
+        raise ValueError(f"actors play as the batched backend, not the {backend} backend")
+    if pool is not None and backend == 'vector':
+        raise ValueError("the vector backend takes no opponent pool")
+    if not stacked:
+        _train_games(total_games, training_agents, backend, num_envs, num_actors, snapshot, resume, pool)
+        return
+    trainer = StackedTrainer(training_agents)
+    _train_games(total_games, training_agents, backend, num_envs, num_actors, snapshot, resume, pool)
+    trainer.close()
+
+def round_agents(game_idx: int, training_agents: List[DeepUnoAgent], all_agents: List,
+                 pool: Optional[OpponentPool])->List:
+    ''' Agents of round game_idx: with the bots first, then the training
+    agents and their sampled pool opponents '''
+    if game_idx < BOT_PHASE_GAMES:
+        return all_agents
+    if pool is None:
+        return training_agents
+    return training_agents + pool.sample(len(training_agents))
+
+def _train_games(total_games: int, training_agents: List[DeepUnoAgent],
+                 backend: str, num_envs: int, num_actors: int,
+                 snapshot: Optional[str] = None, resume: bool = False,
+                 pool: Optional[OpponentPool] = None):
+    if num_actors > 0:
+        # imported here, actor_learner builds on this module
+        from actor_learner import train_actor_learner
+        train_actor_learner(
+                total_games=total_games,
+                training_agents=training_agents,
+                num_actors=num_actors,
+                bot_phase_games=BOT_PHASE_GAMES,
+                num_envs=num_envs,
+                report_rate=REPORT_RATE,
+                pool=pool)
+        return
+    if backend == 'vector':
+        # imported here, vec_env uses ThroughputMeter from this module
+        from vec_env import train_vectorized
+        train_vectorized(
+                total_games=total_games,
+                training_agents=training_agents,
+                bot_phase_games=BOT_PHASE_GAMES,
+                num_envs=num_envs,
+                report_rate=REPORT_RATE)
+        return
+    if backend not in ('rlcard', 'batched'):
+        raise ValueError(f"unknown backend: {backend}")
+
     rlcard_agents = []
     for _ in range(len(training_agents)):
         rlcard_agents.append(get_rule_based_agent())
         rlcard_agents.append(RandomAgent(61))
     all_agents = training_agents + rlcard_agents
 
-    for game_idx in range(total_games):
-        if game_idx < BOT_PHASE_GAMES:
-            # phase 1: learn vs bots + each other
-            play_games(all_agents, is_training=True)
-        else:
-            # phase 2: primarily self-play (either full list or separate env)
-            play_games(training_agents, is_training=True)
+    meter = ThroughputMeter()
+    if backend == 'batched':
+        # same rounds of pairings as below, played num_envs games at a time
+        def scheduled_pairs():
+            for game_idx in range(total_games):
+                pairs = round_pairs(round_agents(game_idx, training_agents, all_agents, pool))
+                meter.add(len(pairs))
+                yield from pairs
+                if (game_idx + 1) % REPORT_RATE == 0:
+                    print(meter.report(prefix=f"[{game_idx + 1}/{total_games} scheduled] "))
+                    if pool is not None:
+                        print(pool.summary())
+                if pool is not None and (game_idx + 1) % pool.INTERVAL == 0:
+                    pool.add_agents(training_agents, game_idx + 1)
+        play_concurrent_games(scheduled_pairs(), is_training=True, concurrency=num_envs)
+        print(meter.report(prefix="[done] "))
+        return
+
+    start_idx = 0
+    if resume:
+        start_idx = restore_snapshot(load_snapshot(snapshot), training_agents, pool)
+        print(f"resumed from {snapshot} after {start_idx} rounds")
+    writer = SnapshotWriter(snapshot) if snapshot is not None else None
+
+    for game_idx in range(start_idx, total_games):
+        # phase 1: learn vs bots + each other
+        # phase 2: primarily self-play, against the pool's snapshots too
+        meter.add(play_games(round_agents(game_idx, training_agents, all_agents, pool), is_training=True))
+
+        if (game_idx + 1) % REPORT_RATE == 0:
+            print(meter.report(prefix=f"[{game_idx + 1}/{total_games}] "))
+            if pool is not None:
+                print(pool.summary())
+        if pool is not None and (game_idx + 1) % pool.INTERVAL == 0:
+            pool.add_agents(training_agents, game_idx + 1)
+        if writer is not None and (game_idx + 1) % SNAPSHOT_RATE == 0:
+            writer.save(training_snapshot(game_idx + 1, training_agents, pool))
+    if writer is not None:
+        if total_games % SNAPSHOT_RATE != 0:
+            writer.save(training_snapshot(total_games, training_agents, pool))
+        writer.close()
+    print(meter.report(prefix="[done] "))
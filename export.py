@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+''' Export checkpoints for the torch-free runtime (agents/numpy_runtime.py).
+
+Usage: ./export.py [checkpoint ...]
+    writes each checkpoint's parameters as float32 arrays to
+    model_history_npz/<checkpoint name>.npz; without arguments, the
+    latest checkpoint of each agent
+'''
+
+from typing import Dict, List, Optional, Union
+from agents.quantization import load_checkpoint
+from agents.checkpoint_manifest import CheckpointManifest, checkpoint_name
+import os
+import sys
+import numpy as np
+
+PREFIXES = ["qcard", "qstrat", "mccard", "mcstrat"]
+MODEL_DIR = os.path.join(".", "model_history")
+NPZ_MODEL_DIR = os.path.join(".", "model_history_npz")
+
+def export_checkpoint(checkpoint: Union[str, Dict], output_dir: str = NPZ_MODEL_DIR,
+                      name: Optional[str] = None)->str:
+    ''' Export a checkpoint, as load_checkpoint takes it, to <name>.npz (by
+    default the checkpoint file's name); returns the path of the .npz '''
+    if name is None:
+        name = os.path.basename(checkpoint)
+    os.makedirs(output_dir, exist_ok=True)
+    output = os.path.join(output_dir, name + ".npz")
+    model = load_checkpoint(checkpoint)
+    np.savez(output, **{name: tensor.detach().numpy()
+                        for name, tensor in model.state_dict().items()})
+    return output
+
+def latest_checkpoints()->List[Dict]:
+    ''' Manifest entries of the latest checkpoint of each agent '''
+    manifest = CheckpointManifest.open(MODEL_DIR)
+    return [manifest.latest(prefix) for prefix in PREFIXES]
+
+def load_entry(entry: Dict)->Dict:
+    ''' State dict of a latest_checkpoints entry, archived or not '''
+    return CheckpointManifest.open(MODEL_DIR).load(entry)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        outputs = [(path, export_checkpoint(path)) for path in sys.argv[1:]]
+    else:
+        outputs = [(checkpoint_name(entry), export_checkpoint(load_entry(entry), name=checkpoint_name(entry)))
+                   for entry in latest_checkpoints()]
+    for checkpoint, output in outputs:
+        print(f"{checkpoint} -> {output} ({os.path.getsize(output) / 1024:.0f} KiB)")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+''' Pack a directory's {FILE_NAME}_{episode} checkpoint files into one
+CheckpointArchive per agent (agents/checkpoint_archive.py), and point the
+directory's manifest at the archives.
+
+Every packed checkpoint is read back and compared to its file before the
+file is removed (with --remove); fp16 is checked against its rounding.
+Running it again only packs files added since.
+'''
+
+from agents.checkpoint_manifest import CheckpointManifest, ARCHIVE_SUFFIX, archive_name
+from agents.checkpoint_archive import ENCODINGS
+import argparse
+import os
+import numpy as np
+
+def migrate(directory: str, encoding: str, remove: bool):
+    manifest = CheckpointManifest.open(directory)
+    file_bytes, archived = 0, 0
+    for prefix, episodes in sorted(manifest.entries.items()):
+        archive = manifest.archive(archive_name(prefix), encoding=encoding)
+        packed = set(archive.episodes())
+        for episode, entry in sorted(episodes.items()):
+            if entry['file'].endswith(ARCHIVE_SUFFIX) or episode in packed:
+                continue
+            path = manifest.path(entry)
+            arrays = {name: tensor.numpy() for name, tensor in manifest.load(entry).items()}
+            payload = archive.append(episode, arrays)
+
+            tolerance = 0.0 if archive.encoding != 'fp16' else 1e-3
+            for name, array in archive.read(episode).items():
+                if not np.allclose(array, arrays[name], rtol=tolerance, atol=tolerance * 1e-2):
+                    raise RuntimeError(f"{path}: {name} differs once packed")
+            manifest.record_archived(prefix=prefix, episode=episode,
+                                     agent_type=entry['agent_type'],
+                                     state_dim=entry['state_dim'], payload=payload)
+            file_bytes += os.path.getsize(path)
+            archived += 1
+            if remove:
+                os.remove(path)
+        print(f"{prefix}: {len(archive.episodes())} checkpoints in {archive.path}"
+              f" ({os.path.getsize(archive.path) / 2**20:.2f} MiB, {archive.encoding})")
+    print(f"packed {archived} files of {file_bytes / 2**20:.2f} MiB"
+          + (", removed them" if remove else ""))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", nargs="?", default="model_history")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="delta",
+                        help="fp32: as saved, fp16: half size and lossy, "
+                             "delta: lossless XOR with the previous checkpoint, compressed")
+    parser.add_argument("--remove", action="store_true",
+                        help="delete each checkpoint file once packed and verified")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    migrate(args.directory, args.encoding, args.remove)
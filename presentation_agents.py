@@ -1,6 +1,6 @@
 from typing import override, Collection, Tuple
 
-import torch
+from agents.checkpoint_manifest import CheckpointManifest
 from agents.deepq_card import DeepQCardAgent
 from agents.deepq_strat import DeepQStratAgent
 from agents.deepmc_card import DeepMCCardAgent
@@ -12,45 +12,18 @@ import os
 
 TERM_WIDTH, TERM_HEIGHT = shutil.get_terminal_size(fallback=(80, 24))
 
-def find_max_suffix_file(folder_path: str, prefix: str):
-    best_file = None
-    best_num = -1
-
-    for name in os.listdir(folder_path):
-        # Must start with "prefix_"
-        if not name.startswith(prefix + "_"):
-            continue
-
-        # Extract part after last "_"
-        suffix = name.rsplit("_", 1)[-1]
-
-        # Remove extension if present
-        suffix = suffix.split(".", 1)[0]
-
-        # Check that suffix is numeric
-        if not suffix.isdigit():
-            continue
-
-        num = int(suffix)
-        if num > best_num:
-            best_num = num
-            best_file = name
-    
-    return best_file
-
 class DeepQCardAgentPresentatiion(DeepQCardAgent):
     def __init__(self):
         super().__init__()
         self.presentation_line = "DQN: Card Presentation"
 
-        file = find_max_suffix_file(
-                folder_path=os.path.join(".", "model_history"),
-                prefix="qcard")
+        manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+        entry = manifest.latest("qcard")
 
-        if file is not None:
-            file = os.path.join(".", "model_history", file)
-            self.online_nn.load_state_dict(torch.load(file))
-            self.target_nn.load_state_dict(torch.load(file))
+        if entry is not None:
+            state_dict = manifest.load(entry)
+            self.online_nn.load_state_dict(state_dict)
+            self.target_nn.load_state_dict(state_dict)
         else:
             print("not found file")
             exit()
@@ -90,14 +63,13 @@ class DeepQStratAgentPresentatiion(DeepQStratAgent):
         super().__init__()
         self.presentation_line = "DQN: Strat Presentation "
 
-        file = find_max_suffix_file(
-                folder_path=os.path.join(".", "model_history"),
-                prefix="qstrat")
+        manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+        entry = manifest.latest("qstrat")
 
-        if file is not None:
-            file = os.path.join(".", "model_history", file)
-            self.online_nn.load_state_dict(torch.load(file))
-            self.target_nn.load_state_dict(torch.load(file))
+        if entry is not None:
+            state_dict = manifest.load(entry)
+            self.online_nn.load_state_dict(state_dict)
+            self.target_nn.load_state_dict(state_dict)
         else:
             print("not found file")
             exit()
@@ -138,13 +110,12 @@ class DeepMCStratAgentPresentation(DeepMCStratAgent):
         super().__init__()
         self.presentation_line = "DeepMC: Strat Presentation "
 
-        file = find_max_suffix_file(
-                folder_path=os.path.join(".", "model_history"),
-                prefix="mcstrat")
+        manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+        entry = manifest.latest("mcstrat")
 
-        if file is not None:
-            file = os.path.join(".", "model_history", file)
-            self.online_nn.load_state_dict(torch.load(file))
+        if entry is not None:
+            state_dict = manifest.load(entry)
+            self.online_nn.load_state_dict(state_dict)
         else:
             print("not found file")
             exit()
@@ -184,13 +155,12 @@ class DeepMCCardAgengPresentation(DeepMCCardAgent):
         super().__init__()
         self.presentation_line = "DeepMC: Card Presentation "
 
-        file = find_max_suffix_file(
-                folder_path=os.path.join(".", "model_history"),
-                prefix="mccard")
+        manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+        entry = manifest.latest("mccard")
 
-        if file is not None:
-            file = os.path.join(".", "model_history", file)
-            self.online_nn.load_state_dict(torch.load(file))
+        if entry is not None:
+            state_dict = manifest.load(entry)
+            self.online_nn.load_state_dict(state_dict)
         else:
             print("not found file")
             exit()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+''' Int8 models for evaluation.
+
+Usage: ./quantize.py <command>
+    convert [checkpoint ...]    write the int8 model of each checkpoint
+                                (default: the latest of each agent) to
+                                model_history_int8
+    check [game_count]          latest checkpoint of each agent against its
+                                int8 model: greedy action agreement and
+                                per-decision cost on the states of games
+                                against the rule bot, and win rate against
+                                the rule bot over the same seeded games
+    devices [game_count]        every int8 agent plays game_count games
+                                against the rule bot with its float network
+                                on the default device (CUDA when available),
+                                the int8 model taking its input on the CPU
+'''
+
+from typing import List, Tuple
+from agents.quantization import quantize_checkpoint
+from agents.checkpoint_manifest import checkpoint_name
+from export import latest_checkpoints, load_entry
+from env import play_game, get_rule_based_agent
+from test_agents import INT8_MODEL_DIR
+from test_agents import DeepMCCardFrozenAgent, DeepMCStratFrozenAgent, DeepQCardFrozenAgent, DeepQStratFrozenAgent
+from test_agents import DeepMCCardQuantizedAgent, DeepMCStratQuantizedAgent, DeepQCardQuantizedAgent, DeepQStratQuantizedAgent
+import math
+import os
+import random
+import sys
+import time
+import numpy as np
+import torch
+
+PREFIXES = ["qcard", "qstrat", "mccard", "mcstrat"]
+
+AGENT_CLASSES = {
+    "qcard": (DeepQCardFrozenAgent, DeepQCardQuantizedAgent),
+    "qstrat": (DeepQStratFrozenAgent, DeepQStratQuantizedAgent),
+    "mccard": (DeepMCCardFrozenAgent, DeepMCCardQuantizedAgent),
+    "mcstrat": (DeepMCStratFrozenAgent, DeepMCStratQuantizedAgent),
+}
+
+def convert(*checkpoints: str):
+    # (name, checkpoint, size in bytes)
+    if len(checkpoints) > 0:
+        sources = [(path, path, os.path.getsize(path)) for path in checkpoints]
+    else:
+        # the latest of each agent, as export.py
+        sources = [(checkpoint_name(entry), load_entry(entry), entry['size'])
+                   for entry in latest_checkpoints()]
+    for name, checkpoint, size in sources:
+        output = quantize_checkpoint(checkpoint, INT8_MODEL_DIR, name=os.path.basename(name))
+        print(f"{name} ({size / 1024:.0f} KiB)"
+              f" -> {output} ({os.path.getsize(output) / 1024:.0f} KiB)")
+
+def _seed(seed: int):
+    # rlcard deals from the global numpy generator
+    random.seed(seed)
+    np.random.seed(seed)
+
+def _win_rate(agent, game_count: int, seed: int)->float:
+    rulebot = get_rule_based_agent()
+    agent.reset_win_count()
+    _seed(seed)
+    for _ in range(game_count):
+        play_game([agent, rulebot], False)
+    return agent.test_win_count / agent.test_game_count
+
+def _decisions(agent, game_count: int, seed: int)->List[Tuple[List[int], List[int]]]:
+    ''' Encoded states and legal actions of the agent's decisions in games
+    against the rule bot '''
+    decisions = []
+    greedy_step = agent._greedy_step
+
+    def recorded(state):
+        decisions.append((agent.state_translation(state), state['legal_actions']))
+        return agent._greedy_action(decisions[-1][0], decisions[-1][1])
+
+    agent._greedy_step = recorded
+    _seed(seed)
+    rulebot = get_rule_based_agent()
+    for _ in range(game_count):
+        play_game([agent, rulebot], False)
+    agent._greedy_step = greedy_step
+    return decisions
+
+def _greedy_actions(agent, decisions)->Tuple[List[int], float]:
+    ''' Actions and seconds per decision '''
+    start = time.perf_counter()
+    actions = [agent._greedy_action(state, legal) for state, legal in decisions]
+    return actions, (time.perf_counter() - start) / len(decisions)
+
+def check(game_count: int = 1000, seed: int = 0):
+    game_count, seed = int(game_count), int(seed)
+    torch.set_num_threads(1)
+    for prefix in PREFIXES:
+        float_class, quantized_class = AGENT_CLASSES[prefix]
+        float_agent, quantized_agent = float_class(), quantized_class()
+
+        decisions = _decisions(float_agent, min(game_count, 200), seed)
+        float_actions, float_time = _greedy_actions(float_agent, decisions)
+        quantized_actions, quantized_time = _greedy_actions(quantized_agent, decisions)
+        agreement = np.mean(np.array(float_actions) == np.array(quantized_actions))
+
+        float_rate = _win_rate(float_agent, game_count, seed)
+        quantized_rate = _win_rate(quantized_agent, game_count, seed)
+        # standard error of the difference of two independent rates
+        error = math.sqrt((float_rate * (1 - float_rate) + quantized_rate * (1 - quantized_rate)) / game_count)
+        print(f"{prefix:>8}: agreement {agreement * 100:6.2f}% of {len(decisions)} decisions"
+              f" | us/decision float {float_time * 1e6:5.1f} int8 {quantized_time * 1e6:5.1f}"
+              f" | win rate vs rulebot float {float_rate * 100:5.1f}% int8 {quantized_rate * 100:5.1f}%"
+              f" (delta {(quantized_rate - float_rate) * 100:+.1f} +- {error * 100:.1f})")
+
+def check_devices(game_count: int = 20, seed: int = 0)->bool:
+    game_count, seed = int(game_count), int(seed)
+    if not torch.cuda.is_available():
+        print("CUDA not available: float and int8 networks are both on the CPU")
+    passed = True
+    for prefix in PREFIXES:
+        agent = AGENT_CLASSES[prefix][1]()
+        try:
+            _win_rate(agent, game_count, seed)
+        except RuntimeError as error:
+            print(f"{prefix:>8}: FAILED, {error}")
+            passed = False
+            continue
+        ok = agent.inference_device.type == 'cpu'
+        passed = passed and ok
+        print(f"{prefix:>8}: {'ok' if ok else 'FAILED'}, online_nn on {agent.online_nn.device},"
+              f" int8 input on {agent.inference_device}, {agent.test_game_count} games")
+    return passed
+
+COMMANDS = {
+    'convert': convert,
+    'check': check,
+    'devices': check_devices,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(__doc__)
+        sys.exit(1)
+    if COMMANDS[sys.argv[1]](*sys.argv[2:]) is False:
+        sys.exit(1)
@@ -0,0 +1,92 @@
+from typing import Dict, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import time
+import numpy as np
+
+'''
+Persistent matchup results for tournament.py.
+
+A matchup is identified by the identity of both agents, the number of
+games and the seed: a checkpoint's identity is the sha256 of its
+parameters (so a checkpoint moved into an archive, or loaded from
+another directory, is still the same agent), a bot's is its name. Games
+are seeded from those identities alone, so the same key always means the
+same games, whatever else the tournament played. RESULTS_VERSION is part
+of the key too: bump it when a change to the game loop or the runtime
+changes the results.
+
+Results live in one SQLite file. Each matchup is committed as soon as it
+is complete, so an interrupted tournament keeps what it finished.
+'''
+
+RESULTS_VERSION = 1
+DEFAULT_CACHE = "tournament_cache.sqlite"
+
+def parameters_sha256(params: Dict[str, np.ndarray])->str:
+    ''' Content hash of a state dict, by parameter name, shape and float32 values '''
+    digest = hashlib.sha256()
+    for name in sorted(params):
+        array = np.ascontiguousarray(params[name], dtype=np.float32)
+        digest.update(f"{name}:{array.shape};".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    ''' (first, second, games, seed) to the wins of first and of second.
+
+    first and second are agent identities in the order the matchup was
+    played (tournament.py sorts them). hits and misses count lookups.
+    '''
+    path: str
+    hits: int
+    misses: int
+
+    def __init__(self, path: str = DEFAULT_CACHE):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        # readers don't block the writer, and a crash can't tear a commit
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS matchups (
+                first TEXT NOT NULL,
+                second TEXT NOT NULL,
+                games INTEGER NOT NULL,
+                seed INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                first_wins INTEGER NOT NULL,
+                second_wins INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (first, second, games, seed, version)
+            )''')
+        self.connection.commit()
+
+    def get(self, first: str, second: str, games: int, seed: int)->Optional[Tuple[int, int]]:
+        row = self.connection.execute(
+                "SELECT first_wins, second_wins FROM matchups"
+                " WHERE first = ? AND second = ? AND games = ? AND seed = ? AND version = ?",
+                (first, second, games, seed, RESULTS_VERSION)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], row[1]
+
+    def put(self, first: str, second: str, games: int, seed: int,
+            first_wins: int, second_wins: int, seconds: float):
+        self.connection.execute(
+                "INSERT OR REPLACE INTO matchups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (first, second, games, seed, RESULTS_VERSION,
+                 first_wins, second_wins, seconds, time.time()))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
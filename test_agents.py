@@ -3,35 +3,28 @@ from agents.deepmc_card import DeepMCCardAgent
 from agents.deepmc_strat import DeepMCStratAgent
 from agents.deepq_card import DeepQCardAgent
 from agents.deepq_strat import DeepQStratAgent
+from agents.checkpoint_manifest import CheckpointManifest, checkpoint_name
+from agents.quantization import load_quantized, quantize_checkpoint
 from agents.state_translator import int_to_action
 import os
 import torch
 
-def find_max_suffix_file(folder_path: str, prefix: str):
-    best_file = None
-    best_num = -1
+INT8_MODEL_DIR = os.path.join(".", "model_history_int8")
 
-    for name in os.listdir(folder_path):
-        # Must start with "prefix_"
-        if not name.startswith(prefix + "_"):
-            continue
+def load_quantized_policy(prefix: str):
+    ''' int8 model of the latest prefix checkpoint, converted into
+    INT8_MODEL_DIR the first time (named by prefix and episode, archived
+    checkpoints share their archive's file) '''
+    manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+    entry = manifest.latest(prefix)
+    if entry is None:
+        print("not found file")
+        exit()
 
-        # Extract part after last "_"
-        suffix = name.rsplit("_", 1)[-1]
-
-        # Remove extension if present
-        suffix = suffix.split(".", 1)[0]
-
-        # Check that suffix is numeric
-        if not suffix.isdigit():
-            continue
-
-        num = int(suffix)
-        if num > best_num:
-            best_num = num
-            best_file = name
-    
-    return best_file
+    path = os.path.join(INT8_MODEL_DIR, checkpoint_name(entry))
+    if not os.path.exists(path):
+        quantize_checkpoint(manifest.load(entry), INT8_MODEL_DIR, name=checkpoint_name(entry))
+    return load_quantized(path)
 
 
 class DeepMCCardFrozenAgent(DeepMCCardAgent):
@@ -40,14 +33,13 @@ class DeepMCCardFrozenAgent(DeepMCCardAgent):
         self.test_win_count = 0
         self.test_game_count = 0
 
-        file = find_max_suffix_file(
-                folder_path=os.path.join(".", "model_history"),
-                prefix="mccard")
+        manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+        entry = manifest.latest("mccard")
 
-        if file is not None:
-            file = os.path.join(".", "model_history", file)
-            self.online_nn.load_state_dict(torch.load(file))
-            # self.target_nn.load_state_dict(torch.load(file))
+        if entry is not None:
+            state_dict = manifest.load(entry)
+            self.online_nn.load_state_dict(state_dict)
+            # self.target_nn.load_state_dict(state_dict)
         else:
             print("not found file")
             exit()
@@ -64,6 +56,10 @@ class DeepMCCardFrozenAgent(DeepMCCardAgent):
     def before_game(self):
         return
 
+    @override
+    def record_observation(self, curr_state):
+        return
+
     @override
     def after_game(self, payoff: int):
         self.test_win_count += 1 if payoff == 1 else 0
@@ -80,14 +76,13 @@ class DeepMCStratFrozenAgent(DeepMCStratAgent):
         self.test_win_count = 0
         self.test_game_count = 0
 
-        file = find_max_suffix_file(
-                folder_path=os.path.join(".", "model_history"),
-                prefix="mcstrat")
+        manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+        entry = manifest.latest("mcstrat")
 
-        if file is not None:
-            file = os.path.join(".", "model_history", file)
-            self.online_nn.load_state_dict(torch.load(file))
-            # self.target_nn.load_state_dict(torch.load(file))
+        if entry is not None:
+            state_dict = manifest.load(entry)
+            self.online_nn.load_state_dict(state_dict)
+            # self.target_nn.load_state_dict(state_dict)
         else:
             print("not found file")
             exit()
@@ -104,6 +99,10 @@ class DeepMCStratFrozenAgent(DeepMCStratAgent):
     def before_game(self):
         return
 
+    @override
+    def record_observation(self, curr_state):
+        return
+
     @override
     def after_game(self, payoff: int):
         self.test_win_count += 1 if payoff == 1 else 0
@@ -120,14 +119,13 @@ class DeepQCardFrozenAgent(DeepQCardAgent):
         self.test_win_count = 0
         self.test_game_count = 0
 
-        file = find_max_suffix_file(
-                folder_path=os.path.join(".", "model_history"),
-                prefix="qcard")
+        manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+        entry = manifest.latest("qcard")
 
-        if file is not None:
-            file = os.path.join(".", "model_history", file)
-            self.online_nn.load_state_dict(torch.load(file))
-            self.target_nn.load_state_dict(torch.load(file))
+        if entry is not None:
+            state_dict = manifest.load(entry)
+            self.online_nn.load_state_dict(state_dict)
+            self.target_nn.load_state_dict(state_dict)
         else:
             print("not found file")
             exit()
@@ -144,6 +142,10 @@ class DeepQCardFrozenAgent(DeepQCardAgent):
     def before_game(self):
         return
 
+    @override
+    def record_observation(self, curr_state):
+        return
+
     @override
     def after_game(self, payoff: int):
         self.test_win_count += 1 if payoff == 1 else 0
@@ -159,14 +161,13 @@ class DeepQStratFrozenAgent(DeepQStratAgent):
         self.test_win_count = 0
         self.test_game_count = 0
 
-        file = find_max_suffix_file(
-                folder_path=os.path.join(".", "model_history"),
-                prefix="qstrat")
+        manifest = CheckpointManifest.open(os.path.join(".", "model_history"))
+        entry = manifest.latest("qstrat")
 
-        if file is not None:
-            file = os.path.join(".", "model_history", file)
-            self.online_nn.load_state_dict(torch.load(file))
-            self.target_nn.load_state_dict(torch.load(file))
+        if entry is not None:
+            state_dict = manifest.load(entry)
+            self.online_nn.load_state_dict(state_dict)
+            self.target_nn.load_state_dict(state_dict)
         else:
             print("not found file")
             exit()
@@ -182,6 +183,10 @@ class DeepQStratFrozenAgent(DeepQStratAgent):
     def before_game(self):
         return
 
+    @override
+    def record_observation(self, curr_state):
+        return
+
     @override
     def after_game(self, payoff: int):
         self.test_win_count += 1 if payoff == 1 else 0
@@ -190,3 +195,32 @@ class DeepQStratFrozenAgent(DeepQStratAgent):
     def reset_win_count(self):
         self.test_win_count = 0
         self.test_game_count = 0
+
+
+# Frozen agents answering with the int8 model of the same checkpoint
+# (see agents/quantization.py), for faster evaluation. The int8 model
+# runs on the CPU only, whatever device online_nn is on
+
+class DeepMCCardQuantizedAgent(DeepMCCardFrozenAgent):
+    def __init__(self):
+        super().__init__()
+        self.policy_forward = load_quantized_policy("mccard")
+        self.inference_device = torch.device('cpu')
+
+class DeepMCStratQuantizedAgent(DeepMCStratFrozenAgent):
+    def __init__(self):
+        super().__init__()
+        self.policy_forward = load_quantized_policy("mcstrat")
+        self.inference_device = torch.device('cpu')
+
+class DeepQCardQuantizedAgent(DeepQCardFrozenAgent):
+    def __init__(self):
+        super().__init__()
+        self.policy_forward = load_quantized_policy("qcard")
+        self.inference_device = torch.device('cpu')
+
+class DeepQStratQuantizedAgent(DeepQStratFrozenAgent):
+    def __init__(self):
+        super().__init__()
+        self.policy_forward = load_quantized_policy("qstrat")
+        self.inference_device = torch.device('cpu')
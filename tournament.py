@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+''' Round-robin tournament between any set of agents.
+
+Usage: ./tournament.py [agent ...] [--games N] [--workers N] [--seed N]
+                       [--against AGENT ...] [--cache PATH | --no-cache] [--output PATH]
+    agent       rulebot, randbot, or a checkpoint as [directory/]prefix[@episode]
+                (directory model_history and the latest episode by default),
+                e.g. qcard, qcard@1000000, rulebot_model_history/mcstrat.
+                @all stands for every checkpoint of the prefix, and * for
+                every prefix: '*@all' is all of model_history.
+                Without agents: the latest of the four agents, the rule bot
+                and the random bot.
+    --against   only play each agent against these, e.g. every checkpoint
+                against the bots: ./tournament.py '*@all' --against rulebot randbot
+
+Every pair of agents plays --games games, half in each seating, in chunks
+of CHUNK_GAMES games spread over a process pool. Each chunk seeds the
+global generators (rlcard deals from them) from --seed, the identities of
+both agents and the chunk, so the results depend neither on the number
+of workers nor on the other agents of the tournament. Checkpoints play
+through the torch-free NumpyPolicy (agents/numpy_runtime.py).
+
+Finished pairings are kept in a ResultCache (result_cache.py, by default
+tournament_cache.sqlite) keyed by checkpoint content hash, opponent, game
+count and seed; pairings found there are not played again.
+
+Prints the win rate of each pairing with its 95% Wilson interval, and
+Bradley-Terry ratings on the Elo scale (400 log10 of the strength,
+averaging 1500) with their standard errors. --output writes the same as
+JSON, or the pairing table as CSV for a .csv path.
+'''
+
+from agents.checkpoint_manifest import CheckpointManifest
+from agents.numpy_runtime import NumpyAgent, NumpyPolicy
+from rlcard import models
+from rlcard.agents.random_agent import RandomAgent
+from result_cache import DEFAULT_CACHE, ResultCache, parameters_sha256
+from typing import Dict, List, Optional, Tuple
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import time
+import numpy as np
+import rlcard
+
+DEFAULT_AGENTS = ["qcard", "qstrat", "mccard", "mcstrat", "rulebot", "randbot"]
+CHECKPOINT_DIR = "model_history"
+# games per task of the pool, even so both seatings get as many
+CHUNK_GAMES = 50
+# z of a two-sided 95% interval
+Z_95 = 1.959964
+
+# ------------------------------------------------------
+# agents
+# ------------------------------------------------------
+
+def expand_specs(specs: List[str])->List[str]:
+    ''' Agent specs with '*' prefixes and '@all' episodes listed out,
+    without repeats '''
+    expanded = []
+    for spec in specs:
+        directory, _, name = spec.rpartition('/')
+        prefix, _, episode = name.partition('@')
+        if spec in ('rulebot', 'randbot') or (prefix != '*' and episode != 'all'):
+            expanded.append(spec)
+            continue
+        manifest = CheckpointManifest.open(directory or CHECKPOINT_DIR)
+        prefixes = sorted(manifest.entries) if prefix == '*' else [prefix]
+        for prefix in prefixes:
+            episodes = sorted(manifest.entries.get(prefix, {})) if episode == 'all' else [episode]
+            expanded += [os.path.join(directory, f"{prefix}@{number}" if number else prefix)
+                         for number in episodes]
+    return list(dict.fromkeys(expanded))
+
+def resolve_agent(spec: str)->Tuple[Dict, Optional[Dict[str, np.ndarray]]]:
+    ''' Description of an agent spec and, for a checkpoint, its parameters '''
+    if spec in ('rulebot', 'randbot'):
+        return {'name': spec, 'kind': spec, 'identity': spec}, None
+    directory, _, name = spec.rpartition('/')
+    prefix, _, episode = name.partition('@')
+    manifest = CheckpointManifest.open(directory or CHECKPOINT_DIR)
+    entry = manifest.get(prefix, int(episode)) if episode else manifest.latest(prefix)
+    if entry is None:
+        raise ValueError(f"no checkpoint {spec} in {manifest.directory}")
+    params = {parameter: tensor.numpy() for parameter, tensor in manifest.load(entry).items()}
+    return {
+        'name': spec,
+        'kind': 'checkpoint',
+        'identity': 'sha256:' + parameters_sha256(params),
+        'file': manifest.path(entry),
+        'episode': entry['episode'],
+        'sha256': entry['sha256'],
+    }, params
+
+def build_agent(kind: str, params: Optional[Dict[str, np.ndarray]]):
+    if kind == 'rulebot':
+        return models.load('uno-rule-v1').agents[0]
+    if kind == 'randbot':
+        return RandomAgent(61)
+    return NumpyAgent(NumpyPolicy(params))
+
+# ------------------------------------------------------
+# games, in the pool's processes
+# ------------------------------------------------------
+
+# the agents of this process, by index, and an env per seating
+_agents: List = []
+_envs: Dict[Tuple[int, int], object] = {}
+
+def _init_worker(kinds: List[str], params: List[Optional[Dict[str, np.ndarray]]]):
+    global _agents
+    _agents = [build_agent(kind, agent_params) for kind, agent_params in zip(kinds, params)]
+    _envs.clear()
+
+def _seating_env(seats: Tuple[int, int]):
+    if seats not in _envs:
+        env = rlcard.make('uno')
+        env.set_agents([_agents[seats[0]], _agents[seats[1]]])
+        _envs[seats] = env
+    return _envs[seats]
+
+def _identity_number(identity: str)->int:
+    return int.from_bytes(hashlib.sha256(identity.encode()).digest()[:8], 'little')
+
+def chunk_seed(seed: int, first: str, second: str, chunk: int)->int:
+    ''' Seed of a chunk of the games of two agent identities '''
+    return int(np.random.SeedSequence(
+            [seed, _identity_number(first), _identity_number(second), chunk]).generate_state(1)[0])
+
+def _play_chunk(task: Tuple[int, int, int, int])->Tuple[int, int, int, int, float]:
+    ''' (first, second, seed, game count) to (first, second, wins of
+    first, wins of second, seconds), first seated first in even games '''
+    first, second, seed, game_count = task
+    random.seed(seed)
+    np.random.seed(seed)
+    start = time.perf_counter()
+    wins = {first: 0, second: 0}
+    for game in range(game_count):
+        seats = (first, second) if game % 2 == 0 else (second, first)
+        env = _seating_env(seats)
+        for agent in env.agents:
+            if hasattr(agent, 'before_game'):
+                agent.before_game()
+        _, payoff = env.run(is_training=False)
+        for seat, index in enumerate(seats):
+            wins[index] += 1 if payoff[seat] == 1 else 0
+    return first, second, wins[first], wins[second], time.perf_counter() - start
+
+# ------------------------------------------------------
+# statistics
+# ------------------------------------------------------
+
+def wilson_interval(wins: int, games: int, z: float = Z_95)->Tuple[float, float]:
+    if games == 0:
+        return 0.0, 1.0
+    rate = wins / games
+    denominator = 1 + z * z / games
+    centre = (rate + z * z / (2 * games)) / denominator
+    half = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / denominator
+    return max(centre - half, 0.0), min(centre + half, 1.0)
+
+def bradley_terry(wins: np.ndarray, prior: float = 0.5,
+                  iterations: int = 10000, tolerance: float = 1e-10)->Tuple[np.ndarray, np.ndarray]:
+    ''' Bradley-Terry ratings of wins[i, j] (wins of i over j) on the Elo
+    scale, and their standard errors.
+
+    Strengths maximize prod (p_i / (p_i + p_j)) ** wins[i, j], found by
+    the minorization-maximization iteration (Hunter 2004). Every pairing
+    that was played counts prior extra wins each way, which keeps an
+    agent that never wins at a finite rating. Errors come from the
+    Fisher information of log strengths, with ratings fixed to their mean.
+    '''
+    played = (wins + wins.T) > 0
+    won = wins + prior * played
+    games = won + won.T
+    strengths = np.ones(len(wins))
+    for _ in range(iterations):
+        updated = won.sum(axis=1) / (games / (strengths[:, None] + strengths[None, :])).sum(axis=1)
+        updated /= np.exp(np.log(updated).mean())
+        converged = np.abs(updated - strengths).max() < tolerance
+        strengths = updated
+        if converged:
+            break
+
+    pair_information = (games * np.outer(strengths, strengths)
+                        / (strengths[:, None] + strengths[None, :]) ** 2)
+    information = np.diag(pair_information.sum(axis=1)) - pair_information
+    # singular along a shift of all ratings, which the mean fixes
+    covariance = np.linalg.pinv(information)
+    scale = 400 / math.log(10)
+    return 1500 + scale * np.log(strengths), scale * np.sqrt(np.clip(np.diag(covariance), 0, None))
+
+# ------------------------------------------------------
+# tournament
+# ------------------------------------------------------
+
+def _pairings(count: int, opponents: Optional[List[int]])->List[Tuple[int, int]]:
+    if opponents is None:
+        return list(itertools.combinations(range(count), 2))
+    pairs = []
+    for agent in range(count):
+        for opponent in opponents:
+            pair = (min(agent, opponent), max(agent, opponent))
+            if agent != opponent and pair not in pairs:
+                pairs.append(pair)
+    return pairs
+
+def run_tournament(specs: List[str], game_count: int, workers: int, seed: int,
+                   against: Optional[List[str]] = None,
+                   cache: Optional[ResultCache] = None)->Dict:
+    ''' against: play only the pairings with these agents (added to specs
+    if missing); cache: results to reuse, and to keep new ones in '''
+    specs = list(dict.fromkeys(specs + (against or [])))
+    resolved = [resolve_agent(spec) for spec in specs]
+    agents = [description for description, _ in resolved]
+    kinds = [description['kind'] for description in agents]
+    params = [agent_params for _, agent_params in resolved]
+    identities = [description['identity'] for description in agents]
+    opponents = None if against is None else [specs.index(spec) for spec in against]
+
+    wins = np.zeros((len(specs), len(specs)), dtype=np.int64)
+    tasks = []
+    # chunks left and seconds spent per pairing still playing
+    remaining: Dict[Tuple[int, int], int] = {}
+    spent: Dict[Tuple[int, int], float] = {}
+    cached_games = 0
+    for pair in _pairings(len(specs), opponents):
+        # played in the order of identities, so the games don't depend on
+        # the order (or the names) agents were given in
+        first, second = sorted(pair, key=lambda index: identities[index])
+        result = None if cache is None else cache.get(identities[first], identities[second], game_count, seed)
+        if result is not None:
+            wins[first, second] += result[0]
+            wins[second, first] += result[1]
+            cached_games += game_count
+            continue
+        for chunk, start in enumerate(range(0, game_count, CHUNK_GAMES)):
+            tasks.append((first, second, chunk_seed(seed, identities[first], identities[second], chunk),
+                          min(CHUNK_GAMES, game_count - start)))
+        remaining[(first, second)] = len(range(0, game_count, CHUNK_GAMES))
+        spent[(first, second)] = 0.0
+
+    def add_chunk(result: Tuple[int, int, int, int, float]):
+        first, second, first_wins, second_wins, seconds = result
+        wins[first, second] += first_wins
+        wins[second, first] += second_wins
+        remaining[(first, second)] -= 1
+        spent[(first, second)] += seconds
+        if cache is not None and remaining[(first, second)] == 0:
+            cache.put(identities[first], identities[second], game_count, seed,
+                      int(wins[first, second]), int(wins[second, first]), spent[(first, second)])
+
+    start = time.perf_counter()
+    if len(tasks) > 0 and workers <= 1:
+        _init_worker(kinds, params)
+        for result in map(_play_chunk, tasks):
+            add_chunk(result)
+    elif len(tasks) > 0:
+        with mp.Pool(workers, initializer=_init_worker, initargs=(kinds, params)) as pool:
+            for result in pool.imap_unordered(_play_chunk, tasks):
+                add_chunk(result)
+    seconds = time.perf_counter() - start
+    played_games = sum(task[3] for task in tasks)
+
+    ratings, errors = bradley_terry(wins)
+    for agent, rating, error in zip(agents, ratings, errors):
+        agent['rating'] = round(float(rating), 1)
+        agent['rating_error'] = round(float(error), 1)
+
+    pairings = []
+    for first, second in _pairings(len(specs), opponents):
+        games = int(wins[first, second] + wins[second, first])
+        low, high = wilson_interval(int(wins[first, second]), games)
+        pairings.append({
+            'first': specs[first],
+            'second': specs[second],
+            'games': games,
+            'first_wins': int(wins[first, second]),
+            'second_wins': int(wins[second, first]),
+            'first_win_rate': wins[first, second] / games if games > 0 else None,
+            'ci_low': low,
+            'ci_high': high,
+        })
+    return {
+        'seed': seed,
+        'games_per_pairing': game_count,
+        'workers': workers,
+        'seconds': seconds,
+        'played_games': played_games,
+        'cached_games': cached_games,
+        'games_per_sec': played_games / max(seconds, 1e-9),
+        'cache': None if cache is None else {'path': cache.path, 'hits': cache.hits, 'misses': cache.misses},
+        'agents': agents,
+        'pairings': pairings,
+    }
+
+def print_results(results: Dict):
+    width = max(len(agent['name']) for agent in results['agents'])
+    print(f"{results['games_per_pairing']} games per pairing, {results['workers']} workers:"
+          f" played {results['played_games']} games in {results['seconds']:.1f} s"
+          f" ({results['games_per_sec']:.0f} games/sec), {results['cached_games']} from the cache")
+    if results['cache'] is not None:
+        cache = results['cache']
+        lookups = cache['hits'] + cache['misses']
+        print(f"cache {cache['path']}: {cache['hits']} hits, {cache['misses']} misses"
+              f" ({cache['hits'] / max(lookups, 1) * 100:.0f}% hit rate)")
+    for pairing in results['pairings']:
+        if pairing['games'] == 0:
+            continue
+        print(f"{pairing['first']:>{width}} vs {pairing['second']:<{width}}:"
+              f" {pairing['first_win_rate'] * 100:5.1f}%"
+              f" [{pairing['ci_low'] * 100:5.1f}, {pairing['ci_high'] * 100:5.1f}]")
+    print("ratings (Bradley-Terry, Elo scale):")
+    for agent in sorted(results['agents'], key=lambda agent: -agent['rating']):
+        print(f"{agent['name']:>{width}}: {agent['rating']:7.1f} +- {agent['rating_error']:.1f}")
+
+def write_results(results: Dict, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=list(results['pairings'][0]))
+            writer.writeheader()
+            writer.writerows(results['pairings'])
+        else:
+            json.dump(results, f, indent=2)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("agents", nargs="*", default=DEFAULT_AGENTS)
+    parser.add_argument("--games", type=int, default=1000, help="games per pairing")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="processes playing the games, 1 to play in this process")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--against", nargs="+", metavar="AGENT",
+                        help="only play each agent against these")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="SQLite file of finished pairings")
+    parser.add_argument("--no-cache", action="store_true", help="play every pairing, keep nothing")
+    parser.add_argument("--output", help="write the results as JSON, or the pairings as CSV for a .csv path")
+    args = parser.parse_args()
+    args.agents = expand_specs(args.agents)
+    if args.against is not None:
+        args.against = expand_specs(args.against)
+    if len(set(args.agents + (args.against or []))) < 2:
+        parser.error("a tournament needs at least two agents")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = None if args.no_cache else ResultCache(args.cache)
+    results = run_tournament(args.agents, args.games, args.workers, args.seed,
+                             against=args.against, cache=cache)
+    if cache is not None:
+        cache.close()
+    print_results(results)
+    if args.output is not None:
+        write_results(results, args.output)
@@ -1,29 +1,88 @@
 #!/usr/bin/env python3
 
-import sys
-import csv
+import argparse
 import env
+from agents import profiler
 from agents.deep_uno_agent import DeepUnoAgent
+from agents.metrics_writer import MetricsWriter
+from agents.opponent_pool import EVICTIONS, SAMPLINGS, OpponentPool
 from agents.deepq_strat import DeepQStratAgent
 from agents.deepq_card import DeepQCardAgent
 from agents.deepmc_card import DeepMCCardAgent
 from agents.deepmc_strat import DeepMCStratAgent
 from typing import List
 
-def note_training_game_results(agent: DeepUnoAgent, filename: str):
-    with open(filename, mode='w') as f:
-        writer = csv.writer(f)
-        writer.writerow(['bucket', 'wins', 'win_rate'])
-        for i, wins in enumerate(agent.win_list):
-            wr = f"{wins / agent.ACCUMULATE_WIN_COUNT * 100:.2f}"
-            writer.writerow([i, wins, wr])
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("epoch_count", type=int)
+    parser.add_argument("--backend", choices=["rlcard", "batched", "vector"], default=None,
+                        help="rlcard (the default without --actors): one game at a time, "
+                             "batched (the default and only choice with --actors): rlcard games "
+                             "side by side with batched inference, vector: vec_env lockstep engine")
+    parser.add_argument("--num-envs", type=int, default=256,
+                        help="games run side by side by the batched and vector backends "
+                             "(split between actors with --actors)")
+    parser.add_argument("--actors", type=int, default=0,
+                        help="actor processes playing for one learner process, 0 to train in-process "
+                             "(actors play as the batched backend)")
+    parser.add_argument("--stacked", action="store_true",
+                        help="train agents with the same state dimension in one batched "
+                             "forward/backward (each keeps its own weights and optimizer)")
+    parser.add_argument("--compiled-inference", action="store_true",
+                        help="select actions through a TorchScript trace of each network")
+    parser.add_argument("--checkpoint-encoding", choices=["fp32", "fp16", "delta"], default=None,
+                        help="append checkpoints to one archive per agent with this encoding "
+                             "instead of one file each (see migrate_checkpoints.py)")
+    parser.add_argument("--snapshot", default="snapshots/train.pt",
+                        help="full training state written here in the background every "
+                             f"{env.SNAPSHOT_RATE} rounds (rlcard backend without actors)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from --snapshot up to epoch_count rounds")
+    parser.add_argument("--pool-size", type=int, default=0,
+                        help="frozen snapshots kept per agent for the self-play phase "
+                             "(agents/opponent_pool.py), 0 for self-play among the agents only")
+    parser.add_argument("--pool-interval", type=int, default=10000,
+                        help="rounds between snapshots into the opponent pool")
+    parser.add_argument("--pool-eviction", choices=EVICTIONS, default="fifo",
+                        help="snapshot a full agent's new one replaces")
+    parser.add_argument("--pool-sampling", choices=SAMPLINGS, default="uniform",
+                        help="weights of the snapshots when sampling opponents")
+    parser.add_argument("--replay-capacity", type=int, default=1 << 18,
+                        help="transitions kept in each DeepQ agent's replay memory")
+    parser.add_argument("--replay-batch-size", type=int, default=256,
+                        help="transitions per replay batch")
+    parser.add_argument("--replay-steps", type=int, default=4,
+                        help="replay batches per training of a DeepQ agent")
+    parser.add_argument("--replay-alpha", type=float, default=0.6,
+                        help="priority exponent of the replay, 0 for uniform sampling")
+    parser.add_argument("--replay-beta", type=float, default=0.4,
+                        help="importance-sampling exponent of the replay")
+    parser.add_argument("--profile", action="store_true",
+                        help="time the phases of the training loop from the start "
+                             "(SIGUSR1 switches it on or off in a running process either way), "
+                             "print a breakdown at the end")
+    args = parser.parse_args()
+    if args.actors > 0 and args.backend not in (None, 'batched'):
+        parser.error(f"actors play as the batched backend, not {args.backend}")
+    if args.backend is None:
+        args.backend = 'batched' if args.actors > 0 else 'rlcard'
+    if args.backend != 'rlcard' or args.actors > 0:
+        if args.resume:
+            parser.error("--resume needs the rlcard backend without actors")
+        args.snapshot = None
+    if args.pool_size > 0 and args.backend == 'vector':
+        parser.error("the vector backend takes no opponent pool")
+    if args.replay_batch_size > args.replay_capacity:
+        parser.error("--replay-batch-size is larger than --replay-capacity")
+    return args
 
 def test_deepq_strat():
-    if len(sys.argv) != 2:
-        print("Usage: ./main.py <epoch_count>")
+    args = parse_args()
 
-    deepq_card      = DeepQCardAgent()
-    deepq_strat     = DeepQStratAgent()
+    replay = dict(replay_capacity=args.replay_capacity, replay_batch_size=args.replay_batch_size,
+                  replay_steps=args.replay_steps, alpha=args.replay_alpha, beta=args.replay_beta)
+    deepq_card      = DeepQCardAgent(**replay)
+    deepq_strat     = DeepQStratAgent(**replay)
     deepmc_card     = DeepMCCardAgent()
     deepmc_strat    = DeepMCStratAgent()
 
@@ -33,11 +92,34 @@ def test_deepq_strat():
     training_agents.append(deepmc_card)
     training_agents.append(deepmc_strat)
 
-    epoch_count = int(sys.argv[1])
-    env.train(training_agents=training_agents, total_games=epoch_count)
+    if args.compiled_inference:
+        for agent in training_agents:
+            agent.use_compiled_inference()
+    for agent in training_agents:
+        agent.CHECKPOINT_ENCODING = args.checkpoint_encoding
+        # statistics are written as the buckets complete
+        agent.metrics = MetricsWriter(f"statistics/win_{agent.FILE_NAME}")
+
+    pool = None
+    if args.pool_size > 0:
+        pool = OpponentPool(training_agents, capacity=args.pool_size, interval=args.pool_interval,
+                            eviction=args.pool_eviction, sampling=args.pool_sampling)
+
+    profiler.install_signal_toggle()
+    if args.profile:
+        profiler.enable()
+
+    epoch_count = args.epoch_count
+    env.train(training_agents=training_agents, total_games=epoch_count,
+              backend=args.backend, num_envs=args.num_envs, num_actors=args.actors,
+              stacked=args.stacked, snapshot=args.snapshot, resume=args.resume,
+              pool=pool)
 
     for agent in training_agents:
-        note_training_game_results(agent=agent, filename=f"statistics/win_{agent.FILE_NAME}")
+        agent.metrics.close()
+    if profiler.ENABLED:
+        print(profiler.breakdown())
+        profiler.disable()
 
     print("Finished training, statistics:")
     print(f"games played = {epoch_count}")
@@ -1,23 +1,24 @@
 #!/usr/bin/env python3
 
-from env import play_game, get_rule_based_agent
+from env import play_game, get_rule_based_agent, SNAPSHOT_RATE
 from rulebot_agents import DeepQStratRulebot, DeepQCardRulebot, DeepMCCardRulebot, DeepMCStratRulebot
 from agents.deep_uno_agent import DeepUnoAgent
-import sys
-import csv
+from agents.metrics_writer import MetricsWriter
+from agents.training_snapshot import SnapshotWriter, load_snapshot, restore_snapshot, training_snapshot
+import argparse
 from typing import List
 
-def note_training_game_results(agent: DeepUnoAgent, filename: str):
-    with open(filename, mode='w') as f:
-        writer = csv.writer(f)
-        writer.writerow(['bucket', 'wins', 'win_rate'])
-        for i, wins in enumerate(agent.win_list):
-            wr = f"{wins / agent.ACCUMULATE_WIN_COUNT * 100:.2f}"
-            writer.writerow([i, wins, wr])
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("epoch_count", type=int)
+    parser.add_argument("--snapshot", default="snapshots/train_rulebot.pt",
+                        help=f"full training state written here in the background every {SNAPSHOT_RATE} epochs")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from --snapshot up to epoch_count epochs")
+    return parser.parse_args()
 
 def test_deepq_strat():
-    if len(sys.argv) != 2:
-        print("Usage: ./main.py <epoch_count>")
+    args = parse_args()
 
     deepq_card      = DeepQCardRulebot()
     deepq_strat     = DeepQStratRulebot()
@@ -30,14 +31,27 @@ def test_deepq_strat():
     training_agents.append(deepq_strat)
     training_agents.append(deepmc_card)
     training_agents.append(deepmc_strat)
-
-    epoch_count = int(sys.argv[1])
-    for _ in range(epoch_count):
+    for agent in training_agents:
+        # statistics are written as the buckets complete
+        agent.metrics = MetricsWriter(f"statistics_rulebot/win_{agent.FILE_NAME}")
+
+    epoch_count = args.epoch_count
+    start_epoch = 0
+    if args.resume:
+        start_epoch = restore_snapshot(load_snapshot(args.snapshot), training_agents)
+        print(f"resumed from {args.snapshot} after {start_epoch} epochs")
+    writer = SnapshotWriter(args.snapshot)
+    for epoch in range(start_epoch, epoch_count):
         for agent in training_agents:
             play_game([agent, rulebot], is_training=True)
+        if (epoch + 1) % SNAPSHOT_RATE == 0:
+            writer.save(training_snapshot(epoch + 1, training_agents))
+    if epoch_count % SNAPSHOT_RATE != 0:
+        writer.save(training_snapshot(epoch_count, training_agents))
+    writer.close()
 
     for agent in training_agents:
-        note_training_game_results(agent=agent, filename=f"statistics_rulebot/win_{agent.FILE_NAME}")
+        agent.metrics.close()
 
     print("Finished training, statistics:")
     print(f"games played = {epoch_count}")
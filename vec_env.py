@@ -0,0 +1,507 @@
+from agents.deep_uno_agent import DeepUnoAgent
+from agents.state_translator import (
+        STRAT_STATE_DIM_COUNT, CARD_STATE_DIM_COUNT,
+        int_to_action, strategic_state_translate, card_state_translate)
+from typing import List, Optional
+import numpy as np
+
+'''
+Array-backed two-player Uno engine that advances N games in lockstep.
+
+Cards are identified by their action id (state_translator.card_to_int):
+    id = color * 15 + trait, trait in [0-9, skip, reverse, draw_2,
+    wild, wild_draw_4], so 60 card ids, and action 60 is "draw".
+
+Rules follow rlcard 0.1.13 uno (games/uno/round.py) for two players:
+- a played wild keeps the color it was dealt with (the color in the
+  action is ignored), a wild drawn from the deck gets a random color
+- drawing a card of the target's color plays it immediately
+- skip, draw_2 and wild_draw_4 give the turn back to the player,
+  reverse is a plain turn change with two players
+- wild_draw_4 is only legal when nothing else is
+- the played pile (including the target) is shuffled back into the
+  deck whenever the deck runs short
+
+Per game state is kept as counts rather than card lists: hands and the
+played pile as counts over the 60 card ids, the deck as an ordered array
+of ids popped from the end. Card order in hand is therefore lost; when a
+wild is played and several colors of it are held, the one removed is
+picked at random, which matches rlcard removing the first copy in a
+randomly dealt hand.
+
+The 8 wild cards are single physical cards, stored under the id of the
+color they were dealt with. rlcard recolors a wild by changing
+card.color but not the cached card.str, so its hand/played string shows
+the new color while state['target'] keeps showing the original one.
+color[g, id] holds the current color, used by the rules and by the hand
+and played pile encodings; the target encoding uses the id itself.
+'''
+
+DRAW_ACTION = 60
+ACTION_COUNT = 61
+CARD_COUNT = 60
+DECK_SIZE = 108
+HAND_SIZE = 7
+
+SKIP, REVERSE, DRAW_2, WILD, WILD_DRAW_4 = 10, 11, 12, 13, 14
+
+CARD_COLOR = np.arange(CARD_COUNT) // 15
+CARD_TRAIT = np.arange(CARD_COUNT) % 15
+IS_WILD_CARD = CARD_TRAIT >= WILD
+WILD_IDS = np.array([color * 15 + WILD for color in range(4)])
+WILD_DRAW_4_IDS = np.array([color * 15 + WILD_DRAW_4 for color in range(4)])
+
+def _full_deck()->np.ndarray:
+    ''' Card ids of the 108 card deck, same composition as rlcard init_deck '''
+    deck = []
+    for color in range(4):
+        for number in range(10):
+            deck.append(color * 15 + number)
+            if number != 0:
+                deck.append(color * 15 + number)
+        for action in (SKIP, REVERSE, DRAW_2):
+            deck.extend([color * 15 + action] * 2)
+        deck.extend([color * 15 + WILD, color * 15 + WILD_DRAW_4])
+    return np.array(deck, dtype=np.int8)
+
+FULL_DECK = _full_deck()
+
+def _encoding_tables(translate, dim: int, hand: slice, target: slice):
+    ''' Per-card rows of an encoding, taken from the translator itself.
+
+    Every section of both encodings is a sum of per-card contributions
+    (hand and played pile) or a function of the target card, so running
+    the reference translator on single-card states gives exact tables.
+
+    Returns:
+        (count_table, target_table), both (60, width) float32
+    '''
+    count_table = np.zeros((CARD_COUNT, hand.stop - hand.start), dtype=np.float32)
+    target_table = np.zeros((CARD_COUNT, target.stop - target.start), dtype=np.float32)
+    for card_id in range(CARD_COUNT):
+        card = int_to_action(card_id)
+        raw_obs = {
+            'hand': [card],
+            'played_cards': [],
+            'target': card,
+            'card_num': [0, 0],
+            'current_player': 0,
+        }
+        encoded = translate({'raw_obs': raw_obs})
+        assert len(encoded) == dim
+        count_table[card_id] = encoded[hand]
+        target_table[card_id] = encoded[target]
+    return count_table, target_table
+
+# strat: hand [0-9], opp [10], discarded [11-20], target [21-40]
+STRAT_COUNT_TABLE, STRAT_TARGET_TABLE = _encoding_tables(
+        strategic_state_translate, STRAT_STATE_DIM_COUNT,
+        hand=slice(0, 10), target=slice(21, 41))
+
+# card: hand [0-59], opp [60], discarded [61-120], target [121-140]
+CARD_COUNT_TABLE, CARD_TARGET_TABLE = _encoding_tables(
+        card_state_translate, CARD_STATE_DIM_COUNT,
+        hand=slice(0, 60), target=slice(121, 141))
+
+
+class VecUnoEnv:
+    num_envs: int
+
+    # (N, 2, 60) card counts per player
+    hands: np.ndarray
+    # (N, 108) card ids, cards are popped from deck[:, deck_len - 1]
+    deck: np.ndarray
+    deck_len: np.ndarray
+    # (N, 60) card counts of rlcard's played_cards
+    played: np.ndarray
+    # (N, 60) current color of each card id, only differs for wild cards
+    color: np.ndarray
+    target: np.ndarray
+    current: np.ndarray
+    done: np.ndarray
+    # -1 while the game is running
+    winner: np.ndarray
+
+    def __init__(self, num_envs: int, seed: Optional[int] = None):
+        self.num_envs = num_envs
+        self.rng = np.random.default_rng(seed)
+
+        self.hands      = np.zeros((num_envs, 2, CARD_COUNT), dtype=np.int16)
+        self.deck       = np.zeros((num_envs, DECK_SIZE), dtype=np.int8)
+        self.deck_len   = np.zeros(num_envs, dtype=np.int16)
+        self.played     = np.zeros((num_envs, CARD_COUNT), dtype=np.int16)
+        self.color      = np.tile(CARD_COLOR.astype(np.int8), (num_envs, 1))
+        self.target     = np.zeros(num_envs, dtype=np.int8)
+        self.current    = np.zeros(num_envs, dtype=np.int8)
+        self.done       = np.zeros(num_envs, dtype=bool)
+        self.winner     = np.full(num_envs, -1, dtype=np.int8)
+
+        self.reset()
+
+    # ------------------------------------------------------
+    # Game flow
+    # ------------------------------------------------------
+
+    def reset(self, games: Optional[np.ndarray] = None):
+        ''' Start new games in the given slots (all slots by default) '''
+        games = self._games(games)
+        count = len(games)
+        if count == 0:
+            return
+
+        order = np.argsort(self.rng.random((count, DECK_SIZE)), axis=1)
+        self.deck[games] = FULL_DECK[order]
+        self.deck_len[games] = DECK_SIZE
+        self.hands[games] = 0
+        self.played[games] = 0
+        self.color[games] = CARD_COLOR
+        self.done[games] = False
+        self.winner[games] = -1
+        self.current[games] = 0
+
+        # deal 7 cards to each player, player 0 first
+        for player in range(2):
+            self._deal(games, np.full(count, player), HAND_SIZE)
+
+        # flip the top card, wild_draw_4 is put back until something else shows
+        top = self._pop(games)
+        for index in np.flatnonzero(CARD_TRAIT[top] == WILD_DRAW_4):
+            game = games[index]
+            card = top[index]
+            while CARD_TRAIT[card] == WILD_DRAW_4:
+                length = self.deck_len[game]
+                self.deck[game, length] = card
+                self.rng.shuffle(self.deck[game, :length + 1])
+                card = self.deck[game, length]
+            top[index] = card
+        self._recolor_wild(games, top)
+        self.target[games] = top
+        self.played[games, top] += 1
+
+        # perform the top card
+        trait = CARD_TRAIT[top]
+        self.current[games[(trait == SKIP) | (trait == REVERSE)]] = 1
+        draw_2 = games[trait == DRAW_2]
+        self._deal(draw_2, np.zeros(len(draw_2), dtype=np.int8), 2)
+
+    def step(self, actions: np.ndarray, games: Optional[np.ndarray] = None):
+        ''' Apply one action per game for the player to move.
+
+        Args:
+            actions: (N,) action ids, only read for the stepped games
+            games: slots to advance, defaults to every unfinished game
+        '''
+        games = self._games(games)
+        games = games[~self.done[games]]
+        actions = np.asarray(actions)[games]
+
+        draw = actions == DRAW_ACTION
+        self._draw_action(games[draw])
+        self._play_action(games[~draw], actions[~draw])
+
+    def payoffs(self)->np.ndarray:
+        ''' (N, 2) payoffs, 1 for the winner, -1 for the loser, 0 if running '''
+        payoffs = np.zeros((self.num_envs, 2), dtype=np.int8)
+        finished = np.flatnonzero(self.winner >= 0)
+        payoffs[finished, self.winner[finished]] = 1
+        payoffs[finished, 1 - self.winner[finished]] = -1
+        return payoffs
+
+    # ------------------------------------------------------
+    # Observations
+    # ------------------------------------------------------
+
+    def legal_mask(self, games: Optional[np.ndarray] = None)->np.ndarray:
+        ''' (len(games), 61) legal actions of the player to move '''
+        games = self._games(games)
+        held = self.hands[games, self.current[games]] > 0
+        target = self.target[games]
+
+        matches = ((CARD_COLOR[None, :] == self.color[games, target][:, None])
+                   | (CARD_TRAIT[None, :] == CARD_TRAIT[target][:, None]))
+        mask = np.zeros((len(games), ACTION_COUNT), dtype=bool)
+        mask[:, :CARD_COUNT] = held & matches & ~IS_WILD_CARD[None, :]
+        mask[:, WILD_IDS] = held[:, WILD_IDS].any(axis=1)[:, None]
+
+        nothing = ~mask.any(axis=1)
+        mask[:, WILD_DRAW_4_IDS] = (nothing & held[:, WILD_DRAW_4_IDS].any(axis=1))[:, None]
+        mask[:, DRAW_ACTION] = ~mask.any(axis=1)
+        return mask
+
+    def strategic_states(self, games: Optional[np.ndarray] = None)->np.ndarray:
+        ''' Same vectors as strategic_state_translate, for the player to move '''
+        return self._encode(
+                self._games(games), STRAT_STATE_DIM_COUNT,
+                STRAT_COUNT_TABLE, STRAT_TARGET_TABLE, opp_index=10)
+
+    def card_states(self, games: Optional[np.ndarray] = None)->np.ndarray:
+        ''' Same vectors as card_state_translate, for the player to move '''
+        return self._encode(
+                self._games(games), CARD_STATE_DIM_COUNT,
+                CARD_COUNT_TABLE, CARD_TARGET_TABLE, opp_index=60)
+
+    # ------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------
+
+    def _games(self, games: Optional[np.ndarray])->np.ndarray:
+        if games is None:
+            return np.arange(self.num_envs)
+        return np.asarray(games, dtype=np.int64)
+
+    def _encode(self, games, dim, count_table, target_table, opp_index)->np.ndarray:
+        width = count_table.shape[1]
+        current = self.current[games]
+        encoded = np.empty((len(games), dim), dtype=np.float32)
+        encoded[:, :width] = self._shown_counts(games, self.hands[games, current]) @ count_table
+        encoded[:, opp_index] = self.hands[games, 1 - current].sum(axis=1)
+        encoded[:, opp_index + 1:opp_index + 1 + width] = (
+                self._shown_counts(games, self.played[games]) @ count_table)
+        encoded[:, opp_index + 1 + width:] = target_table[self.target[games]]
+        return encoded
+
+    def _shown_counts(self, games: np.ndarray, counts: np.ndarray)->np.ndarray:
+        ''' Card counts with each wild moved to the id of its current color '''
+        shown = counts.copy()
+        shown[:, IS_WILD_CARD] = 0
+        rows = np.arange(len(games))
+        for card in np.flatnonzero(IS_WILD_CARD):
+            shown_id = self.color[games, card] * 15 + CARD_TRAIT[card]
+            np.add.at(shown, (rows, shown_id), counts[:, card])
+        return shown
+
+    def _recolor_wild(self, games: np.ndarray, cards: np.ndarray):
+        ''' Give wild cards a random color, as rlcard does on flip/draw '''
+        wild = IS_WILD_CARD[cards]
+        if wild.any():
+            colors = self.rng.integers(0, 4, size=int(wild.sum()))
+            self.color[games[wild], cards[wild]] = colors
+
+    def _replace_deck(self, game: int):
+        ''' Shuffle the played pile back under the remaining deck '''
+        length = self.deck_len[game]
+        pile = np.concatenate([
+            self.deck[game, :length],
+            np.repeat(np.arange(CARD_COUNT, dtype=np.int8), self.played[game]),
+        ])
+        self.rng.shuffle(pile)
+        self.deck[game, :len(pile)] = pile
+        self.deck_len[game] = len(pile)
+        self.played[game] = 0
+
+    def _pop(self, games: np.ndarray)->np.ndarray:
+        ''' Pop the top deck card of each game, deck must not be empty '''
+        self.deck_len[games] -= 1
+        return self.deck[games, self.deck_len[games]]
+
+    def _deal(self, games: np.ndarray, players: np.ndarray, count: int):
+        for game in games[self.deck_len[games] < count]:
+            self._replace_deck(game)
+        for _ in range(count):
+            # only short if nearly every card is held, rlcard would crash there
+            has_card = self.deck_len[games] > 0
+            dealt_games = games[has_card]
+            self.hands[dealt_games, players[has_card], self._pop(dealt_games)] += 1
+
+    def _draw_action(self, games: np.ndarray):
+        if len(games) == 0:
+            return
+        for game in games[self.deck_len[games] == 0]:
+            self._replace_deck(game)
+
+        current = self.current[games]
+        drawn = self._pop(games)
+        trait = CARD_TRAIT[drawn]
+        wild = IS_WILD_CARD[drawn]
+        same_color = ~wild & (CARD_COLOR[drawn] == self.color[games, self.target[games]])
+        number = same_color & (trait <= 9)
+        action = same_color & (trait > 9)
+        kept = ~wild & ~same_color
+
+        # wild or same color number card: played right away, turn passes
+        played = wild | number
+        played_cards = drawn[played]
+        played_games = games[played]
+        self._recolor_wild(played_games, played_cards)
+        self.target[played_games] = played_cards
+        self.played[played_games, played_cards] += 1
+        self.current[played_games] = 1 - current[played]
+
+        # same color action card: played right away with its effect
+        self.played[games[action], drawn[action]] += 1
+        self._perform_card(games[action], current[action], drawn[action])
+
+        # anything else goes to hand
+        self.hands[games[kept], current[kept], drawn[kept]] += 1
+        self.current[games[kept]] = 1 - current[kept]
+
+    def _play_action(self, games: np.ndarray, actions: np.ndarray):
+        if len(games) == 0:
+            return
+        current = self.current[games]
+        cards = actions.astype(np.int64)
+
+        # a wild action removes any held wild of that kind, whatever its color
+        wild = IS_WILD_CARD[cards]
+        if wild.any():
+            trait = CARD_TRAIT[cards[wild]]
+            ids = np.arange(4)[None, :] * 15 + trait[:, None]
+            held = self.hands[games[wild][:, None], current[wild][:, None], ids] > 0
+            color = np.argmax(self.rng.random(held.shape) * held, axis=1)
+            cards[wild] = color * 15 + trait
+
+        self.hands[games, current, cards] -= 1
+        self.played[games, cards] += 1
+
+        emptied = self.hands[games, current].sum(axis=1) == 0
+        self.done[games[emptied]] = True
+        self.winner[games[emptied]] = current[emptied]
+
+        self._perform_card(games, current, cards)
+
+    def _perform_card(self, games: np.ndarray, current: np.ndarray, cards: np.ndarray):
+        ''' Target update and turn order for a card that was just played '''
+        self.target[games] = cards
+        trait = CARD_TRAIT[cards]
+        for penalty_trait, count in ((DRAW_2, 2), (WILD_DRAW_4, 4)):
+            hit = trait == penalty_trait
+            self._deal(games[hit], 1 - current[hit], count)
+        keeps_turn = (trait == SKIP) | (trait == DRAW_2) | (trait == WILD_DRAW_4)
+        self.current[games] = np.where(keeps_turn, current, 1 - current)
+
+
+# ----------------------------------------------------------
+# Vectorized opponents
+# ----------------------------------------------------------
+
+def _random_legal(rng: np.random.Generator, mask: np.ndarray)->np.ndarray:
+    ''' Uniformly random legal action per row '''
+    return np.argmax(rng.random(mask.shape) * mask, axis=1)
+
+class RandomPolicy:
+    ''' Vectorized rlcard RandomAgent '''
+    def __init__(self, rng: np.random.Generator):
+        self.rng = rng
+
+    def act(self, engine: VecUnoEnv, games: np.ndarray, mask: np.ndarray)->np.ndarray:
+        return _random_legal(self.rng, mask)
+
+class RulePolicy:
+    ''' Vectorized rlcard UNORuleAgentV1.
+
+    Draw if that is the only move, play wild_draw_4 in the color held
+    most, otherwise a random legal non-wild card (any legal card if only
+    wilds are playable).
+    '''
+    def __init__(self, rng: np.random.Generator):
+        self.rng = rng
+
+    def act(self, engine: VecUnoEnv, games: np.ndarray, mask: np.ndarray)->np.ndarray:
+        choice = mask.copy()
+        non_wild = choice[:, :CARD_COUNT] & ~IS_WILD_CARD[None, :]
+        has_non_wild = non_wild.any(axis=1)
+        choice[has_non_wild, :CARD_COUNT] = non_wild[has_non_wild]
+        actions = _random_legal(self.rng, choice)
+
+        wild_draw_4 = mask[:, WILD_DRAW_4_IDS].any(axis=1)
+        if wild_draw_4.any():
+            hands = engine.hands[games[wild_draw_4], engine.current[games[wild_draw_4]]]
+            held_non_wild = hands * ~IS_WILD_CARD[None, :]
+            counted = np.where(held_non_wild.sum(axis=1, keepdims=True) > 0, held_non_wild, hands)
+            color_counts = counted.reshape(-1, 4, 15).sum(axis=2)
+            # ties are broken at random (rlcard breaks them by hand order)
+            color_counts = color_counts + self.rng.random(color_counts.shape) * 0.5
+            actions[wild_draw_4] = np.argmax(color_counts, axis=1) * 15 + WILD_DRAW_4
+        return actions
+
+
+# ----------------------------------------------------------
+# Training backend
+# ----------------------------------------------------------
+
+def train_vectorized(total_games: int, training_agents: List[DeepUnoAgent],
+                     bot_phase_games: int, num_envs: int = 256,
+                     report_rate: int = 10000, seed: Optional[int] = None):
+    ''' Vectorized counterpart of env.train.
+
+    Every training agent plays total_games games. Up to bot_phase_games
+    of them its opponent is drawn from the rule bot, the random bot and
+    the other training agents, afterwards from the other training agents
+    only. Games run num_envs at a time; each agent acts on all of its
+    pending decisions with one batched forward, and a finished game's
+    states are handed to the agent through record_episode, so buffers,
+    rewards, training and checkpoints behave as with sequential games.
+    '''
+    from env import ThroughputMeter
+
+    rng = np.random.default_rng(seed)
+    engine = VecUnoEnv(num_envs, seed=seed)
+    bots = [RulePolicy(rng), RandomPolicy(rng)]
+    players = list(training_agents) + bots
+    agent_count = len(training_agents)
+
+    # players[seats[g, s]] sits at seat s of game g, -1 if the slot is idle
+    seats = np.full((num_envs, 2), -1, dtype=np.int64)
+    episodes = [[[], []] for _ in range(num_envs)]
+    started = np.zeros(agent_count, dtype=np.int64)
+
+    def schedule(game: int):
+        agent = int(np.argmin(started))
+        if started[agent] >= total_games:
+            seats[game] = -1
+            return
+        opponents = [i for i in range(agent_count) if i != agent]
+        if started[agent] < bot_phase_games or not opponents:
+            opponents += list(range(agent_count, len(players)))
+        opponent = opponents[rng.integers(len(opponents))]
+        started[agent] += 1
+        if opponent < agent_count:
+            started[opponent] += 1
+        seats[game] = (agent, opponent) if rng.random() < 0.5 else (opponent, agent)
+        episodes[game] = [[], []]
+
+    engine.reset()
+    for game in range(num_envs):
+        schedule(game)
+
+    meter = ThroughputMeter()
+    while True:
+        running = np.flatnonzero((seats[:, 0] >= 0) & ~engine.done)
+        if len(running) == 0:
+            break
+
+        mask = engine.legal_mask(running)
+        to_move = seats[running, engine.current[running]]
+        actions = np.full(num_envs, DRAW_ACTION, dtype=np.int64)
+        for index, player in enumerate(players):
+            rows = np.flatnonzero(to_move == index)
+            if len(rows) == 0:
+                continue
+            games = running[rows]
+            if isinstance(player, DeepUnoAgent):
+                states = player.batch_state_translation(engine, games)
+                for game, state in zip(games, states.astype(np.int64).tolist()):
+                    episodes[game][engine.current[game]].append(state)
+                actions[games] = player.batch_step(states, mask[rows], is_training=True)
+            else:
+                actions[games] = player.act(engine, games, mask[rows])
+        engine.step(actions, running)
+
+        finished = running[engine.done[running]]
+        if len(finished) == 0:
+            continue
+        payoffs = engine.payoffs()
+        for game in finished:
+            for seat in range(2):
+                player = players[seats[game, seat]]
+                if isinstance(player, DeepUnoAgent):
+                    player.record_episode(episodes[game][seat], int(payoffs[game, seat]))
+            before = meter.games // report_rate
+            meter.add(1)
+            if meter.games // report_rate != before:
+                print(meter.report(prefix=f"[vector {meter.games}] "))
+        engine.reset(finished)
+        for game in finished:
+            schedule(game)
+
+    print(meter.report(prefix="[done] "))